@@ -1,14 +1,19 @@
-from engine.spiders.corpus.indexer import Indexer
+import os
+
+from engine.spiders.corpus.vocab import Vocab, json_to_vocab
 from franca.tf.models.word2vec import Word2Vec
 
 if __name__ == "__main__":
     w = Word2Vec()
 
-    indexer = Indexer({}, "./freq.json")
-
-    indexer.deserialize_index_file()
+    # The vocab file maps the counts in rather than parsing them into
+    # a dict, rebuild it whenever freq.json is newer
+    if not os.path.exists("./freq.vocab") or os.path.getmtime(
+        "./freq.vocab"
+    ) < os.path.getmtime("./freq.json"):
+        json_to_vocab("./freq.json", "./freq.vocab")
 
-    w.make_datasets_from_frequency_vector(indexer.local_index)
+    w.make_datasets_from_vocab(Vocab("./freq.vocab"))
 
     # Init our model and train
     w.word2vec()
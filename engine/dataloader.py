@@ -1,8 +1,15 @@
-from bs4 import BeautifulSoup
 from spiders.base import serial_bulk_query, get_robots, read
-from spiders.corpus.indexer import Indexer
+from spiders.corpus.indexer import Indexer, DEFAULT_INDEX_FILE
+from spiders.extract import extract_links
+from spiders.frontier import Frontier
+from typing import Callable, List, Tuple
+import argparse
+import concurrent.futures
+import logging
+import os
 import re
-import sys
+
+logger = logging.getLogger(__name__)
 
 regex = re.compile(
     r"^(?:http|ftp)s?://"  # http:// or https://
@@ -15,85 +22,252 @@ regex = re.compile(
 )
 
 
-def load_data():
-    # Website base host
-    base_url = sys.argv[1] if len(sys.argv) > 1 else input("base url: ")
+def load_data(
+    base_url: str,
+    path_to_follow: str,
+    link_host: str,
+    category: str,
+    pagination: bool = True,
+    depth: int = 1,
+    workers: int = 8,
+    index_file: str = DEFAULT_INDEX_FILE,
+):
+    """
+    Discovers the article links reachable from a listing page and
+    indexes them under a category, appending each listing page's new
+    links to the index as they come in. Links the category already
+    holds are not indexed again
 
+    Parameters
+    ----------
+    base_url : str
+        The website base host
+    path_to_follow : str
+        The corpus path articles live under
+    link_host : str
+        The listing page where all the links are to be found
+    category : str
+        The index category to file the links under
+    pagination : bool
+        Whether to read the listing pages link_host links to
+    depth : int
+        How many pagination links away from link_host to follow
+    workers : int
+        The most listing pages fetched and parsed at once
+    index_file : str
+        The index to add the links to
+    """
     if not base_url.endswith("/"):
         base_url = base_url + "/"
 
-    # Corpus path to follow
-    path_to_follow = sys.argv[2] if len(sys.argv) > 2 else input("follow?: ")
-
     if path_to_follow.startswith("/"):
         path_to_follow = path_to_follow[1:]
 
-    # Where all the links are to be found
-    link_host = sys.argv[3] if len(sys.argv) > 3 else input("host?: ")
+    # Fire up the indexer
+    indexer = Indexer(index_file=index_file)
+    print(f"Using category: {category}")
 
-    pagination = input("read all pages?: ")
+    # Seed the frontier with what earlier runs indexed
+    articles = Frontier()
 
-    if pagination != "n" or pagination != "N":
-        pagination = True
-    else:
-        pagination = False
+    if indexer.log is not None and indexer.log.has(category):
+        for batch in indexer.log.iter_links(category):
+            articles.mark_seen(batch)
+    elif indexer.log is None and os.path.exists(index_file):
+        indexer.deserialize_index_file()
+        articles.mark_seen(indexer.local_index.get(category, []))
 
-    to_parse = {link_host}
+    def _save(links: List[str]):
+        # A crash part way loses at most the listing page in flight
+        indexer.index(links, category)
+        indexer.serialize_index_file(preserve_local_copy=indexer.log is None)
 
-    # If pagination on, hit all the links and scrape the urls down
-    if pagination:
-        page_data = read(link_host)
+    try:
+        flat_links = discover_links(
+            link_host,
+            base_url,
+            path_to_follow,
+            depth=depth if pagination else 0,
+            workers=workers,
+            on_links=_save,
+            articles=articles,
+        )
+    finally:
+        indexer.close()
 
-        html = BeautifulSoup(page_data, features="html.parser")
+    print(f"Found {len(flat_links)} new articles")
 
-        attrs = html.find_all("a")
 
-        pagination_addrs = {
-            link.get("href")
-            for link in attrs
-            if link.get("href") and link.get("href").startswith(link_host)
-        }
+def discover_links(
+    link_host: str,
+    base_url: str,
+    path_to_follow: str,
+    depth: int = 1,
+    workers: int = 8,
+    on_links: Callable[[List[str]], None] = None,
+    articles: Frontier = None,
+) -> List[str]:
+    """
+    Reads listing pages concurrently, starting at link_host and
+    following its pagination links down to depth, and collects the
+    article links they point to
 
-        to_parse = to_parse.union(pagination_addrs)
+    Pages are fetched and parsed on worker threads while the frontiers
+    stay on the calling thread, so each listing and article is only
+    handled once however many pages link to it
 
-    links = []
-    for url in to_parse:
-        print(f"Parsing url: {url}")
-        links.append(get_articles(url, base_url, path_to_follow))
+    Parameters
+    ----------
+    link_host : str
+        The first listing page
+    base_url : str
+        The website base host, ending in a slash
+    path_to_follow : str
+        The corpus path articles live under
+    depth : int
+        How many pagination links away from link_host to follow, 0
+        reads link_host alone
+    workers : int
+        The most listing pages fetched and parsed at once
+    on_links : Callable[[List[str]], None], optional
+        Called with the new article links of each listing page
+    articles : Frontier, optional
+        The article frontier, seeded with links which are known
+        already, a new one if not given
 
-    flat_links = list({y for x in links for y in x})
+    Returns
+    -------
+    List[str]
+        The canonical article links in discovery order
+    """
+    listings = Frontier(max_depth=depth)
+    articles = articles if articles is not None else Frontier()
+    listings.add(link_host)
 
-    # Fire up the indexer
-    indexer = Indexer()
+    found = []
 
-    category = input("What is the index category?: ")
-    print(f"Using category: {category}")
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=workers
+    ) as executor:
+        pending = {}
+
+        while listings or pending:
+            while listings and len(pending) < workers:
+                url, level = listings.pop()
+                print(f"Parsing url: {url}")
+                future = executor.submit(
+                    read_listing, url, base_url, path_to_follow, link_host
+                )
+                pending[future] = (url, level)
+
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+
+            for future in done:
+                url, level = pending.pop(future)
 
-    # Load the links
-    indexer.index_from_list(flat_links, category)
+                try:
+                    article_links, listing_links = future.result()
+                except Exception as e:
+                    logger.info(f"{url} made an exception: {e}")
+                    continue
 
-    # Write to disk
-    indexer.serialize_index_file(preserve_local_copy=False)
-    print("Save complete")
+                new_links = articles.add_all(article_links)
+                found.extend(new_links)
 
+                if new_links and on_links is not None:
+                    on_links(new_links)
 
-def get_articles(url, base_url, path_to_follow):
-    # Read all links to new pages
-    html = BeautifulSoup(read(url), features="html.parser")
+                listings.add_all(listing_links, depth=level + 1)
 
-    # Find all corpus material
-    link_addrs = html.find_all("a")
+    logger.info(
+        f"Read {listings.seen_count} listing pages, dropped "
+        f"{listings.duplicates + articles.duplicates} duplicate links"
+    )
 
-    # Now, filter by the follow path
-    article_links = {
-        link.get("href")
-        for link in link_addrs
-        if link.get("href")
-        and link.get("href").startswith(f"{base_url}{path_to_follow}")
-    }
+    return found
 
-    return article_links
+
+def read_listing(
+    url: str, base_url: str, path_to_follow: str, link_host: str
+) -> Tuple[List[str], List[str]]:
+    """
+    Reads a listing page and splits its links into article links,
+    which live under the follow path, and pagination links, which
+    live under link_host
+
+    Returns
+    -------
+    Tuple[List[str], List[str]]
+        The article links and the pagination links
+    """
+    # Relative links are resolved against the listing page
+    hrefs = extract_links(
+        read(url), url, prefixes=(f"{base_url}{path_to_follow}", link_host)
+    )
+
+    article_links = [
+        href
+        for href in hrefs
+        if href.startswith(f"{base_url}{path_to_follow}")
+    ]
+    listing_links = [href for href in hrefs if href.startswith(link_host)]
+
+    return article_links, listing_links
+
+
+def get_articles(url, base_url, path_to_follow, frontier=None):
+    frontier = frontier if frontier is not None else Frontier()
+
+    # Keep the canonical form of links the frontier has not seen yet
+    article_links, _ = read_listing(url, base_url, path_to_follow, url)
+
+    return frontier.add_all(article_links)
 
 
 if __name__ == "__main__":
-    load_data()
+    parser = argparse.ArgumentParser(
+        description="Indexes the article links found on a site's listing pages"
+    )
+    parser.add_argument("base_url", help="The website base host")
+    parser.add_argument("path_to_follow", help="The corpus path to follow")
+    parser.add_argument(
+        "link_host", help="Where all the links are to be found"
+    )
+    parser.add_argument("category", help="The index category")
+    parser.add_argument(
+        "--no-pagination",
+        dest="pagination",
+        action="store_false",
+        help="Only read link_host, not the pages it links to",
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=1,
+        help="How many pagination links away from link_host to follow",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="The most listing pages fetched and parsed at once",
+    )
+    parser.add_argument(
+        "--index",
+        default=DEFAULT_INDEX_FILE,
+        help="The index file to add the links to",
+    )
+    args = parser.parse_args()
+
+    load_data(
+        args.base_url,
+        args.path_to_follow,
+        args.link_host,
+        args.category,
+        args.pagination,
+        args.depth,
+        args.workers,
+        args.index,
+    )
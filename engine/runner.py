@@ -1,5 +1,5 @@
+import argparse
 import os
-import sys
 
 from spiders.base import (
     get_robots,
@@ -7,48 +7,325 @@ from spiders.base import (
     concurrent_bulk_query,
     concurrent_batch_process_page_data,
 )
-from spiders.corpus.indexer import Indexer
+from spiders.cache import ResponseCache, DEFAULT_CACHE_FILE
+from spiders.extract import concurrent_batch_extract_page_data
+from spiders.metrics import FetchMetrics
+from spiders.retry import FetchPolicy
+from spiders.corpus.counts import CountStore, count_pages, counts_path
+from spiders.corpus.indexer import Indexer, DEFAULT_INDEX_FILE
+from spiders.corpus.shards import parse_shard
+from spiders.corpus.state import (
+    CrawlState,
+    DEFAULT_REVISIT,
+    DEFAULT_STATE_FILE,
+)
+from spiders.corpus.stems import StemCache, DEFAULT_STEM_CACHE_FILE
+from spiders.corpus.store import PageStore, DEFAULT_STORE_DIR
 from spiders.corpus.fetcher import (
     serial_parse_reader_view,
-    unwrap_context_and_extract,
+    iter_unwrap_context_and_extract,
     raw_corpus_to_frequency_vector,
     mass_indexer_query_by_category,
+    iter_indexer_query_by_category,
+    iter_changed_by_category,
+    iter_category_links,
+    incremental_frequency_vector,
+    stream_frequency_vector,
 )
 
 
-def run_reader(category: str):
-    # Load our indexer
-    indexer = Indexer()
+def run_reader(
+    category: str,
+    cache: ResponseCache = None,
+    store: PageStore = None,
+    stream: bool = False,
+    metrics: FetchMetrics = None,
+    state: CrawlState = None,
+    revisit: float = DEFAULT_REVISIT,
+    index_file: str = DEFAULT_INDEX_FILE,
+    shard: tuple = None,
+    output: str = None,
+    stems: StemCache = None,
+    lowercase: bool = False,
+    counts: CountStore = None,
+):
+    # Load our indexer, a split off shard file works like the whole index
+    indexer = Indexer(index_file=index_file)
 
     # Deserialize base file into itself
     indexer.deserialize_index_file()
 
-    # Now, run the query system
-    linkdata = mass_indexer_query_by_category(indexer, category)
+    # Failed pages are skipped and remembered instead of ending the run
+    policy = FetchPolicy()
 
-    parsed = concurrent_batch_process_page_data(linkdata)
+    # Pages recounted this run, everything unless we run incrementally
+    changed = None
 
-    reader = serial_parse_reader_view(parsed)
+    if state is not None:
+        # Only new and stale urls are fetched, and only pages whose
+        # content changed are recounted into the stored totals
+        pages = iter_changed_by_category(
+            indexer,
+            category,
+            state,
+            revisit,
+            store=store,
+            policy=policy,
+            metrics=metrics,
+            shard=shard,
+        )
 
-    context = unwrap_context_and_extract(reader, "words")
+        frequency_vector, changed = incremental_frequency_vector(
+            pages, category, state, lowercase, stems
+        )
 
-    frequency_vector = raw_corpus_to_frequency_vector(context)
+        print(
+            f"Incremental: {changed} pages changed, {state.fetched} "
+            f"downloaded, {state.not_modified} not modified, "
+            f"{state.removed} removed"
+        )
 
-    frequency_vector_output_path = (
-        f"{os.path.dirname(os.path.realpath(__file__))}/freq.json"
-    )
+        # Removed pages move the totals as much as changed ones
+        changed += state.removed
+    elif stream:
+        # Pages flow through every stage while the next ones download
+        pages = iter_indexer_query_by_category(
+            indexer,
+            category,
+            cache=cache,
+            store=store,
+            policy=policy,
+            metrics=metrics,
+            shard=shard,
+        )
+
+        frequency_vector, pipeline = stream_frequency_vector(
+            pages, lowercase=lowercase, stems=stems
+        )
+
+        print(pipeline.format_report())
+    elif counts is not None:
+        # Pages land in the store, only bodies never seen before are
+        # counted, and the totals move by the pages added or removed
+        mass_indexer_query_by_category(
+            indexer,
+            category,
+            cache=cache,
+            store=store,
+            policy=policy,
+            metrics=metrics,
+            shard=shard,
+        )
+
+        pages = {
+            url: store.digest(url)
+            for url in iter_category_links(indexer, category, shard=shard)
+            if url in store
+        }
+
+        counted = count_pages(store, counts, pages, lowercase)
+        added, removed = counts.update(category, pages)
+        frequency_vector = counts.totals(category)
+        changed = added + removed
+
+        print(
+            f"Counts: {counted} pages counted, {added} added or changed, "
+            f"{removed} removed"
+        )
+    else:
+        # Now, run the query system
+        linkdata = mass_indexer_query_by_category(
+            indexer,
+            category,
+            cache=cache,
+            store=store,
+            policy=policy,
+            metrics=metrics,
+            shard=shard,
+        )
+
+        # Parse across processes, keeping only the reader view text
+        extracted = concurrent_batch_extract_page_data(
+            linkdata, "fast_reader_view"
+        )
+
+        reader = {
+            url: view for url, view in extracted.items() if view is not None
+        }
+
+        # Tokenize across processes too, counting tokens as they come
+        context = iter_unwrap_context_and_extract(reader, "words")
+
+        frequency_vector = raw_corpus_to_frequency_vector(
+            context, lowercase, stems
+        )
+
+    # Every page has been read, so the index log is done with
+    indexer.close()
+
+    frequency_vector_output_path = output
+
+    if frequency_vector_output_path is None:
+        # Shards write their own vectors, merged afterwards
+        name = "freq.json"
+
+        if shard is not None:
+            name = f"freq.shard-{shard[0]}-of-{shard[1]}.json"
+
+        frequency_vector_output_path = (
+            f"{os.path.dirname(os.path.realpath(__file__))}/{name}"
+        )
+
+    if changed == 0 and os.path.exists(frequency_vector_output_path):
+        print("Frequency vector unchanged")
+    else:
+        data_indexer = Indexer(frequency_vector, frequency_vector_output_path)
+
+        data_indexer.serialize_index_file(preserve_local_copy=False)
+
+        print("Frequency vector written")
+
+    if cache is not None:
+        print(f"Response cache: {cache.stats()}")
+
+    if stems is not None:
+        print(f"Stem cache: {len(stems)} types, {stems.stemmed} stemmed")
 
-    data_indexer = Indexer(frequency_vector, frequency_vector_output_path)
+    report = policy.report()
+    print(
+        f"Fetch failures: {len(report['failed'])}, "
+        f"retries: {report['retries']}, "
+        f"open circuits: {report['open_hosts']}"
+    )
 
-    data_indexer.serialize_index_file(preserve_local_copy=False)
+    for url, reason in report["failed"].items():
+        print(f"  {url}: {reason}")
 
-    print("Frequency vector written")
+    if metrics is not None:
+        totals = metrics.snapshot()["totals"]
+        print(f"Fetch metrics: {totals}")
 
 
 if __name__ == "__main__":
-    category = sys.argv[1] if len(sys.argv) > 1 else None
+    parser = argparse.ArgumentParser(
+        description="Builds the frequency vector of an indexer category"
+    )
+    parser.add_argument("category", help="The indexer category to read")
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const=DEFAULT_CACHE_FILE,
+        default=None,
+        help="Reuse pages from a response cache file across runs",
+    )
+    parser.add_argument(
+        "--store",
+        nargs="?",
+        const=DEFAULT_STORE_DIR,
+        default=None,
+        help="Stream fetched pages into a page store folder",
+    )
+    parser.add_argument(
+        "--metrics",
+        default=None,
+        help="Write per-host fetch metrics here, as Prometheus text for "
+        ".prom files and as JSON otherwise",
+    )
+    parser.add_argument(
+        "--incremental",
+        nargs="?",
+        const=DEFAULT_STATE_FILE,
+        default=None,
+        help="Only fetch new and stale urls and only recount changed pages, "
+        "keeping the crawl state in this file",
+    )
+    parser.add_argument(
+        "--revisit",
+        type=float,
+        default=DEFAULT_REVISIT / 3600,
+        help="Hours before an incremental run fetches a url again",
+    )
+    parser.add_argument(
+        "--index",
+        default=DEFAULT_INDEX_FILE,
+        help="The index file to read the category from, such as a shard "
+        "written by spiders.corpus.shards split",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        help="Only crawl shard I of N of the category, written I/N, "
+        "splitting its hosts the same way on every machine",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Write the frequency vector here instead of freq.json",
+    )
+    parser.add_argument(
+        "--stems",
+        nargs="?",
+        const=DEFAULT_STEM_CACHE_FILE,
+        default=None,
+        help="Keep the stem of every word seen in this file across runs",
+    )
+    parser.add_argument(
+        "--lowercase",
+        action="store_true",
+        help="Lower case tokens before counting and stemming them",
+    )
+    parser.add_argument(
+        "--counts",
+        action="store_true",
+        help="Keep per-page counts next to the page store and only count "
+        "pages not counted before, needs --store",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Pipeline fetch, parse and count with bounded memory",
+    )
+    args = parser.parse_args()
+
+    if args.incremental and args.cache:
+        parser.error(
+            "--incremental revalidates through its state, drop --cache"
+        )
+
+    if args.counts and (not args.store or args.stream):
+        parser.error("--counts needs --store, without --stream")
 
-    if not category:
-        raise ValueError("Gimme an indexer category!")
+    cache = ResponseCache(args.cache) if args.cache else None
+    store = PageStore(args.store) if args.store else None
+
+    metrics = FetchMetrics() if args.metrics else None
+    stems = StemCache(args.stems) if args.stems else None
+    counts = CountStore(counts_path(store)) if args.counts else None
+
+    # The state answers 304s from the page store, when there is one,
+    # and counts pages into the store's counts with --counts
+    state = (
+        CrawlState(args.incremental, store, counts)
+        if args.incremental
+        else None
+    )
+
+    run_reader(
+        args.category,
+        cache,
+        store,
+        args.stream,
+        metrics,
+        state,
+        args.revisit * 3600,
+        args.index,
+        args.shard,
+        args.output,
+        stems,
+        args.lowercase,
+        counts,
+    )
 
-    run_reader(category)
+    if metrics is not None:
+        metrics.write(args.metrics)
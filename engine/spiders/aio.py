@@ -0,0 +1,754 @@
+"""
+Aio contains an asyncio fetch engine which keeps thousands of
+requests in flight over per-host pools of keep-alive connections
+"""
+
+import asyncio
+import logging
+import socket
+import ssl
+import urllib.error
+import urllib.parse
+from collections import defaultdict
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from .cache import ResponseCache
+from .limits import AdaptiveLimiter
+from .metrics import FetchMetrics, RequestTiming
+from .retry import FetchPolicy
+from .robots import robots_cache
+from .transfer import (
+    ACCEPT_ENCODING,
+    CHUNK_SIZE,
+    DEFAULT_MAX_BODY,
+    HTML_CONTENT_TYPES,
+    BodyReader,
+    check_content_type,
+)
+from .utils import host_key
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "HearthBot"
+DEFAULT_PORTS = {"http": 80, "https": 443}
+REDIRECT_CODES = {301, 302, 303, 307, 308}
+
+
+class HTTPResponse:
+    """
+    A fully read HTTP response
+
+    Parameters
+    ----------
+    url : str
+        The url that produced this response, after redirects
+    status : int
+        The HTTP status code
+    reason : str
+        The HTTP reason phrase
+    headers : Dict[str, str]
+        The response headers, keyed by lower case name
+    body : bytes
+        The response body, decompressed
+    """
+
+    def __init__(
+        self,
+        url: str,
+        status: int,
+        reason: str,
+        headers: Dict[str, str],
+        body: bytes,
+    ):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def __repr__(self):
+        return f"<HTTPResponse(url={self.url}, status={self.status})>"
+
+
+class Connection:
+    """
+    A single keep-alive connection to a host
+
+    Parameters
+    ----------
+    key : Tuple[str, str, int]
+        The (scheme, host, port) this connection is bound to
+    reader : asyncio.StreamReader
+        The stream reader of the socket
+    writer : asyncio.StreamWriter
+        The stream writer of the socket
+    """
+
+    def __init__(
+        self,
+        key: Tuple[str, str, int],
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class ConnectionPool:
+    """
+    Keeps idle keep-alive connections around per host so
+    consecutive requests to one host skip the TCP and TLS
+    handshakes
+
+    Parameters
+    ----------
+    max_idle_per_host : int
+        The most idle connections kept for a single host
+    max_idle : int
+        The most idle connections kept across all hosts
+    ssl_context : ssl.SSLContext, optional
+        The context used for https connections
+    """
+
+    def __init__(
+        self,
+        max_idle_per_host: int = 8,
+        max_idle: int = 1024,
+        ssl_context: ssl.SSLContext = None,
+    ):
+        self.max_idle_per_host = max_idle_per_host
+        self.max_idle = max_idle
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.opened = 0
+
+        self._idle = defaultdict(list)
+        self._idle_count = 0
+
+    async def acquire(
+        self, key: Tuple[str, str, int], timing: RequestTiming = None
+    ) -> Connection:
+        idle = self._idle[key]
+
+        while idle:
+            conn = idle.pop()
+            self._idle_count -= 1
+
+            # The server may have hung up while this sat in the pool
+            if conn.reader.at_eof() or conn.writer.is_closing():
+                conn.close()
+                continue
+
+            conn.reused = True
+
+            if timing is not None:
+                timing.reused = True
+
+            return conn
+
+        scheme, host, port = key
+
+        if timing is None:
+            reader, writer = await asyncio.open_connection(
+                host,
+                port,
+                ssl=self.ssl_context if scheme == "https" else None,
+            )
+        else:
+            reader, writer = await self._timed_connect(key, timing)
+
+        self.opened += 1
+
+        return Connection(key, reader, writer)
+
+    async def _timed_connect(
+        self, key: Tuple[str, str, int], timing: RequestTiming
+    ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        # Resolve separately from connecting so each gets its own time
+        scheme, host, port = key
+        loop = asyncio.get_running_loop()
+
+        start = timing.elapsed()
+        addresses = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        timing.dns = timing.elapsed() - start
+
+        start = timing.elapsed()
+        error = None
+
+        for *_, address in addresses:
+            try:
+                connection = await asyncio.open_connection(
+                    address[0],
+                    address[1],
+                    ssl=self.ssl_context if scheme == "https" else None,
+                    server_hostname=host if scheme == "https" else None,
+                )
+            except OSError as e:
+                error = e
+                continue
+
+            timing.connect = timing.elapsed() - start
+            return connection
+
+        raise error
+
+    def release(self, conn: Connection, reusable: bool) -> None:
+        idle = self._idle[conn.key]
+
+        if (
+            not reusable
+            or len(idle) >= self.max_idle_per_host
+            or self._idle_count >= self.max_idle
+        ):
+            conn.close()
+            return
+
+        idle.append(conn)
+        self._idle_count += 1
+
+    def close(self) -> None:
+        for idle in self._idle.values():
+            for conn in idle:
+                conn.close()
+
+        self._idle.clear()
+        self._idle_count = 0
+
+
+def split_url(url: str) -> Tuple[Tuple[str, str, int], str]:
+    """
+    Splits a url into its pool key and request target
+
+    Parameters
+    ----------
+    url : str
+        The absolute http or https url
+
+    Returns
+    -------
+    Tuple[Tuple[str, str, int], str]
+        The (scheme, host, port) key and the path with its query
+    """
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme.lower()
+
+    if scheme not in DEFAULT_PORTS:
+        raise ValueError(f"unsupported url scheme '{parts.scheme}' in {url}")
+
+    if not parts.hostname:
+        raise ValueError(f"url has no host: {url}")
+
+    port = parts.port or DEFAULT_PORTS[scheme]
+    target = parts.path or "/"
+
+    if parts.query:
+        target = f"{target}?{parts.query}"
+
+    return (scheme, parts.hostname.lower(), port), target
+
+
+class AsyncFetcher:
+    """
+    The async fetcher bulk queries urls with a global cap on
+    requests in flight and a separate cap per host, reusing
+    pooled connections between requests to the same host
+
+    Parameters
+    ----------
+    max_in_flight : int
+        The most requests in flight across all hosts
+    max_per_host : int
+        The most requests in flight against a single host
+    timeout : int
+        Seconds allowed for a single request/response exchange
+    user_agent : str
+        The User-Agent header sent with each request
+    max_redirects : int
+        How many redirects to follow before giving up
+    cache : ResponseCache, optional
+        Revalidate and store bodies through this response cache
+    limiter : AdaptiveLimiter, optional
+        Adapt the in flight limits to how hosts respond instead of
+        holding them at max_in_flight and max_per_host
+    policy : FetchPolicy, optional
+        Retry transient failures and fail fast on dead hosts in
+        fetch_all
+    metrics : FetchMetrics, optional
+        Time every request hop into these metrics
+    max_body : int, optional
+        The most decompressed bytes read from a body before the
+        request is dropped, None to read any size
+    content_types : FrozenSet[str], optional
+        The media types of successful responses whose bodies are
+        read, None to read any. Others are dropped after the headers
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 1024,
+        max_per_host: int = 8,
+        timeout: int = 30,
+        user_agent: str = USER_AGENT,
+        max_redirects: int = 5,
+        cache: ResponseCache = None,
+        limiter: AdaptiveLimiter = None,
+        policy: FetchPolicy = None,
+        metrics: FetchMetrics = None,
+        max_body: Optional[int] = DEFAULT_MAX_BODY,
+        content_types: Optional[FrozenSet[str]] = HTML_CONTENT_TYPES,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.max_redirects = max_redirects
+        self.cache = cache
+        self.limiter = limiter
+        self.policy = policy
+        self.metrics = metrics
+        self.max_body = max_body
+        self.content_types = content_types
+
+        self.pool = ConnectionPool(
+            max_idle_per_host=max_per_host, max_idle=max_in_flight
+        )
+
+        # Semaphores are bound to the running loop, so they are
+        # only made once we are inside of it
+        self._global_limit = None
+        self._host_limits = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self.pool.close()
+
+    def _limits(
+        self, key: Tuple[str, str, int]
+    ) -> Tuple[asyncio.Semaphore, asyncio.Semaphore]:
+        if self._global_limit is None:
+            self._global_limit = asyncio.Semaphore(self.max_in_flight)
+
+        if key not in self._host_limits:
+            self._host_limits[key] = asyncio.Semaphore(self.max_per_host)
+
+        return self._host_limits[key], self._global_limit
+
+    async def request(
+        self, url: str, headers: Dict[str, str] = None, method: str = "GET"
+    ) -> HTTPResponse:
+        """
+        Sends a request and follows redirects, holding a host slot
+        and a global slot only while each hop is on the wire
+
+        Parameters
+        ----------
+        url : str
+            The url to request
+        headers : Dict[str, str], optional
+            Extra request headers
+        method : str, optional
+            The HTTP method, default: 'GET'
+
+        Returns
+        -------
+        HTTPResponse
+            The final response after redirects
+        """
+        for _ in range(self.max_redirects + 1):
+            key, target = split_url(url)
+            hop = (key, target, url, headers, method)
+
+            if self.limiter is not None:
+                async with self.limiter.slot(host_key(url)) as slot:
+                    response = await self._send(*hop)
+                    slot.response(response.status, response.headers)
+            else:
+                host_limit, global_limit = self._limits(key)
+
+                # Take the host slot first so urls queued behind a busy
+                # host never sit on global slots other hosts could use
+                async with host_limit:
+                    async with global_limit:
+                        response = await self._send(*hop)
+
+            location = response.headers.get("location")
+
+            if response.status not in REDIRECT_CODES or not location:
+                return response
+
+            url = urllib.parse.urljoin(url, location)
+
+            if response.status == 303:
+                method = "GET"
+
+        raise urllib.error.URLError(f"too many redirects for {url}")
+
+    async def fetch(self, url: str) -> bytes:
+        """
+        Reads the body of a url, raising like urllib does on
+        error statuses
+
+        Parameters
+        ----------
+        url : str
+            The url to read
+
+        Returns
+        -------
+        bytes
+            The response body
+        """
+        entry = self.cache.lookup(url) if self.cache else None
+
+        if entry is not None and entry.fresh(self.cache.max_age):
+            return self.cache.hit(entry)
+
+        response = await self.request(
+            url, headers=entry.validators() if entry else None
+        )
+
+        if response.status == 304 and entry is not None:
+            return self.cache.hit(entry, revalidated=True)
+
+        if response.status >= 400:
+            raise urllib.error.HTTPError(
+                url, response.status, response.reason, response.headers, None
+            )
+
+        if self.cache is not None:
+            self.cache.store(url, response.body, response.headers)
+
+        return response.body
+
+    async def fetch_all(self, url_list: List[str]) -> Dict[str, bytes]:
+        """
+        Reads every url concurrently, mapping failed urls to None
+
+        Parameters
+        ----------
+        url_list : List[str]
+            The urls to read
+
+        Returns
+        -------
+        Dict[str, bytes]
+            The url-indexed page bodies
+        """
+        loaded = {}
+
+        async def _read_into(url: str):
+            loaded[url] = await self.fetch_or_none(url)
+
+        await asyncio.gather(
+            *(_read_into(url) for url in dict.fromkeys(url_list))
+        )
+
+        return loaded
+
+    async def fetch_or_none(
+        self, url: str, backoff: Callable[[str, float], float] = None
+    ) -> Optional[bytes]:
+        """
+        Reads the body of a url under the fetch policy, if there is
+        one, giving None when the url cannot be read. backoff is
+        passed on to policy.acall
+        """
+        try:
+            if self.policy is not None:
+                return await self.policy.acall(url, self.fetch, backoff)
+
+            return await self.fetch(url)
+        except Exception as e:
+            logger.info(f"{url} made an exception: {e}")
+            return None
+
+    async def _send(
+        self,
+        key: Tuple[str, str, int],
+        target: str,
+        url: str,
+        headers: Optional[Dict[str, str]],
+        method: str,
+    ) -> HTTPResponse:
+        # One hop on the wire, timed when there are metrics to time it
+        # into
+        if self.metrics is None:
+            return await asyncio.wait_for(
+                self._exchange(key, target, url, headers, method),
+                self.timeout,
+            )
+
+        retries = self.policy.retry_counts[url] if self.policy else 0
+        timing = self.metrics.start(url, host_key(url), retries)
+
+        try:
+            response = await asyncio.wait_for(
+                self._exchange(key, target, url, headers, method, timing),
+                self.timeout,
+            )
+        except BaseException as e:
+            self.metrics.record(timing.finish(e))
+            raise
+
+        timing.status = response.status
+        self.metrics.record(timing.finish())
+
+        return response
+
+    async def _exchange(
+        self,
+        key: Tuple[str, str, int],
+        target: str,
+        url: str,
+        headers: Optional[Dict[str, str]],
+        method: str,
+        timing: RequestTiming = None,
+    ) -> HTTPResponse:
+        conn = await self.pool.acquire(key, timing)
+
+        try:
+            try:
+                response, reusable = await self._roundtrip(
+                    conn, target, url, headers, method, timing
+                )
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not conn.reused:
+                    raise
+
+                # A pooled connection went stale between requests, so
+                # try the request once more on a fresh socket
+                conn.close()
+                conn = await self.pool.acquire(key, timing)
+
+                if timing is not None:
+                    timing.reused = False
+
+                response, reusable = await self._roundtrip(
+                    conn, target, url, headers, method, timing
+                )
+        except BaseException:
+            conn.close()
+            raise
+
+        self.pool.release(conn, reusable)
+
+        return response
+
+    async def _roundtrip(
+        self,
+        conn: Connection,
+        target: str,
+        url: str,
+        headers: Optional[Dict[str, str]],
+        method: str,
+        timing: RequestTiming = None,
+    ) -> Tuple[HTTPResponse, bool]:
+        scheme, host, port = conn.key
+        host_header = (
+            host if port == DEFAULT_PORTS[scheme] else f"{host}:{port}"
+        )
+
+        request_headers = {
+            "Host": host_header,
+            "User-Agent": self.user_agent,
+            "Accept": "*/*",
+            "Accept-Encoding": ACCEPT_ENCODING,
+            "Connection": "keep-alive",
+        }
+        request_headers.update(headers or {})
+
+        head = f"{method} {target} HTTP/1.1\r\n" + "".join(
+            f"{name}: {value}\r\n" for name, value in request_headers.items()
+        )
+        conn.writer.write(head.encode("latin-1") + b"\r\n")
+        await conn.writer.drain()
+
+        reader = conn.reader
+
+        status_line = await reader.readline()
+
+        if not status_line:
+            raise ConnectionResetError(f"{host} closed the connection")
+
+        if timing is not None:
+            timing.ttfb = timing.elapsed()
+
+        version, status, reason = _parse_status_line(status_line)
+        response_headers = await _read_headers(reader)
+
+        connection = response_headers.get("connection", "").lower()
+        reusable = (
+            "close" not in connection
+            if version == "HTTP/1.1"
+            else "keep-alive" in connection
+        )
+
+        if method == "HEAD" or status in (204, 304) or status < 200:
+            return (
+                HTTPResponse(url, status, reason, response_headers, b""),
+                reusable,
+            )
+
+        # Raising here drops the connection along with the unread body
+        if 200 <= status < 300:
+            check_content_type(url, response_headers, self.content_types)
+
+        body = BodyReader(url, response_headers, self.max_body)
+
+        if "chunked" in response_headers.get("transfer-encoding", "").lower():
+            await _read_chunked(reader, body)
+        elif "content-length" in response_headers:
+            remaining = int(response_headers["content-length"])
+
+            while remaining:
+                data = await reader.readexactly(min(remaining, CHUNK_SIZE))
+                remaining -= len(data)
+                body.feed(data)
+        else:
+            # No framing, so the body runs until the server hangs up
+            reusable = False
+
+            while True:
+                data = await reader.read(CHUNK_SIZE)
+
+                if not data:
+                    break
+
+                body.feed(data)
+
+        # Bytes off the wire, before decompressing
+        if timing is not None:
+            timing.bytes = body.wire_bytes
+
+        body = body.finish()
+
+        return (
+            HTTPResponse(url, status, reason, response_headers, body),
+            reusable,
+        )
+
+
+def _parse_status_line(line: bytes) -> Tuple[str, int, str]:
+    parts = line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        raise ConnectionError(f"malformed status line: {line!r}")
+
+    reason = parts[2] if len(parts) > 2 else ""
+
+    return parts[0], int(parts[1]), reason
+
+
+async def _read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+    headers = {}
+
+    while True:
+        line = await reader.readline()
+
+        if line in (b"\r\n", b"\n", b""):
+            return headers
+
+        name, _, value = line.decode("latin-1").partition(":")
+        name = name.strip().lower()
+        value = value.strip()
+
+        headers[name] = (
+            f"{headers[name]}, {value}" if name in headers else value
+        )
+
+
+async def _read_chunked(
+    reader: asyncio.StreamReader, body: BodyReader
+) -> None:
+    while True:
+        size_line = await reader.readline()
+        size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+
+        if size == 0:
+            # Drain any trailers up to the terminating blank line
+            await _read_headers(reader)
+            return
+
+        body.feed(await reader.readexactly(size))
+        await reader.readexactly(2)
+
+
+def async_bulk_query(
+    url_list: List[str],
+    max_in_flight: int = 1024,
+    max_per_host: int = 8,
+    timeout: int = 30,
+    respect_robots: bool = False,
+    agent: str = USER_AGENT,
+    cache: ResponseCache = None,
+    limiter: AdaptiveLimiter = None,
+    policy: FetchPolicy = None,
+    metrics: FetchMetrics = None,
+    max_body: Optional[int] = DEFAULT_MAX_BODY,
+    content_types: Optional[FrozenSet[str]] = HTML_CONTENT_TYPES,
+) -> Dict[str, bytes]:
+    """
+    Drop-in for concurrent_bulk_query which is bound by the
+    network rather than by the number of cpus
+
+    Parameters
+    ----------
+    url_list : List[str]
+        The urls to read
+    max_in_flight : int
+        The most requests in flight across all hosts
+    max_per_host : int
+        The most requests in flight against a single host
+    timeout : int
+        Seconds allowed for a single request
+    respect_robots : bool, optional
+        Skip urls robots.txt disallows for agent, default: False
+    agent : str, optional
+        The user agent to send and to check robots.txt for
+    cache : ResponseCache, optional
+        Revalidate and store bodies through this response cache
+    limiter : AdaptiveLimiter, optional
+        Adapt the in flight limits per host and globally, up to the
+        ceilings the limiter was made with
+    policy : FetchPolicy, optional
+        Retry transient failures and fail fast on dead hosts
+    metrics : FetchMetrics, optional
+        Time every request into these metrics
+    max_body : int, optional
+        The most decompressed bytes read from a body, None for any
+    content_types : FrozenSet[str], optional
+        The media types whose bodies are read, None for any
+
+    Returns
+    -------
+    Dict[str, bytes]
+        The url-indexed page bodies, None for failed urls
+    """
+    if respect_robots:
+        url_list = robots_cache.filter_allowed(url_list, agent)
+
+    async def _run():
+        async with AsyncFetcher(
+            max_in_flight=max_in_flight,
+            max_per_host=max_per_host,
+            timeout=timeout,
+            user_agent=agent,
+            cache=cache,
+            limiter=limiter,
+            policy=policy,
+            metrics=metrics,
+            max_body=max_body,
+            content_types=content_types,
+        ) as fetcher:
+            return await fetcher.fetch_all(url_list)
+
+    return asyncio.run(_run())
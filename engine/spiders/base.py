@@ -10,9 +10,20 @@ import multiprocessing
 import time
 import urllib.robotparser
 
-from geopy.geocoders import Nominatim
 from bs4 import BeautifulSoup
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Callable, Tuple
+
+from .cache import ResponseCache
+from .geocoding import default_geocoder
+from .metrics import FetchMetrics
+from .retry import FetchPolicy
+from .transfer import (
+    DEFAULT_MAX_BODY,
+    HTML_CONTENT_TYPES,
+    open_url,
+    read_response,
+)
+from .utils import host_key
 
 
 logger = logging.getLogger(__name__)
@@ -41,23 +52,113 @@ def get_robots(url: str):
     return rp
 
 
-def read(url: str, timeout: int = 30):
-    html = urllib.request.urlopen(url, timeout=timeout)
-    html = html.read()
+def read(
+    url: str,
+    timeout: int = 30,
+    cache: ResponseCache = None,
+    metrics: FetchMetrics = None,
+    retries: int = 0,
+    max_body: int = DEFAULT_MAX_BODY,
+    content_types=HTML_CONTENT_TYPES,
+):
+    """
+    Reads a url, asking for a compressed transfer and streaming the
+    body in so unwanted content types and bodies larger than max_body
+    are dropped before they are downloaded. content_types and
+    max_body of None accept anything
+    """
+    timing = None
+
+    if metrics is not None:
+        timing = metrics.start(url, host_key(url), retries)
+
+    try:
+        if cache is not None:
+            html = cache.read(url, timeout, max_body, content_types, timing)
+        else:
+            response = open_url(url, timeout=timeout)
+
+            # urlopen returns once the status line and headers are in
+            if timing is not None:
+                timing.responded(response.status)
+
+            html = read_response(response, max_body, content_types, timing)
+    except Exception as e:
+        if timing is not None:
+            # An HTTPError is still a response, which came in just now
+            if timing.status is None and hasattr(e, "code"):
+                timing.responded(e.code)
+
+            metrics.record(timing.finish(e))
+
+        raise
+
+    if timing is not None:
+        metrics.record(timing.finish())
 
     return html
 
 
-def serial_bulk_query(url_list: List[str], delay: int = 0) -> Dict[str, str]:
-    return {url: read(url) for url in url_list if time.sleep(delay) is None}
+def policy_read(
+    url: str,
+    policy: FetchPolicy,
+    timeout: int = 30,
+    cache: ResponseCache = None,
+    metrics: FetchMetrics = None,
+    max_body: int = DEFAULT_MAX_BODY,
+    backoff: Callable[[str, float], float] = None,
+):
+    """
+    Reads a url under a fetch policy, giving None once the policy
+    gives up on it. The reason is kept in policy.failures, backoff
+    is passed on to policy.call
+    """
+
+    def _read(url: str):
+        retries = policy.retry_counts[url]
+        return read(url, timeout, cache, metrics, retries, max_body)
+
+    try:
+        return policy.call(url, _read, backoff)
+    except Exception as e:
+        logger.info(f"{url} made an exception: {e}")
+        return None
+
+
+def serial_bulk_query(
+    url_list: List[str],
+    delay: int = 0,
+    cache: ResponseCache = None,
+    policy: FetchPolicy = None,
+    metrics: FetchMetrics = None,
+    max_body: int = DEFAULT_MAX_BODY,
+) -> Dict[str, str]:
+    # Retry transient failures and skip dead hosts, so one bad url
+    # never aborts the whole run
+    policy = policy if policy is not None else FetchPolicy()
+
+    loaded = {}
+
+    for url in url_list:
+        time.sleep(delay)
+        loaded[url] = policy_read(url, policy, 30, cache, metrics, max_body)
+
+    return loaded
 
 
 def concurrent_bulk_query(
-    url_list: List[str], delay: int = None
+    url_list: List[str],
+    delay: int = None,
+    cache: ResponseCache = None,
+    policy: FetchPolicy = None,
+    metrics: FetchMetrics = None,
+    max_body: int = DEFAULT_MAX_BODY,
 ) -> Dict[str, str]:
     # Get our number of threads
     worker_count = multiprocessing.cpu_count()
 
+    policy = policy if policy is not None else FetchPolicy()
+
     # Our page cache
     loaded = {}
 
@@ -67,20 +168,14 @@ def concurrent_bulk_query(
     ) as executor:
         # Begin thread matching
         futures = {
-            # read(url=url, timeout=30)
-            executor.submit(read, url, 30): url
+            executor.submit(
+                policy_read, url, policy, 30, cache, metrics, max_body
+            ): url
             for url in url_list
         }
 
         for future in concurrent.futures.as_completed(futures):
-            url = futures[future]
-            try:
-                data = future.result()
-            except Exception as e:
-                loaded[url] = None
-                logger.info(f"{url} made an exception: {e}")
-            else:
-                loaded[url] = data
+            loaded[futures[future]] = future.result()
 
     return loaded
 
@@ -196,9 +291,11 @@ def get_img(doc: BeautifulSoup):
     return imgs
 
 
-def city_name_to_latlong(name: str) -> Tuple[str, str]:
-    geolocator = Nominatim(user_agent="GoogleBot")
+def city_name_to_latlong(name: str) -> Tuple[float, float]:
+    # Answered from the persistent geocode cache when we can
+    location = default_geocoder().geocode(name)
 
-    location = geolocator.geocode(name)
+    if location is None:
+        raise LookupError(f"Could not geocode '{name}'")
 
-    return location.latitude, location.longitude
+    return location
@@ -0,0 +1,331 @@
+"""
+Cache contains a persistent, size capped HTTP response cache which
+revalidates stored pages with conditional GETs so unchanged pages
+cost a 304 instead of a full download
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+import zlib
+from typing import Dict, FrozenSet, Optional
+
+from .metrics import RequestTiming
+from .transfer import (
+    DEFAULT_MAX_BODY,
+    HTML_CONTENT_TYPES,
+    open_url,
+    read_response,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_FILE = (
+    f"{os.path.dirname(os.path.realpath(__file__))}/corpus/responses.sqlite3"
+)
+
+
+class CachedResponse:
+    """
+    A response body stored in the cache along with its validators
+
+    Parameters
+    ----------
+    url : str
+        The url the body was read from
+    body : bytes
+        The decompressed response body
+    etag : str
+        The ETag header of the response, if any
+    last_modified : str
+        The Last-Modified header of the response, if any
+    stored : float
+        The unix time the body was last downloaded or revalidated
+    """
+
+    def __init__(
+        self,
+        url: str,
+        body: bytes,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        stored: float,
+    ):
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored = stored
+
+    def validators(self) -> Dict[str, str]:
+        headers = {}
+
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+
+        return headers
+
+    def fresh(self, max_age: float) -> bool:
+        return time.time() - self.stored < max_age
+
+
+class ResponseCache:
+    """
+    The response cache stores zlib compressed bodies in a sqlite
+    file keyed by url, evicting the least recently used entries
+    once the compressed size passes max_bytes
+
+    Parameters
+    ----------
+    path : str
+        The sqlite file to keep the cache in
+    max_bytes : int
+        The most compressed body bytes kept on disk
+    max_age : float
+        Seconds a stored body is served without revalidating,
+        0 always revalidates
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_FILE,
+        max_bytes: int = 512 * 1024 * 1024,
+        max_age: float = 0,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " url TEXT PRIMARY KEY,"
+            " body BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " stored REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed"
+            " ON responses (accessed)"
+        )
+        self._db.commit()
+
+        (self.size,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+
+    def __contains__(self, url: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+
+        return row is not None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self),
+            "bytes": self.size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def lookup(self, url: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, etag, last_modified, stored"
+                " FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        body, etag, last_modified, stored = row
+
+        return CachedResponse(
+            url, zlib.decompress(body), etag, last_modified, stored
+        )
+
+    def hit(self, entry: CachedResponse, revalidated: bool = False) -> bytes:
+        """
+        Records that a stored body was served, either because it is
+        still fresh or because the server answered 304
+
+        Parameters
+        ----------
+        entry : CachedResponse
+            The entry being served
+        revalidated : bool, optional
+            Whether the server just confirmed the entry
+
+        Returns
+        -------
+        bytes
+            The stored body
+        """
+        now = time.time()
+
+        with self._lock:
+            self.hits += 1
+
+            if revalidated:
+                self._db.execute(
+                    "UPDATE responses SET accessed = ?, stored = ?"
+                    " WHERE url = ?",
+                    (now, now, entry.url),
+                )
+            else:
+                self._db.execute(
+                    "UPDATE responses SET accessed = ? WHERE url = ?",
+                    (now, entry.url),
+                )
+
+            self._db.commit()
+
+        return entry.body
+
+    def store(self, url: str, body: bytes, headers) -> None:
+        """
+        Records a full download and keeps its body for next time
+
+        Parameters
+        ----------
+        url : str
+            The url the body was read from
+        body : bytes
+            The response body
+        headers : Mapping[str, str]
+            The response headers, read for ETag and Last-Modified
+        """
+        compressed = zlib.compress(body)
+        now = time.time()
+
+        with self._lock:
+            self.misses += 1
+
+            if len(compressed) > self.max_bytes:
+                return
+
+            old = self._db.execute(
+                "SELECT size FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses"
+                " (url, body, size, etag, last_modified, stored, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    compressed,
+                    len(compressed),
+                    _header(headers, "etag"),
+                    _header(headers, "last-modified"),
+                    now,
+                    now,
+                ),
+            )
+            self.size += len(compressed) - (old[0] if old else 0)
+            self._evict()
+            self._db.commit()
+
+    def read(
+        self,
+        url: str,
+        timeout: int = 30,
+        max_body: Optional[int] = DEFAULT_MAX_BODY,
+        content_types: Optional[FrozenSet[str]] = HTML_CONTENT_TYPES,
+        timing: RequestTiming = None,
+    ) -> bytes:
+        """
+        Reads a url through the cache with a conditional GET
+
+        Parameters
+        ----------
+        url : str
+            The url to read
+        timeout : int
+            Seconds allowed for the request
+        max_body : int, optional
+            The most decompressed bytes read, None to read any size
+        content_types : FrozenSet[str], optional
+            The media types accepted, None to accept any
+        timing : RequestTiming, optional
+            Given the status, time to first byte and bytes
+            downloaded, which stay 0 when the body comes from the cache
+
+        Returns
+        -------
+        bytes
+            The response body
+        """
+        entry = self.lookup(url)
+
+        if entry is not None and entry.fresh(self.max_age):
+            return self.hit(entry)
+
+        headers = entry.validators() if entry is not None else {}
+
+        try:
+            response = open_url(url, timeout, headers)
+        except urllib.error.HTTPError as e:
+            if timing is not None:
+                timing.responded(e.code)
+
+            # urllib surfaces a 304 as an error status
+            if e.code == 304 and entry is not None:
+                return self.hit(entry, revalidated=True)
+            raise
+
+        if timing is not None:
+            timing.responded(response.status)
+
+        body = read_response(response, max_body, content_types, timing)
+        self.store(url, body, response.headers)
+
+        return body
+
+    def _evict(self) -> None:
+        while self.size > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT url, size FROM responses ORDER BY accessed LIMIT 64"
+            ).fetchall()
+
+            for url, size in rows:
+                self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self.size -= size
+                self.evictions += 1
+
+                if self.size <= self.max_bytes:
+                    break
+
+
+def _header(headers, name: str) -> Optional[str]:
+    # http.client messages are case insensitive and the async
+    # fetcher keys its header dicts lower case
+    return headers.get(name) if headers is not None else None
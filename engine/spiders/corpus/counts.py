@@ -0,0 +1,488 @@
+"""
+Counts keep the token counts of every stored page next to the page
+store, so a category's frequency vector is the sum of its pages'
+vectors. Adding or removing a page moves the totals by that page's
+counts alone, and the sum can be spread over processes or machines
+"""
+
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from .shards import merge_frequency_vectors
+from .stems import StemCache
+from .store import PageStore
+
+COUNTS_FILE = "counts.sqlite3"
+
+
+class CountStore:
+    """
+    The count store keeps a count vector per page body, keyed by its
+    sha256 like the page store keeps the body itself, along with
+    which urls each category holds and the running totals of their
+    counts
+
+    Parameters
+    ----------
+    path : str
+        The sqlite file, usually counts_path(store)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " sha256 TEXT PRIMARY KEY,"
+            " counts BLOB NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS members ("
+            " category TEXT NOT NULL,"
+            " url TEXT NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " PRIMARY KEY (category, url))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS totals ("
+            " category TEXT NOT NULL,"
+            " token TEXT NOT NULL,"
+            " count INTEGER NOT NULL,"
+            " PRIMARY KEY (category, token))"
+        )
+        self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, digest: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM documents WHERE sha256 = ?", (digest,)
+            ).fetchone()
+
+        return row is not None
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def get(self, digest: str) -> Optional[Dict[str, int]]:
+        """
+        The counts of the body with this sha256, None if never counted
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT counts FROM documents WHERE sha256 = ?", (digest,)
+            ).fetchone()
+
+        return None if row is None else _decode(row[0])
+
+    def put(self, digest: str, counts: Mapping[str, int]) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents (sha256, counts)"
+                " VALUES (?, ?)",
+                (digest, _encode(counts)),
+            )
+            self._db.commit()
+
+    def members(self, category: str) -> Dict[str, str]:
+        """
+        The urls counted under category, with the sha256 of the body
+        each was counted from
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT url, sha256 FROM members WHERE category = ?"
+                " ORDER BY url",
+                (category,),
+            ).fetchall()
+
+        return dict(rows)
+
+    def member(self, category: str, url: str) -> Optional[str]:
+        """
+        The sha256 of the body url is counted from under category,
+        None if it is not counted there
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sha256 FROM members WHERE category = ? AND url = ?",
+                (category, url),
+            ).fetchone()
+
+        return None if row is None else row[0]
+
+    def digests(self, category: str, urls: Iterable[str]) -> Dict[str, str]:
+        """
+        The sha256 each of urls is counted from under category, for
+        the urls which are counted there
+        """
+        urls = list(urls)
+        found = {}
+
+        # Chunks stay under sqlite's limit on query parameters
+        for i in range(0, len(urls), 500):
+            chunk = urls[i : i + 500]
+
+            with self._lock:
+                found.update(
+                    self._db.execute(
+                        "SELECT url, sha256 FROM members WHERE category = ?"
+                        f" AND url IN ({', '.join('?' * len(chunk))})",
+                        (category, *chunk),
+                    ).fetchall()
+                )
+
+        return found
+
+    def add(self, category: str, url: str, digest: str) -> bool:
+        """
+        Counts url's body under category, swapping out the body it
+        was counted from before
+
+        Parameters
+        ----------
+        category : str
+            The category
+        url : str
+            The page url
+        digest : str
+            The sha256 of its body, whose counts must be stored
+
+        Returns
+        -------
+        bool
+            Whether the totals moved
+        """
+        counts = self.get(digest)
+
+        if counts is None:
+            raise KeyError(f"{digest} of {url} has not been counted")
+
+        old = self.member(category, url)
+
+        if old == digest:
+            return False
+
+        delta = Counter(counts)
+
+        if old is not None:
+            delta.subtract(self.get(old) or {})
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO members (category, url, sha256)"
+                " VALUES (?, ?, ?)",
+                (category, url, digest),
+            )
+            self._move_totals(category, delta)
+            self._db.commit()
+
+        return True
+
+    def remove(self, category: str, url: str) -> bool:
+        """
+        Takes url's counts back out of category
+
+        Returns
+        -------
+        bool
+            Whether url was counted under category
+        """
+        old = self.member(category, url)
+
+        if old is None:
+            return False
+
+        delta = Counter()
+        delta.subtract(self.get(old) or {})
+
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM members WHERE category = ? AND url = ?",
+                (category, url),
+            )
+            self._move_totals(category, delta)
+            self._db.commit()
+
+        return True
+
+    def update(
+        self, category: str, pages: Mapping[str, str]
+    ) -> Tuple[int, int]:
+        """
+        Makes category hold exactly the given pages, adding new and
+        changed ones and removing the rest
+
+        Parameters
+        ----------
+        category : str
+            The category
+        pages : Mapping[str, str]
+            The sha256 of each url's current body
+
+        Returns
+        -------
+        Tuple[int, int]
+            The number of urls added or changed, and removed
+        """
+        added = sum(self.add(category, url, pages[url]) for url in pages)
+        removed = sum(
+            self.remove(category, url)
+            for url in self.members(category)
+            if url not in pages
+        )
+
+        return added, removed
+
+    def totals(self, category: str) -> Dict[str, int]:
+        """
+        The token counts of every page counted under category, ordered
+        by token
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT token, count FROM totals WHERE category = ?"
+                " ORDER BY token",
+                (category,),
+            ).fetchall()
+
+        return dict(rows)
+
+    def recount(self, category: str, workers: int = None) -> Dict[str, int]:
+        """
+        Rebuilds category's totals from its pages' counts with
+        reduce_counts, replacing the running totals
+
+        Returns
+        -------
+        Dict[str, int]
+            The category totals
+        """
+        digests = list(self.members(category).values())
+        totals = reduce_counts(
+            (self.get(digest) or {} for digest in digests), workers
+        )
+
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM totals WHERE category = ?", (category,)
+            )
+            self._move_totals(category, totals)
+            self._db.commit()
+
+        return self.totals(category)
+
+    def _move_totals(self, category: str, delta: Mapping[str, int]) -> None:
+        # Called holding the lock, within the members transaction
+        self._db.executemany(
+            "INSERT INTO totals (category, token, count) VALUES (?, ?, ?)"
+            " ON CONFLICT (category, token)"
+            " DO UPDATE SET count = count + excluded.count",
+            [(category, token, n) for token, n in delta.items() if n],
+        )
+        self._db.execute(
+            "DELETE FROM totals WHERE category = ? AND count <= 0",
+            (category,),
+        )
+
+
+def counts_path(store: PageStore) -> str:
+    """
+    Where the counts of a page store's pages are kept, inside its folder
+    """
+    return os.path.join(store.directory, COUNTS_FILE)
+
+
+def _encode(counts: Mapping[str, int]) -> bytes:
+    return zlib.compress(json.dumps(counts).encode())
+
+
+def _decode(data: bytes) -> Dict[str, int]:
+    return json.loads(zlib.decompress(data))
+
+
+def _count_chunk(
+    chunk: List[Tuple[str, bytes]], lowercase: bool
+) -> List[Tuple[str, Dict[str, int]]]:
+    # Runs in a worker, the pages of a chunk share their stems. The
+    # fetcher is imported here as it builds on the crawl state, which
+    # keeps its counts in a count store
+    from .fetcher import page_frequency_vector
+
+    stems = StemCache(None)
+
+    return [
+        (digest, page_frequency_vector(body, lowercase, stems))
+        for digest, body in chunk
+    ]
+
+
+def count_pages(
+    store: PageStore,
+    counts: CountStore,
+    urls: Iterable[str] = None,
+    lowercase: bool = False,
+    workers: int = None,
+    chunksize: int = 16,
+) -> int:
+    """
+    The map step, which counts the stored bodies that have no counts
+    yet across a process pool. A body shared by several urls is only
+    counted once
+
+    Parameters
+    ----------
+    store : PageStore
+        The pages
+    counts : CountStore
+        Where their counts are kept
+    urls : Iterable[str], optional
+        Only count these urls, by default every page in the store
+    lowercase : bool
+        Lower case tokens before counting
+    workers : int, optional
+        The number of processes, cpu_count() by default
+    chunksize : int
+        Pages sent to a worker per task
+
+    Returns
+    -------
+    int
+        The number of bodies counted
+    """
+    wanted = None if urls is None else {url for url in urls if url in store}
+    seen = set()
+    missing = []
+
+    # Read in on-disk order, skipping bodies already counted
+    for url in store:
+        if wanted is not None and url not in wanted:
+            continue
+
+        digest = store.digest(url)
+
+        if digest not in seen:
+            seen.add(digest)
+
+            if digest not in counts:
+                missing.append(url)
+
+    if not missing:
+        return 0
+
+    pages = ((store.digest(url), store[url]) for url in missing)
+    chunks = iter(lambda: list(itertools.islice(pages, chunksize)), [])
+    worker_count = workers or multiprocessing.cpu_count()
+    counted = 0
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=worker_count
+    ) as executor:
+        pending = set()
+
+        def _collect(done):
+            nonlocal counted
+
+            for future in done:
+                for digest, vector in future.result():
+                    counts.put(digest, vector)
+                    counted += 1
+
+        # A couple of chunks per worker queued, so the store is never
+        # read far ahead of the pool
+        for chunk in chunks:
+            pending.add(executor.submit(_count_chunk, chunk, lowercase))
+
+            if len(pending) >= worker_count * 2:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                _collect(done)
+
+        _collect(concurrent.futures.as_completed(pending))
+
+    return counted
+
+
+def _sum_chunk(vectors: List[Mapping[str, int]]) -> Dict[str, int]:
+    total = Counter()
+
+    for vector in vectors:
+        total.update(vector)
+
+    return dict(total)
+
+
+def reduce_counts(
+    vectors: Iterable[Mapping[str, int]],
+    workers: int = None,
+    chunksize: int = 256,
+) -> Dict[str, int]:
+    """
+    The reduce step, which sums count vectors in chunks across a
+    process pool and then sums the partial totals. Sums do not depend
+    on the order they are taken in, so the result is the same for any
+    number of workers
+
+    Parameters
+    ----------
+    vectors : Iterable[Mapping[str, int]]
+        The count vectors, usually one per page
+    workers : int, optional
+        The number of processes, cpu_count() by default, 1 sums in
+        this process
+    chunksize : int
+        Vectors summed per task
+
+    Returns
+    -------
+    Dict[str, int]
+        The summed vector, ordered by token
+    """
+    worker_count = workers or multiprocessing.cpu_count()
+
+    if worker_count == 1:
+        return merge_frequency_vectors(vectors)
+
+    vectors = iter(vectors)
+    chunks = iter(lambda: list(itertools.islice(vectors, chunksize)), [])
+    total = Counter()
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=worker_count
+    ) as executor:
+        # Partial sums are folded in as they finish, keeping a couple
+        # of chunks per worker in memory
+        pending = set()
+
+        for chunk in chunks:
+            pending.add(executor.submit(_sum_chunk, chunk))
+
+            if len(pending) >= worker_count * 2:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+
+                for future in done:
+                    total.update(future.result())
+
+        for future in concurrent.futures.as_completed(pending):
+            total.update(future.result())
+
+    return merge_frequency_vectors([total])
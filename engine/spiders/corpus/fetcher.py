@@ -4,13 +4,14 @@ category and returns the derived text corpus
 """
 
 import bs4
+import collections
 from collections import Counter
 import concurrent.futures
+import itertools
 import logging
 import multiprocessing
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import string
-from nltk.stem import SnowballStemmer
 
 from bs4 import BeautifulSoup
 from ..base import (
@@ -19,6 +20,17 @@ from ..base import (
     concurrent_batch_process_page_data,
 )
 from .indexer import Indexer
+from .pipeline import Pipeline, Stage
+from .shards import shard_links
+from .state import DEFAULT_REVISIT, CrawlState
+from .stems import StemCache
+from .store import PageStore
+from ..cache import ResponseCache
+from ..extract import TAGS, fast_extract_reader_view
+from ..frontier import Frontier
+from ..metrics import FetchMetrics
+from ..politeness import polite_bulk_query, polite_iter_query
+from ..retry import FetchPolicy
 from ..utils import eq_ignore_case
 from nltk import sent_tokenize, wordpunct_tokenize, download
 
@@ -26,7 +38,6 @@ download("punkt")
 
 
 logger = logging.getLogger(__name__)
-TAGS = ["h1", "h2", "h3", "h4", "h5", "h6", "h7", "p"]
 
 
 def serial_parse_reader_view(
@@ -40,6 +51,30 @@ def serial_parse_reader_view(
     return reader_view
 
 
+def fast_parse_reader_view(
+    page_data: Dict[str, bytes]
+) -> Dict[str, List[str]]:
+    """
+    Builds the same reader view as serial_parse_reader_view straight
+    from raw html, without building soup trees first
+
+    Parameters
+    ----------
+    page_data : Dict[str, bytes]
+        The url-indexed raw html
+
+    Returns
+    -------
+    Dict[str, List[str]]
+        The url-indexed reader view content
+    """
+    return {
+        url: fast_extract_reader_view(html)
+        for url, html in page_data.items()
+        if html is not None
+    }
+
+
 def concurrent_parse_reader_view(
     parsed: Dict[str, BeautifulSoup]
 ) -> Dict[str, List[str]]:
@@ -70,7 +105,9 @@ def concurrent_parse_reader_view(
 
 
 def unwrap_context_and_extract(
-    structured_reader_view: Dict[str, List[str]], unwrap_returns="sentences"
+    structured_reader_view: Dict[str, List[str]],
+    unwrap_returns="sentences",
+    workers: int = 1,
 ) -> List[str]:
     """
     Unwraps the context of a piece of structured reader view data
@@ -83,59 +120,431 @@ def unwrap_context_and_extract(
     unwrap_returns : str, optional possible: ('words', 'sentences'),
     default: 'sentences'
         Output data shape
+    workers : int, optional
+        Processes to tokenize across, None for cpu_count(). The tokens
+        come out in the same order either way
+    """
+    return list(
+        iter_unwrap_context_and_extract(
+            structured_reader_view, unwrap_returns, workers
+        )
+    )
+
+
+def iter_unwrap_context_and_extract(
+    structured_reader_view: Dict[str, List[str]],
+    unwrap_returns="sentences",
+    workers: int = None,
+    chunksize: int = 16,
+) -> Iterator[str]:
+    """
+    Streams the tokens of unwrap_context_and_extract, tokenizing
+    chunks of pages across a process pool. Chunks are yielded in the
+    order they were taken, so the tokens match the serial order
+
+    Parameters
+    ----------
+    structured_reader_view : Dict[str, List[str]]
+        The url-indexed reader view content
+    unwrap_returns : str, optional possible: ('words', 'sentences'),
+    default: 'sentences'
+        Output data shape
+    workers : int, optional
+        The number of processes, cpu_count() by default, 1 tokenizes
+        in this process
+    chunksize : int, optional
+        Pages sent to a worker per task
+
+    Returns
+    -------
+    Iterator[str]
+        The sentences or words, in reader view order
     """
-    ret = []
+    words = eq_ignore_case("words", unwrap_returns)
+    textlists = (textlist for textlist in structured_reader_view.values())
+
+    worker_count = workers or multiprocessing.cpu_count()
+
+    if worker_count == 1:
+        for textlist in textlists:
+            yield from _iter_tokens(textlist, words)
+
+        return
+
+    chunks = iter(lambda: list(itertools.islice(textlists, chunksize)), [])
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=worker_count
+    ) as executor:
+        # A couple of chunks per worker in flight, collected in the
+        # order they were submitted
+        pending = collections.deque()
+
+        for chunk in chunks:
+            pending.append(executor.submit(_tokenize_chunk, chunk, words))
+
+            if len(pending) >= worker_count * 2:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
 
-    for _, textlist in structured_reader_view.items():
-        for text in textlist:
-            for sentence in sent_tokenize(text):
-                ret.append(sentence)
 
-    if eq_ignore_case("words", unwrap_returns):
-        newret = []
-        for sentence in ret:
-            for token in wordpunct_tokenize(sentence):
-                newret.append(token)
-        return newret
+def _iter_tokens(textlist: List[str], words: bool) -> Iterator[str]:
+    for text in textlist:
+        for sentence in sent_tokenize(text):
+            if words:
+                yield from wordpunct_tokenize(sentence)
+            else:
+                yield sentence
+
 
-    return ret
+def _tokenize_chunk(chunk: List[List[str]], words: bool) -> List[str]:
+    # Runs in a worker, one list per chunk keeps pickling cheap
+    return [
+        token for textlist in chunk for token in _iter_tokens(textlist, words)
+    ]
 
 
-def raw_corpus_to_frequency_vector(raw_corpus: List[str]) -> Dict[str, int]:
+def raw_corpus_to_frequency_vector(
+    raw_corpus: Iterable[str],
+    lowercase: bool = False,
+    stems: StemCache = None,
+) -> Dict[str, int]:
     """
     Takes a araw list of strings and returns a frequency vector of
     all of their counts
 
+    Tokens are counted as they are first, so each distinct type is
+    stemmed once and its count folded into its stem's
+
     Parameters
     ----------
-    raw_corpus : List[str]
-        The list of text that is being processed
+    raw_corpus : Iterable[str]
+        The text that is being processed, read once, so a token
+        stream will do
+    lowercase : bool, optional
+        Lower case tokens before counting. The Snowball stemmer folds
+        case itself, so this gives the same counts with fewer types
+        to look up
+    stems : StemCache, optional
+        Stems kept across calls and runs, by default each call keeps
+        its own in memory
 
     Returns
     -------
     Dict[str, int] - The counter object of counts for each token
     """
-    frequency_vector = {}
+    if lowercase:
+        raw_corpus = (token.lower() for token in raw_corpus)
 
-    stemmer = SnowballStemmer("english")
+    type_counts = Counter(raw_corpus)
 
-    lower_corpus = [text.lower() for text in raw_corpus]
+    if stems is None:
+        stems = StemCache(None)
 
-    stemmed_corpus = [
-        stemmer.stem(token)
-        for token in raw_corpus
-        if token not in string.punctuation
-    ]
+    # A substring check, as before, so runs like "()" and the empty
+    # string are dropped along with single marks
+    stemmed = stems.stem_all(
+        token for token in type_counts if token not in string.punctuation
+    )
 
-    return dict(Counter(stemmed_corpus))
+    frequency_vector = Counter()
 
+    # Insertion order follows the first occurrence of each stem, as
+    # counting the stemmed tokens directly would
+    for token, count in type_counts.items():
+        if token in stemmed:
+            frequency_vector[stemmed[token]] += count
 
-def mass_indexer_query_by_category(
-    indexer: Indexer, category: str, delay: int = 1
-) -> List[str]:
+    return dict(frequency_vector)
+
+
+def iter_category_links(
+    indexer: Indexer,
+    category: str,
+    batch_size: int = 1000,
+    shard: Optional[Tuple[int, int]] = None,
+) -> Iterator[str]:
+    """
+    Streams the canonical links of an indexer category, a batch at a
+    time, once each however many forms they were indexed under, and
+    keeping only those of one (shard, shards) pair when given
+    """
     if not indexer.local_index:
         raise AttributeError("Local index is empty")
 
-    links = indexer.local_index[category]
+    frontier = Frontier()
+    links = (
+        url
+        for batch in indexer.iter_links(category, batch_size)
+        for url in frontier.filter(batch)
+    )
+
+    if shard is not None:
+        links = shard_links(links, *shard)
 
-    return serial_bulk_query(links, delay)
+    yield from links
+
+
+def mass_indexer_query_by_category(
+    indexer: Indexer,
+    category: str,
+    delay: int = 1,
+    cache: ResponseCache = None,
+    store: PageStore = None,
+    policy: FetchPolicy = None,
+    metrics: FetchMetrics = None,
+    batch_size: int = 1000,
+    shard: Optional[Tuple[int, int]] = None,
+) -> List[str]:
+    links = iter_category_links(indexer, category, batch_size, shard)
+
+    # Stream pages to disk rather than holding the category in memory
+    if store is not None:
+        return store.put_all(
+            polite_iter_query(
+                links,
+                delay,
+                cache=cache,
+                policy=policy,
+                metrics=metrics,
+                window=batch_size,
+            )
+        )
+
+    return polite_bulk_query(
+        links, delay, cache=cache, policy=policy, metrics=metrics
+    )
+
+
+def iter_indexer_query_by_category(
+    indexer: Indexer,
+    category: str,
+    delay: int = 1,
+    cache: ResponseCache = None,
+    store: PageStore = None,
+    policy: FetchPolicy = None,
+    metrics: FetchMetrics = None,
+    batch_size: int = 1000,
+    shard: Optional[Tuple[int, int]] = None,
+) -> Iterator[Tuple[str, bytes]]:
+    links = iter_category_links(indexer, category, batch_size, shard)
+
+    for url, html in polite_iter_query(
+        links,
+        delay,
+        cache=cache,
+        policy=policy,
+        metrics=metrics,
+        window=batch_size,
+    ):
+        if store is not None and html is not None:
+            store.put(url, html)
+
+        yield url, html
+
+
+def iter_changed_by_category(
+    indexer: Indexer,
+    category: str,
+    state: CrawlState,
+    revisit: float = DEFAULT_REVISIT,
+    delay: int = 1,
+    store: PageStore = None,
+    policy: FetchPolicy = None,
+    metrics: FetchMetrics = None,
+    batch_size: int = 1000,
+    shard: Optional[Tuple[int, int]] = None,
+) -> Iterator[Tuple[str, bytes]]:
+    """
+    Fetches the urls of a category which are new or due a revisit
+    through the crawl state, yielding only the pages whose content
+    changed since they were last counted
+
+    Pages which answer with a permanent 4xx, and once the whole
+    category has been read the pages no longer in it, are uncounted
+    from the state's totals
+
+    Parameters
+    ----------
+    indexer : Indexer
+        The loaded indexer
+    category : str
+        The category to recrawl
+    state : CrawlState
+        The crawl state, also used as the fetch cache
+    revisit : float
+        Seconds after which a fetched url is fetched again
+    delay : int
+        Seconds between requests to hosts without a robots.txt delay
+    store : PageStore, optional
+        Keep the bodies of changed pages here
+    batch_size : int
+        Links read from the index and checked against the state at
+        a time
+    shard : Tuple[int, int], optional
+        Only recrawl the links of this (shard, shards) pair
+
+    Returns
+    -------
+    Iterator[Tuple[str, bytes]]
+        The (url, body) pairs of new and changed pages
+    """
+    candidates = iter_category_links(indexer, category, batch_size, shard)
+
+    # Batches keep the state lookups to a query per batch_size links
+    batches = iter(lambda: list(itertools.islice(candidates, batch_size)), [])
+    links = (
+        url for batch in batches for url in state.due(batch, category, revisit)
+    )
+
+    for url, html in polite_iter_query(
+        links,
+        delay,
+        cache=state,
+        policy=policy,
+        metrics=metrics,
+        window=batch_size,
+    ):
+        if html is None:
+            entry = state.get(url)
+
+            if entry is not None and entry.gone:
+                state.uncount(url, category)
+
+            continue
+
+        changed = state.changed(url, category)
+
+        if store is not None and (changed or url not in store):
+            store.put(url, html)
+
+        if changed:
+            yield url, html
+
+    state.retain(
+        category, iter_category_links(indexer, category, batch_size, shard)
+    )
+
+
+def page_frequency_vector(
+    html: bytes, lowercase: bool = False, stems: StemCache = None
+) -> Dict[str, int]:
+    """
+    The frequency vector of a single page's reader view
+    """
+    reader_view = {None: fast_extract_reader_view(html)}
+
+    return raw_corpus_to_frequency_vector(
+        iter_unwrap_context_and_extract(reader_view, "words", workers=1),
+        lowercase,
+        stems,
+    )
+
+
+def incremental_frequency_vector(
+    pages: Iterable[Tuple[str, bytes]],
+    category: str,
+    state: CrawlState,
+    lowercase: bool = False,
+    stems: StemCache = None,
+) -> Tuple[Dict[str, int], int]:
+    """
+    Recounts the given pages and folds the difference into the
+    category totals kept by the crawl state. A body counted before,
+    under any url, has its stored counts reused
+
+    Parameters
+    ----------
+    pages : Iterable[Tuple[str, bytes]]
+        The (url, html) pairs which changed
+    category : str
+        The category they are counted under
+    state : CrawlState
+        The crawl state the pages were read through
+    lowercase : bool
+        Lower case tokens before counting
+    stems : StemCache, optional
+        Stems kept across runs, by default kept for this call only
+
+    Returns
+    -------
+    Tuple[Dict[str, int], int]
+        The frequency vector of the whole category and the number of
+        pages recounted
+    """
+    recounted = 0
+
+    if stems is None:
+        stems = StemCache(None)
+
+    for url, html in pages:
+        counts = state.counted(url)
+
+        if counts is None:
+            counts = page_frequency_vector(html, lowercase, stems)
+
+        state.count(url, category, counts)
+        recounted += 1
+
+    return state.totals(category), recounted
+
+
+def stream_frequency_vector(
+    pages: Iterable[Tuple[str, bytes]],
+    maxsize: int = 64,
+    lowercase: bool = False,
+    stems: StemCache = None,
+) -> Tuple[Dict[str, int], Pipeline]:
+    """
+    Streams pages through reader view, tokenize and count
+    stages joined by bounded queues, giving the same counts as
+    running each stage over the whole category in turn
+
+    Parameters
+    ----------
+    pages : Iterable[Tuple[str, bytes]]
+        The (url, html) pairs, usually straight off a fetcher
+    maxsize : int
+        The most items waiting in front of any one stage
+    lowercase : bool
+        Lower case tokens before counting
+    stems : StemCache, optional
+        Stems kept across runs, by default kept for this call only
+
+    Returns
+    -------
+    Tuple[Dict[str, int], Pipeline]
+        The frequency vector and the finished pipeline, for its
+        throughput report
+    """
+    frequency_vector = Counter()
+
+    # Pages share their stems, so a word is stemmed once per stream
+    if stems is None:
+        stems = StemCache(None)
+
+    def _reader_view(page):
+        url, html = page
+        return {url: fast_extract_reader_view(html)}
+
+    def _tokenize(reader_view):
+        return unwrap_context_and_extract(reader_view, "words")
+
+    def _count(tokens):
+        frequency_vector.update(
+            raw_corpus_to_frequency_vector(tokens, lowercase, stems)
+        )
+
+    pipeline = Pipeline(
+        [
+            Stage("reader", _reader_view),
+            Stage("tokenize", _tokenize),
+            Stage("count", _count),
+        ],
+        maxsize=maxsize,
+    )
+    pipeline.run(page for page in pages if page[1] is not None)
+
+    return dict(frequency_vector), pipeline
@@ -1,7 +1,13 @@
 import json
 import os
-from typing import List
+from typing import Iterator, List
 from ..base import serial_bulk_query
+from ..utils import atomic_write
+from .indexlog import IndexLog, LazyIndex
+
+DEFAULT_INDEX_FILE = (
+    f"{os.path.dirname(os.path.realpath(__file__))}/indexed.jsonl"
+)
 
 
 class Indexer:
@@ -10,32 +16,63 @@ class Indexer:
     use when scraping very large datasets, works natively
     with dicts to get json output
 
+    A .jsonl index file is an append-only IndexLog, which each save
+    only adds the newly indexed links to, and which is loaded lazily,
+    a category at a time. Any other index file holds the whole index
+    as one json document, rewritten atomically on save
+
+    Close the indexer, or use it as a context manager, to close the
+    log's file and directory
+
     Parameters
     ----------
+    local_index : dict, optional
+        The index to start from
     index_file : str
         The root index file to cache the stuff to
     """
 
     def __init__(
         self,
-        local_index={},
-        index_file=f"{os.path.dirname(os.path.realpath(__file__))}/indexed.json",
+        local_index=None,
+        index_file=DEFAULT_INDEX_FILE,
     ):
         self.index_file = index_file
 
+        if local_index is None:
+            local_index = {}
+
         if not isinstance(local_index, dict):
             raise ValueError(f"expected index of type 'dict', got '{type(local_index)}'")
 
         self.local_index = local_index
 
+        self.log = (
+            IndexLog(index_file) if index_file.endswith(".jsonl") else None
+        )
+
+        # Links indexed since the last save, all a log has to write
+        self._pending = {}
+
+        if self.log is not None:
+            for category, links in local_index.items():
+                self._pending[category] = list(links)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        if self.log is not None:
+            self.log.close()
+
     def __repr__(self):
         print(f"out_file: {self.index_file}\n index: {repr(self.local_index)}")
 
     def index_from_list(self, records, category) -> None:
-        if category in self.local_index:
-            self.local_index[category].extend(records)
-        else:
-            self.local_index[category] = records
+        self.index(records, category)
 
     def index(self, links, category) -> None:
         if category in self.local_index:
@@ -43,13 +80,73 @@ class Indexer:
         else:
             self.local_index[category] = links
 
+        if self.log is not None:
+            self._pending.setdefault(category, []).extend(links)
+
     def deserialize_index_file(self) -> None:
-        with open(self.index_file, "r") as f:
-            self.local_index = json.load(f)
+        if self.log is None:
+            with open(self.index_file, "r") as f:
+                self.local_index = json.load(f)
+
+            return
+
+        # Categories are only read from the log once they are used
+        self.local_index = LazyIndex(self.log)
+
+        # Links indexed before loading are still to be saved
+        for category, links in self._pending.items():
+            if category in self.local_index:
+                self.local_index[category].extend(links)
+            else:
+                self.local_index[category] = list(links)
 
     def serialize_index_file(self, preserve_local_copy=False) -> None:
-        with open(self.index_file, "a") as f:
-            json.dump(self.local_index, f)
+        if self.log is not None:
+            for category, links in self._pending.items():
+                if links:
+                    self.log.append(category, links)
+
+            self._pending = {}
+        else:
+            atomic_write(
+                self.index_file, json.dumps(self.local_index).encode()
+            )
+
+        if not preserve_local_copy:
+            self.local_index = {}
+
+    def categories(self) -> List[str]:
+        return list(self.local_index)
+
+    def iter_links(self, category, batch_size=1000) -> Iterator[List[str]]:
+        """
+        Streams the links of a category in batches of batch_size,
+        straight from the index log when the category is not in memory
+
+        Parameters
+        ----------
+        category : str
+            The category to read
+        batch_size : int
+            The links per batch, the last batch may be shorter
+
+        Returns
+        -------
+        Iterator[List[str]]
+            The batches of links
+        """
+        if isinstance(self.local_index, LazyIndex):
+            yield from self.local_index.iter_links(category, batch_size)
+            return
+
+        links = self.local_index[category]
+
+        for i in range(0, len(links), batch_size):
+            yield links[i : i + batch_size]
 
-            if not preserve_local_copy:
-                self.local_index = {}
+    def compact_index_file(self) -> None:
+        """
+        Folds an index log down to one record per category
+        """
+        if self.log is not None:
+            self.log.compact()
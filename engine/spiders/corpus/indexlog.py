@@ -0,0 +1,509 @@
+"""
+The index log keeps the indexer's category links in an append-only
+JSON lines file, so adding links never rewrites what is already
+saved and a crash mid save never loses the rest of the index. A
+directory of where each category's records sit lets one category be
+read without parsing the others
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ..utils import atomic_write, truncate_torn_line
+
+logger = logging.getLogger(__name__)
+
+
+class IndexLog:
+    """
+    The index log stores one {"category", "links"} record per line.
+    Appends write and fsync a single line, so a crash loses at most
+    the record being written, whose torn line is skipped when the log
+    is read and cut off before the next append
+
+    Compaction folds the records into as few lines per category as
+    record_size allows, in a temporary file which then atomically
+    replaces the log
+
+    The directory, a sqlite file next to the log, holds the offset of
+    every record by category. It is derived from the log alone and
+    catches up with whatever was appended since it was last read, so
+    it survives crashes, compaction and other writers, and is rebuilt
+    when missing
+
+    Parameters
+    ----------
+    path : str
+        The log file
+    compact_after : int, optional
+        Records appended by this process after which the log is
+        compacted, None to only compact when asked
+    sync : bool
+        Whether to fsync each append
+    record_size : int
+        The most links written to one line, which bounds the memory
+        of streaming a category
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compact_after: Optional[int] = 1024,
+        sync: bool = True,
+        record_size: int = 10000,
+    ):
+        self.path = path
+        self.directory_path = f"{path}.idx"
+        self.compact_after = compact_after
+        self.sync = sync
+        self.record_size = record_size
+
+        self._lock = threading.Lock()
+        self._writer = None
+        self._appended = 0
+        self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def append(self, category: str, links: List[str]) -> None:
+        """
+        Adds links to the end of a category, writing them alone
+
+        Parameters
+        ----------
+        category : str
+            The category the links are filed under
+        links : List[str]
+            The links to add
+        """
+        data = _encode(category, list(links), self.record_size)
+
+        with self._lock:
+            writer = self._open_writer()
+            writer.write(data)
+            writer.flush()
+
+            if self.sync:
+                os.fsync(writer.fileno())
+
+            self._appended += 1
+            self._catch_up()
+            compact = (
+                self.compact_after is not None
+                and self._appended >= self.compact_after
+            )
+
+        if compact:
+            self.compact()
+
+    def records(self) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Reads the log back a line at a time
+
+        Returns
+        -------
+        Iterator[Tuple[str, List[str]]]
+            The (category, links) records in the order they were
+            appended, without torn or corrupt lines
+        """
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "rb") as f:
+            for line in f:
+                record = _parse(line)
+
+                if record is None:
+                    logger.info(f"Skipping bad index line in {self.path}")
+                    continue
+
+                yield record
+
+    def load(self) -> Dict[str, List[str]]:
+        """
+        Returns
+        -------
+        Dict[str, List[str]]
+            The links of every category, in the order they were added
+        """
+        index = OrderedDict()
+
+        for category, links in self.records():
+            index.setdefault(category, []).extend(links)
+
+        return dict(index)
+
+    def links(self, category: str) -> List[str]:
+        """
+        Reads one category, parsing only its own records
+        """
+        links = []
+
+        for batch in self.iter_links(category, self.record_size):
+            links.extend(batch)
+
+        return links
+
+    def iter_links(
+        self, category: str, batch_size: int = 1000
+    ) -> Iterator[List[str]]:
+        """
+        Streams one category's links, holding a record at a time
+
+        Parameters
+        ----------
+        category : str
+            The category to read
+        batch_size : int
+            The links per batch, the last batch may be shorter
+
+        Returns
+        -------
+        Iterator[List[str]]
+            The category's links in the order they were added
+        """
+        f, offsets = self._open_records(category)
+        batch = []
+
+        with f:
+            for offset, length in offsets:
+                f.seek(offset)
+                record = _parse(f.read(length))
+
+                if record is None:
+                    raise IOError(
+                        f"corrupt index record at {offset} in {self.path}"
+                    )
+
+                batch.extend(record[1])
+
+                while len(batch) >= batch_size:
+                    yield batch[:batch_size]
+                    batch = batch[batch_size:]
+
+        if batch:
+            yield batch
+
+    def has(self, category: str) -> bool:
+        with self._lock:
+            db = self._catch_up()
+            row = db.execute(
+                "SELECT 1 FROM records WHERE category = ? LIMIT 1", (category,)
+            ).fetchone()
+
+        return row is not None
+
+    def count(self, category: str) -> int:
+        with self._lock:
+            db = self._catch_up()
+            (count,) = db.execute(
+                "SELECT COALESCE(SUM(count), 0) FROM records"
+                " WHERE category = ?",
+                (category,),
+            ).fetchone()
+
+        return count
+
+    def categories(self) -> List[str]:
+        with self._lock:
+            db = self._catch_up()
+            rows = db.execute(
+                "SELECT category FROM records"
+                " GROUP BY category ORDER BY MIN(offset)"
+            ).fetchall()
+
+        return [category for (category,) in rows]
+
+    def compact(self) -> None:
+        """
+        Rewrites the log with each category's links in as few records
+        as record_size allows, atomically replacing the old file once
+        the new one is on disk
+        """
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+            lines = []
+            rows = []
+            offset = 0
+
+            for category, links in self.load().items():
+                for i in range(0, len(links), self.record_size):
+                    batch = links[i : i + self.record_size]
+                    line = _encode(category, batch, self.record_size)
+
+                    lines.append(line)
+                    rows.append((category, offset, len(line), len(batch)))
+                    offset += len(line)
+
+            atomic_write(self.path, b"".join(lines))
+            self._appended = 0
+
+            # We know where every record of the new file sits, so the
+            # directory is written from them instead of a rescan
+            db = self._connect()
+            db.execute("DELETE FROM records")
+            db.executemany(
+                "INSERT INTO records (category, offset, length, count)"
+                " VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("inode", os.stat(self.path).st_ino), ("covered", offset)],
+            )
+            db.commit()
+
+    def _open_records(self, category: str):
+        # Opens the log along with the offsets of a category's records,
+        # checking the directory describes the very file we opened
+        with self._lock:
+            db = self._catch_up()
+            offsets = db.execute(
+                "SELECT offset, length FROM records"
+                " WHERE category = ? ORDER BY offset",
+                (category,),
+            ).fetchall()
+
+            if not offsets:
+                return open(os.devnull, "rb"), []
+
+            f = open(self.path, "rb")
+
+            if os.fstat(f.fileno()).st_ino != self._meta(db)[0]:
+                f.close()
+                raise IOError(f"{self.path} was replaced while opening it")
+
+        return f, offsets
+
+    def _connect(self) -> sqlite3.Connection:
+        # Called holding the lock, opens the directory
+        if self._db is None:
+            self._db = sqlite3.connect(
+                self.directory_path, check_same_thread=False
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                " category TEXT NOT NULL,"
+                " offset INTEGER NOT NULL,"
+                " length INTEGER NOT NULL,"
+                " count INTEGER NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS records_category"
+                " ON records (category, offset)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS meta ("
+                " key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            self._db.commit()
+
+        return self._db
+
+    def _catch_up(self) -> sqlite3.Connection:
+        # Called holding the lock, brings the directory up to date with
+        # the log and returns it
+        db = self._connect()
+        inode, covered = self._meta(db)
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+
+        # A different file, or one cut shorter than what we indexed,
+        # was compacted or replaced, so index it afresh
+        if stat is None or stat.st_ino != inode or stat.st_size < covered:
+            if covered or inode:
+                db.execute("DELETE FROM records")
+
+            inode = stat.st_ino if stat is not None else 0
+            covered = 0
+
+        if stat is not None and stat.st_size > covered:
+            covered = self._scan(db, covered)
+
+        db.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [("inode", inode), ("covered", covered)],
+        )
+        db.commit()
+
+        return db
+
+    def _scan(self, db: sqlite3.Connection, offset: int) -> int:
+        # Indexes the complete lines from offset on, returning where
+        # the last of them ends
+        rows = []
+
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+
+                record = _parse(line)
+
+                if record is not None:
+                    rows.append((record[0], offset, len(line), len(record[1])))
+
+                offset += len(line)
+
+        db.executemany(
+            "INSERT INTO records (category, offset, length, count)"
+            " VALUES (?, ?, ?, ?)",
+            rows,
+        )
+
+        return offset
+
+    def _meta(self, db: sqlite3.Connection) -> Tuple[int, int]:
+        meta = dict(db.execute("SELECT key, value FROM meta").fetchall())
+
+        return meta.get("inode", 0), meta.get("covered", 0)
+
+    def _open_writer(self):
+        # Called holding the lock
+        if self._writer is None:
+            if os.path.exists(self.path):
+                truncate_torn_line(self.path)
+
+            self._writer = open(self.path, "ab")
+
+        return self._writer
+
+
+def _encode(category: str, links: List[str], record_size: int) -> bytes:
+    # One line per record_size links
+    return b"".join(
+        (
+            json.dumps(
+                {"category": category, "links": links[i : i + record_size]}
+            )
+            + "\n"
+        ).encode("utf-8")
+        for i in range(0, len(links), record_size)
+    )
+
+
+def _parse(line: bytes) -> Optional[Tuple[str, List[str]]]:
+    # A line without its newline was cut short by a crash
+    if not line.endswith(b"\n"):
+        return None
+
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+
+    if not isinstance(record, dict) or "category" not in record:
+        return None
+
+    return record["category"], record.get("links", [])
+
+
+class LazyIndex(MutableMapping):
+    """
+    A category to links mapping over an index log, which reads each
+    category from the log the first time it is asked for and keeps
+    it in memory from then on
+
+    Parameters
+    ----------
+    log : IndexLog
+        The log to read categories from
+    """
+
+    def __init__(self, log: IndexLog):
+        self.log = log
+
+        self._loaded = {}
+        self._deleted = set()
+
+    def __repr__(self):
+        return (
+            f"<LazyIndex(path={self.log.path}, loaded={list(self._loaded)})>"
+        )
+
+    def __getitem__(self, category: str) -> List[str]:
+        if category not in self._loaded:
+            if category not in self:
+                raise KeyError(category)
+
+            self._loaded[category] = self.log.links(category)
+
+        return self._loaded[category]
+
+    def __setitem__(self, category: str, links: List[str]) -> None:
+        self._loaded[category] = links
+        self._deleted.discard(category)
+
+    def __delitem__(self, category: str) -> None:
+        if category not in self:
+            raise KeyError(category)
+
+        self._loaded.pop(category, None)
+        self._deleted.add(category)
+
+    def __contains__(self, category) -> bool:
+        if category in self._loaded:
+            return True
+
+        return category not in self._deleted and self.log.has(category)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._loaded
+
+        for category in self.log.categories():
+            if category not in self._loaded and category not in self._deleted:
+                yield category
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def is_loaded(self, category: str) -> bool:
+        return category in self._loaded
+
+    def iter_links(
+        self, category: str, batch_size: int = 1000
+    ) -> Iterator[List[str]]:
+        """
+        Streams a category in batches, straight from the log unless it
+        is already in memory
+        """
+        if category in self._loaded:
+            links = self._loaded[category]
+
+            for i in range(0, len(links), batch_size):
+                yield links[i : i + batch_size]
+
+            return
+
+        if category not in self:
+            raise KeyError(category)
+
+        yield from self.log.iter_links(category, batch_size)
@@ -0,0 +1,219 @@
+"""
+The pipeline connects crawl stages with bounded queues so pages
+flow through one at a time, every stage works concurrently and a
+slow stage holds back the ones feeding it
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+# Sentinel passed down a queue once its producers are finished
+_DONE = object()
+
+
+class Stage:
+    """
+    A stage applies its function to each item coming through and
+    passes the result on, dropping items the function returns
+    None for
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage in throughput reports
+    fn : Callable[[Any], Any]
+        The per item function
+    workers : int
+        The number of threads running fn
+    """
+
+    def __init__(self, name: str, fn: Callable[[Any], Any], workers: int = 1):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+
+        self.processed = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float, failed: bool = False) -> None:
+        with self._lock:
+            self.processed += 1
+            self.busy += elapsed
+
+            if failed:
+                self.failed += 1
+
+    def record_blocked(self, elapsed: float) -> None:
+        # Time spent waiting on a full queue downstream
+        with self._lock:
+            self.blocked += elapsed
+
+    def report(self, wall: float) -> Dict[str, Any]:
+        return {
+            "stage": self.name,
+            "processed": self.processed,
+            "failed": self.failed,
+            "busy_seconds": round(self.busy, 3),
+            "blocked_seconds": round(self.blocked, 3),
+            "items_per_second": (
+                round(self.processed / wall, 2) if wall else 0.0
+            ),
+        }
+
+
+class Pipeline:
+    """
+    The pipeline runs a source iterator and a chain of stages on
+    their own threads, with a bounded queue in front of each stage
+
+    Parameters
+    ----------
+    stages : List[Stage]
+        The stages in order, the last one acting as the sink
+    maxsize : int
+        The most items waiting in front of any one stage
+    source_name : str
+        The name of the source in throughput reports
+    """
+
+    def __init__(
+        self, stages: List[Stage], maxsize: int = 64, source_name="fetch"
+    ):
+        self.source = Stage(source_name, None)
+        self.stages = stages
+        self.maxsize = maxsize
+        self.wall = 0.0
+
+        self._error = None
+
+    def run(self, source: Iterable[Any]) -> List[Dict[str, Any]]:
+        """
+        Pushes every item of the source through the stages and waits
+        for the last one to drain
+
+        Parameters
+        ----------
+        source : Iterable[Any]
+            The items to feed the first stage, pulled lazily
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            The throughput report of the source and every stage
+        """
+        queues = [queue.Queue(self.maxsize) for _ in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        lock = threading.Lock()
+        threads = []
+
+        def _finish(index: int):
+            # The last worker out of a stage closes the next queue
+            with lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+
+            if last and index + 1 < len(self.stages):
+                for _ in range(self.stages[index + 1].workers):
+                    queues[index + 1].put(_DONE)
+
+        def _put(stage: Stage, outbox: queue.Queue, item: Any):
+            start = time.perf_counter()
+            outbox.put(item)
+            stage.record_blocked(time.perf_counter() - start)
+
+        def _feed():
+            iterator = iter(source)
+
+            try:
+                while True:
+                    start = time.perf_counter()
+
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+
+                    self.source.record(time.perf_counter() - start)
+                    _put(self.source, queues[0], item)
+            except Exception as e:
+                self._error = e
+                logger.info(f"{self.source.name} made an exception: {e}")
+            finally:
+                for _ in range(self.stages[0].workers):
+                    queues[0].put(_DONE)
+
+        def _work(index: int):
+            stage = self.stages[index]
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+
+            while True:
+                item = inbox.get()
+
+                if item is _DONE:
+                    return _finish(index)
+
+                start = time.perf_counter()
+
+                try:
+                    result = stage.fn(item)
+                except Exception as e:
+                    stage.record(time.perf_counter() - start, failed=True)
+                    logger.info(f"{stage.name} made an exception: {e}")
+                    continue
+
+                stage.record(time.perf_counter() - start)
+
+                if outbox is not None and result is not None:
+                    _put(stage, outbox, result)
+
+        start = time.perf_counter()
+
+        threads.append(threading.Thread(target=_feed, daemon=True))
+
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                threads.append(
+                    threading.Thread(target=_work, args=(index,), daemon=True)
+                )
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.wall = time.perf_counter() - start
+
+        if self._error is not None:
+            raise self._error
+
+        return self.report()
+
+    def report(self) -> List[Dict[str, Any]]:
+        return [
+            stage.report(self.wall) for stage in [self.source, *self.stages]
+        ]
+
+    def format_report(self) -> str:
+        lines = [f"pipeline wall time: {self.wall:.2f}s"]
+
+        for row in self.report():
+            lines.append(
+                f"  {row['stage']:<10} {row['processed']:>8} items"
+                f" {row['failed']:>6} failed"
+                f" {row['busy_seconds']:>10.2f}s busy"
+                f" {row['blocked_seconds']:>10.2f}s blocked"
+                f" {row['items_per_second']:>10.2f} items/s"
+            )
+
+        return "\n".join(lines)
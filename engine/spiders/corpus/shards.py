@@ -0,0 +1,292 @@
+"""
+Shards split a category's links between workers by the host they
+point at, so each worker or machine crawls its own hosts under its
+own politeness and the outputs merge back without any coordination
+beyond agreeing on the shard count
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import urllib.parse
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Mapping, Tuple
+
+from ..frontier import canonicalize_url
+from ..utils import atomic_write
+from .indexer import Indexer
+from .indexlog import IndexLog
+from .store import PageStore
+
+
+def shard_key(url: str) -> str:
+    """
+    The host of a url's canonical form, which decides its shard.
+    Every scheme and port of a host land together, so no two
+    workers ever crawl the same server. A url whose host cannot be
+    parsed has the empty key
+    """
+    try:
+        return urllib.parse.urlsplit(canonicalize_url(url)).hostname or ""
+    except ValueError:
+        return ""
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hashing (Lamping and Veach), which maps a 64 bit
+    key to one of buckets. Going from n to n + 1 buckets moves only
+    the 1 / (n + 1) of keys which belong in the new one
+
+    Parameters
+    ----------
+    key : int
+        The key, as an unsigned 64 bit integer
+    buckets : int
+        The number of buckets
+
+    Returns
+    -------
+    int
+        The bucket, from 0 to buckets - 1
+    """
+    if buckets < 1:
+        raise ValueError(f"expected at least one bucket, got {buckets}")
+
+    bucket, jump = -1, 0
+
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+
+    return bucket
+
+
+def shard_of(url: str, shards: int) -> int:
+    """
+    The shard a url belongs to out of shards, the same on every
+    machine and in every run
+    """
+    digest = hashlib.blake2b(shard_key(url).encode("utf-8"), digest_size=8)
+
+    return jump_hash(int.from_bytes(digest.digest(), "big"), shards)
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """
+    Reads a shard written as 'I/N', the I-th of N counting from 0
+    """
+    try:
+        shard, shards = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"expected a shard like '0/4', got '{value}'")
+
+    if not 0 <= shard < shards:
+        raise ValueError(f"shard {shard} is not one of {shards}")
+
+    return shard, shards
+
+
+def shard_links(
+    links: Iterable[str], shard: int, shards: int
+) -> Iterator[str]:
+    """
+    Streams the links which fall in one shard, in their original order
+    """
+    for url in links:
+        if shard_of(url, shards) == shard:
+            yield url
+
+
+def shard_path(directory: str, category: str, shard: int, shards: int) -> str:
+    return os.path.join(
+        directory, f"{category}.shard-{shard}-of-{shards}.jsonl"
+    )
+
+
+def split_category(
+    indexer: Indexer,
+    category: str,
+    shards: int,
+    directory: str,
+    batch_size: int = 1000,
+) -> List[str]:
+    """
+    Writes a category out as one index log per shard, each a complete
+    index file a worker can open with Indexer(index_file=path). The
+    category is streamed, so it is never held in memory whole
+
+    Parameters
+    ----------
+    indexer : Indexer
+        The loaded indexer
+    category : str
+        The category to split
+    shards : int
+        The number of shards
+    directory : str
+        The folder the shard index files are written to
+    batch_size : int
+        Links read from the index at a time
+
+    Returns
+    -------
+    List[str]
+        The shard index files, in shard order
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    paths = [shard_path(directory, category, i, shards) for i in range(shards)]
+
+    # Splitting again starts each shard over rather than appending
+    for path in paths:
+        for stale in (path, f"{path}.idx"):
+            if os.path.exists(stale):
+                os.unlink(stale)
+
+    logs = [IndexLog(path, compact_after=None) for path in paths]
+
+    try:
+        for batch in indexer.iter_links(category, batch_size):
+            parts = [[] for _ in range(shards)]
+
+            for url in batch:
+                parts[shard_of(url, shards)].append(url)
+
+            for log, links in zip(logs, parts):
+                if links:
+                    log.append(category, links)
+
+        for log in logs:
+            log.compact()
+    finally:
+        for log in logs:
+            log.close()
+
+    return paths
+
+
+def merge_frequency_vectors(
+    vectors: Iterable[Mapping[str, int]]
+) -> Dict[str, int]:
+    """
+    Sums the frequency vectors of the shards of a category
+
+    Returns
+    -------
+    Dict[str, int]
+        The category's frequency vector, ordered by token so the
+        same shard outputs always serialize to the same file
+    """
+    total = Counter()
+
+    for vector in vectors:
+        total.update(vector)
+
+    return {token: total[token] for token in sorted(total)}
+
+
+def merge_frequency_files(paths: List[str], output: str) -> Dict[str, int]:
+    """
+    Merges shard frequency vector files into one, written atomically
+    """
+    vectors = []
+
+    for path in paths:
+        with open(path, "r") as f:
+            vectors.append(json.load(f))
+
+    merged = merge_frequency_vectors(vectors)
+    atomic_write(output, json.dumps(merged).encode())
+
+    return merged
+
+
+def merge_page_stores(sources: Iterable[PageStore], target: PageStore) -> int:
+    """
+    Copies the pages of shard stores into one store. Stores are taken
+    in the order given and each is read in its on-disk order, and a
+    url already in the target keeps its first body, so merging the
+    same shards always builds the same store
+
+    Parameters
+    ----------
+    sources : Iterable[PageStore]
+        The shard stores, in shard order
+    target : PageStore
+        The store to merge into
+
+    Returns
+    -------
+    int
+        The number of pages copied
+    """
+    copied = 0
+
+    for source in sources:
+        for url, body in source.items():
+            if url in target:
+                continue
+
+            target.put(url, body)
+            copied += 1
+
+    return copied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Splits a category into shards and merges their outputs"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    split = commands.add_parser(
+        "split", help="Write a category out as one index file per shard"
+    )
+    split.add_argument("category", help="The indexer category to split")
+    split.add_argument("shards", type=int, help="The number of shards")
+    split.add_argument("directory", help="The folder to write the shards to")
+
+    merge_freq = commands.add_parser(
+        "merge-freq", help="Sum shard frequency vector files"
+    )
+    merge_freq.add_argument("output", help="The merged frequency vector file")
+    merge_freq.add_argument("inputs", nargs="+", help="The shard files")
+
+    merge_stores = commands.add_parser(
+        "merge-stores", help="Copy shard page stores into one"
+    )
+    merge_stores.add_argument("output", help="The merged page store folder")
+    merge_stores.add_argument("inputs", nargs="+", help="The shard folders")
+
+    args = parser.parse_args()
+
+    if args.command == "split":
+        with Indexer() as indexer:
+            indexer.deserialize_index_file()
+            paths = split_category(
+                indexer, args.category, args.shards, args.directory
+            )
+
+        for path in paths:
+            with IndexLog(path) as log:
+                print(f"{path}: {log.count(args.category)} links")
+    elif args.command == "merge-freq":
+        merged = merge_frequency_files(args.inputs, args.output)
+        print(f"{args.output}: {len(merged)} tokens")
+    else:
+        sources = []
+
+        try:
+            with PageStore(args.output) as target:
+                for path in args.inputs:
+                    sources.append(PageStore(path))
+
+                copied = merge_page_stores(sources, target)
+        finally:
+            for source in sources:
+                source.close()
+
+        print(f"{args.output}: {copied} pages copied")
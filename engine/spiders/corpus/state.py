@@ -0,0 +1,416 @@
+"""
+The crawl state remembers what every url looked like the last time
+we fetched it, so a recrawl only fetches new and stale urls and
+only recounts the pages whose content actually changed
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+from collections.abc import Mapping
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+from ..metrics import RequestTiming
+from ..retry import RETRY_STATUSES
+from ..transfer import (
+    DEFAULT_MAX_BODY,
+    HTML_CONTENT_TYPES,
+    open_url,
+    read_response,
+)
+from .counts import CountStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_FILE = (
+    f"{os.path.dirname(os.path.realpath(__file__))}/state.sqlite3"
+)
+
+# Seconds before a fetched url is due to be fetched again
+DEFAULT_REVISIT = 24 * 60 * 60
+
+
+class UrlState:
+    """
+    What we know about a url from its last fetch
+
+    Parameters
+    ----------
+    url : str
+        The url
+    status : int
+        The status of the last response, None if it never answered
+    fetched : float
+        The unix time of the last 200 or 304, None if never
+    etag : str
+        The ETag of the last full response, if any
+    last_modified : str
+        The Last-Modified of the last full response, if any
+    sha256 : str
+        The hex digest of the last body downloaded
+    """
+
+    def __init__(
+        self,
+        url: str,
+        status: Optional[int],
+        fetched: Optional[float],
+        etag: Optional[str],
+        last_modified: Optional[str],
+        sha256: Optional[str],
+    ):
+        self.url = url
+        self.status = status
+        self.fetched = fetched
+        self.etag = etag
+        self.last_modified = last_modified
+        self.sha256 = sha256
+
+    def __repr__(self):
+        return (
+            f"<UrlState(url={self.url}, status={self.status}, "
+            f"fetched={self.fetched})>"
+        )
+
+    @property
+    def gone(self) -> bool:
+        """
+        Whether the last response said the url is gone for good, a
+        4xx other than those worth retrying like 429
+        """
+        return (
+            self.status is not None
+            and 400 <= self.status < 500
+            and self.status not in RETRY_STATUSES
+        )
+
+    def validators(self) -> Dict[str, str]:
+        headers = {}
+
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+
+        return headers
+
+
+class CrawlState:
+    """
+    The crawl state keeps the fetch state of each url in a sqlite
+    file. Which body of each url is counted under a category, and the
+    category totals, are kept by a CountStore, so incremental runs
+    and the page store's counts share one set of counts
+
+    It reads urls the way a ResponseCache does, so it can be handed to
+    the fetchers as their cache. Stored validators are only sent when
+    pages holds the body a 304 would stand for
+
+    Parameters
+    ----------
+    path : str
+        The sqlite file to keep the state in
+    pages : Mapping[str, bytes], optional
+        The bodies of earlier fetches, like a PageStore, read back
+        when the server answers 304
+    counts : CountStore, optional
+        The page counts, such as those next to the page store, by
+        default kept in the state's own file
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_STATE_FILE,
+        pages: Mapping = None,
+        counts: CountStore = None,
+    ):
+        self.path = path
+        self.pages = pages
+
+        self._owns_counts = counts is None
+        self.count_store = CountStore(path) if counts is None else counts
+
+        self.fetched = 0
+        self.not_modified = 0
+        self.removed = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            " url TEXT PRIMARY KEY,"
+            " status INTEGER,"
+            " fetched REAL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " sha256 TEXT)"
+        )
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def __contains__(self, url: str):
+        return self.get(url) is not None
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+        if self._owns_counts:
+            self.count_store.close()
+
+    def get(self, url: str) -> Optional[UrlState]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, fetched, etag, last_modified, sha256"
+                " FROM urls WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+        return None if row is None else UrlState(url, *row)
+
+    def due(
+        self,
+        urls: Iterable[str],
+        category: str,
+        revisit: float = DEFAULT_REVISIT,
+    ) -> List[str]:
+        """
+        Picks the urls worth fetching this run
+
+        Parameters
+        ----------
+        urls : Iterable[str]
+            The urls of the category
+        category : str
+            The category they are counted under
+        revisit : float
+            Seconds after which a fetched url is fetched again
+
+        Returns
+        -------
+        List[str]
+            The urls never fetched, fetched more than revisit seconds
+            ago, or whose current content is not counted in category
+            yet, in their original order
+        """
+        cutoff = time.time() - revisit
+        urls = list(dict.fromkeys(urls))
+        current = set()
+
+        # Only the asked for urls are looked up, in chunks which stay
+        # under sqlite's limit on query parameters
+        for i in range(0, len(urls), 500):
+            chunk = urls[i : i + 500]
+
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT url, sha256 FROM urls"
+                    f" WHERE url IN ({', '.join('?' * len(chunk))})"
+                    " AND fetched > ?",
+                    (*chunk, cutoff),
+                ).fetchall()
+
+            counted = self.count_store.digests(category, chunk)
+            current.update(
+                url
+                for url, digest in rows
+                if digest is not None and counted.get(url) == digest
+            )
+
+        return [url for url in urls if url not in current]
+
+    def changed(self, url: str, category: str) -> bool:
+        """
+        Whether the last body read from url differs from the one
+        counted under category
+        """
+        entry = self.get(url)
+
+        return (
+            entry is None
+            or entry.sha256 is None
+            or entry.sha256 != self.count_store.member(category, url)
+        )
+
+    def read(
+        self,
+        url: str,
+        timeout: int = 30,
+        max_body: Optional[int] = DEFAULT_MAX_BODY,
+        content_types: Optional[FrozenSet[str]] = HTML_CONTENT_TYPES,
+        timing: RequestTiming = None,
+    ) -> bytes:
+        """
+        Reads a url, conditionally when we hold its last body, and
+        records the response
+
+        Parameters
+        ----------
+        url : str
+            The url to read
+        timeout : int
+            Seconds allowed for the request
+        max_body : int, optional
+            The most decompressed bytes read, None to read any size
+        content_types : FrozenSet[str], optional
+            The media types accepted, None to accept any
+        timing : RequestTiming, optional
+            Given the status, time to first byte and bytes
+            downloaded, which stay 0 when the body comes from pages
+
+        Returns
+        -------
+        bytes
+            The response body
+        """
+        entry = self.get(url)
+        headers = {}
+
+        if entry is not None and self.pages is not None and url in self.pages:
+            headers = entry.validators()
+
+        try:
+            response = open_url(url, timeout, headers)
+        except urllib.error.HTTPError as e:
+            if timing is not None:
+                timing.responded(e.code)
+
+            if e.code == 304 and headers:
+                self._record(url, 304)
+                self.not_modified += 1
+                return self.pages[url]
+
+            self._record(url, e.code)
+            raise
+
+        if timing is not None:
+            timing.responded(response.status)
+
+        body = read_response(response, max_body, content_types, timing)
+        self._record(url, response.status, response.headers, body)
+        self.fetched += 1
+
+        return body
+
+    def counts(self, url: str, category: str) -> Optional[Dict[str, int]]:
+        """
+        The token counts url contributes to category, None if it was
+        never counted
+        """
+        digest = self.count_store.member(category, url)
+
+        return None if digest is None else self.count_store.get(digest)
+
+    def count(self, url: str, category: str, counts: Dict[str, int]) -> None:
+        """
+        Swaps the counts url contributes to category for those of its
+        last body, moving the category totals by the difference
+
+        Parameters
+        ----------
+        url : str
+            The url counted
+        category : str
+            The category it is counted under
+        counts : Dict[str, int]
+            The token counts of its last body
+        """
+        entry = self.get(url)
+
+        if entry is None or entry.sha256 is None:
+            raise KeyError(f"{url} has not been fetched")
+
+        self.count_store.put(entry.sha256, counts)
+        self.count_store.add(category, url, entry.sha256)
+
+    def counted(self, url: str) -> Optional[Dict[str, int]]:
+        """
+        The token counts of url's last body if that body was counted
+        before, under any url or category
+        """
+        entry = self.get(url)
+
+        if entry is None or entry.sha256 is None:
+            return None
+
+        return self.count_store.get(entry.sha256)
+
+    def uncount(self, url: str, category: str) -> bool:
+        """
+        Takes the counts url contributes to category back out of the
+        category totals
+
+        Returns
+        -------
+        bool
+            Whether url was counted under category
+        """
+        removed = self.count_store.remove(category, url)
+        self.removed += removed
+
+        return removed
+
+    def retain(self, category: str, urls: Iterable[str]) -> int:
+        """
+        Uncounts every url counted under category which is not among
+        urls, like the links the category holds now
+
+        Returns
+        -------
+        int
+            The number of urls uncounted
+        """
+        stale = set(self.count_store.members(category))
+        stale.difference_update(urls)
+
+        return sum(self.uncount(url, category) for url in sorted(stale))
+
+    def totals(self, category: str) -> Dict[str, int]:
+        """
+        The token counts of every page counted under category
+        """
+        return self.count_store.totals(category)
+
+    def _record(
+        self, url: str, status: int, headers=None, body: bytes = None
+    ) -> None:
+        now = time.time()
+
+        with self._lock:
+            if body is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO urls"
+                    " (url, status, fetched, etag, last_modified, sha256)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        url,
+                        status,
+                        now,
+                        headers.get("etag"),
+                        headers.get("last-modified"),
+                        hashlib.sha256(body).hexdigest(),
+                    ),
+                )
+            elif status == 304:
+                self._db.execute(
+                    "UPDATE urls SET status = ?, fetched = ? WHERE url = ?",
+                    (status, now, url),
+                )
+            else:
+                # Failures keep the last good fetch, so the url stays due
+                self._db.execute(
+                    "INSERT INTO urls (url, status) VALUES (?, ?)"
+                    " ON CONFLICT (url)"
+                    " DO UPDATE SET status = excluded.status",
+                    (url, status),
+                )
+
+            self._db.commit()
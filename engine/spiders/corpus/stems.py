@@ -0,0 +1,127 @@
+"""
+The stem cache remembers the stem of every token type it has seen,
+in memory and in a sqlite file, so each distinct word is put through
+the stemmer once rather than once per occurrence and once per run
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable
+
+from nltk.stem import SnowballStemmer
+
+DEFAULT_STEM_CACHE_FILE = (
+    f"{os.path.dirname(os.path.realpath(__file__))}/stems.sqlite3"
+)
+
+
+class StemCache:
+    """
+    The stem cache maps tokens to their Snowball stems, looking up
+    types it has not seen in this process in its sqlite file and
+    stemming only those it has never seen at all
+
+    Parameters
+    ----------
+    path : str, optional
+        The sqlite file to keep stems in, None to only keep them in
+        memory
+    language : str
+        The Snowball stemmer language, stems of other languages in the
+        same file are kept apart
+    """
+
+    def __init__(
+        self, path: str = DEFAULT_STEM_CACHE_FILE, language: str = "english"
+    ):
+        self.path = path
+        self.language = language
+
+        self.stemmed = 0
+
+        self._stemmer = SnowballStemmer(language)
+        self._memo = {}
+        self._lock = threading.Lock()
+        self._db = None
+
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS stems ("
+                " language TEXT NOT NULL,"
+                " token TEXT NOT NULL,"
+                " stem TEXT NOT NULL,"
+                " PRIMARY KEY (language, token))"
+            )
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._memo)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stem(self, token: str) -> str:
+        return self.stem_all([token])[token]
+
+    def stem_all(self, tokens: Iterable[str]) -> Dict[str, str]:
+        """
+        Stems a batch of distinct tokens
+
+        Parameters
+        ----------
+        tokens : Iterable[str]
+            The token types to stem
+
+        Returns
+        -------
+        Dict[str, str]
+            The stem of each token
+        """
+        tokens = set(tokens)
+
+        with self._lock:
+            missing = [token for token in tokens if token not in self._memo]
+
+            if self._db is not None:
+                # Chunks stay under sqlite's limit on query parameters
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i : i + 500]
+                    self._memo.update(
+                        self._db.execute(
+                            "SELECT token, stem FROM stems WHERE language = ?"
+                            f" AND token IN ({', '.join('?' * len(chunk))})",
+                            (self.language, *chunk),
+                        ).fetchall()
+                    )
+
+            new = {
+                token: self._stemmer.stem(token)
+                for token in missing
+                if token not in self._memo
+            }
+            self._memo.update(new)
+            self.stemmed += len(new)
+
+            if self._db is not None and new:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO stems (language, token, stem)"
+                    " VALUES (?, ?, ?)",
+                    [
+                        (self.language, token, stem)
+                        for token, stem in new.items()
+                    ],
+                )
+                self._db.commit()
+
+            return {token: self._memo[token] for token in tokens}
@@ -0,0 +1,255 @@
+"""
+The page store keeps fetched pages on disk in append-only,
+compressed segment files, storing each distinct body once under
+its content hash
+"""
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from collections.abc import Mapping
+from typing import Iterable, Iterator, Tuple
+
+from ..utils import truncate_torn_line
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = f"{os.path.dirname(os.path.realpath(__file__))}/pages"
+
+# magic, sha256 digest, compressed length
+RECORD_HEADER = struct.Struct(">4s32sQ")
+RECORD_MAGIC = b"HPS1"
+
+
+class PageStore(Mapping):
+    """
+    The page store is a read-only mapping of url to page body backed
+    by compressed segment files. Pages are added with put and read
+    back lazily, so only the small offset index lives in memory
+
+    Parameters
+    ----------
+    directory : str
+        The folder holding the segments and the offset index
+    segment_size : int
+        Bytes a segment may grow to before a new one is started
+    level : int
+        The zlib compression level of stored bodies
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_STORE_DIR,
+        segment_size: int = 256 * 1024 * 1024,
+        level: int = 6,
+    ):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.level = level
+
+        # url -> sha256, and sha256 -> (segment, offset, length)
+        self._urls = {}
+        self._blobs = {}
+
+        self._lock = threading.Lock()
+        self._readers = {}
+        self._writer = None
+        self._segment = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def __getitem__(self, url: str) -> bytes:
+        return self._read_blob(self._urls[url])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._urls)
+
+    def __len__(self):
+        return len(self._urls)
+
+    def __contains__(self, url):
+        return url in self._urls
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def blob_count(self) -> int:
+        return len(self._blobs)
+
+    def digest(self, url: str) -> str:
+        return self._urls[url]
+
+    def items(self) -> Iterator[Tuple[str, bytes]]:
+        """
+        Reads every page back in on-disk order, so the segments are
+        scanned front to back instead of seeking around
+
+        Returns
+        -------
+        Iterator[Tuple[str, bytes]]
+            The (url, body) pairs
+        """
+        ordered = sorted(
+            self._urls.items(), key=lambda item: self._blobs[item[1]][:2]
+        )
+
+        for url, digest in ordered:
+            yield url, self._read_blob(digest)
+
+    def put(self, url: str, body: bytes) -> str:
+        """
+        Stores a page, writing its body only when no page with the
+        same content has been stored before
+
+        Parameters
+        ----------
+        url : str
+            The url the page was read from
+        body : bytes
+            The page body
+
+        Returns
+        -------
+        str
+            The sha256 hex digest of the body
+        """
+        digest = hashlib.sha256(body).hexdigest()
+
+        with self._lock:
+            if digest not in self._blobs:
+                self._blobs[digest] = self._append_blob(digest, body)
+
+            segment, offset, length = self._blobs[digest]
+            self._urls[url] = digest
+            self._index.write(
+                json.dumps(
+                    {
+                        "url": url,
+                        "sha256": digest,
+                        "segment": segment,
+                        "offset": offset,
+                        "length": length,
+                    }
+                )
+                + "\n"
+            )
+            self._index.flush()
+
+        return digest
+
+    def put_all(self, pages: Iterable[Tuple[str, bytes]]) -> "PageStore":
+        """
+        Streams (url, body) pairs into the store, skipping failed
+        pages which come through as None
+
+        Parameters
+        ----------
+        pages : Iterable[Tuple[str, bytes]]
+            The pages to store, usually straight off a fetcher
+
+        Returns
+        -------
+        PageStore
+            The store itself
+        """
+        for url, body in pages:
+            if body is not None:
+                self.put(url, body)
+
+        return self
+
+    def close(self) -> None:
+        with self._lock:
+            for reader in self._readers.values():
+                reader.close()
+
+            self._readers.clear()
+
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+            self._index.close()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment:05d}.bin")
+
+    def _load_index(self) -> None:
+        index_path = os.path.join(self.directory, "index.jsonl")
+
+        if os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid write
+                        logger.info(f"Skipping bad index line in {index_path}")
+                        continue
+
+                    digest = entry["sha256"]
+                    self._urls[entry["url"]] = digest
+                    self._blobs[digest] = (
+                        entry["segment"],
+                        entry["offset"],
+                        entry["length"],
+                    )
+                    self._segment = max(self._segment, entry["segment"])
+
+            # Appending after a torn line would tear the next entry too
+            truncate_torn_line(index_path)
+
+        self._index = open(index_path, "a")
+
+    def _append_blob(self, digest: str, body: bytes) -> Tuple[int, int, int]:
+        data = zlib.compress(body, self.level)
+
+        if self._writer is None:
+            self._writer = open(self._segment_path(self._segment), "ab")
+
+        if self._writer.tell() and (
+            self._writer.tell() + RECORD_HEADER.size + len(data)
+            > self.segment_size
+        ):
+            self._writer.close()
+            self._segment += 1
+            self._writer = open(self._segment_path(self._segment), "ab")
+
+        offset = self._writer.tell()
+        self._writer.write(
+            RECORD_HEADER.pack(RECORD_MAGIC, bytes.fromhex(digest), len(data))
+        )
+        self._writer.write(data)
+        self._writer.flush()
+
+        return self._segment, offset, len(data)
+
+    def _read_blob(self, digest: str) -> bytes:
+        segment, offset, length = self._blobs[digest]
+
+        with self._lock:
+            if segment not in self._readers:
+                self._readers[segment] = open(
+                    self._segment_path(segment), "rb"
+                )
+
+            reader = self._readers[segment]
+            reader.seek(offset)
+            header = reader.read(RECORD_HEADER.size)
+            data = reader.read(length)
+
+        magic, stored_digest, stored_length = RECORD_HEADER.unpack(header)
+
+        if magic != RECORD_MAGIC or stored_digest.hex() != digest:
+            raise IOError(f"corrupt page record in segment {segment}")
+
+        return zlib.decompress(data)
@@ -0,0 +1,227 @@
+"""
+The vocab format stores a frequency vector as flat arrays instead of
+a JSON object, so a model can open a vocabulary of millions of words
+without building a dict of them. Tokens are sorted by count, most
+frequent first, which makes a token's index its frequency rank
+
+A .vocab file is, little endian throughout
+
+    header   magic 'HVC1', version u4, token count n u8, string
+             table length u8, reserved u8
+    offsets  u8[n + 1], where token i sits in the string table
+    counts   u8[n]
+    strings  the UTF-8 tokens back to back
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Iterator, Mapping
+
+from ..utils import atomic_write
+
+try:
+    import numpy as np
+except ImportError:
+    # The writer only needs the standard library, reading maps the
+    # arrays through numpy
+    np = None
+
+# magic, version, token count, string table length, reserved
+HEADER = struct.Struct("<4sIQQQ")
+MAGIC = b"HVC1"
+VERSION = 1
+
+
+def encode_vocab(frequency_vector: Mapping[str, int]) -> bytes:
+    """
+    Lays a frequency vector out in the vocab format
+
+    Parameters
+    ----------
+    frequency_vector : Mapping[str, int]
+        The token counts
+
+    Returns
+    -------
+    bytes
+        The vocab file, tokens ordered by count and then by token, so
+        the same counts always give the same bytes
+    """
+    ranked = sorted(
+        frequency_vector.items(), key=lambda item: (-item[1], item[0])
+    )
+
+    offsets = array("Q", [0])
+    counts = array("Q")
+    strings = bytearray()
+
+    for token, count in ranked:
+        if count < 0:
+            raise ValueError(f"negative count {count} for '{token}'")
+
+        strings += token.encode("utf-8")
+        offsets.append(len(strings))
+        counts.append(count)
+
+    if sys.byteorder == "big":
+        offsets.byteswap()
+        counts.byteswap()
+
+    header = HEADER.pack(MAGIC, VERSION, len(counts), len(strings), 0)
+
+    return b"".join(
+        (header, offsets.tobytes(), counts.tobytes(), bytes(strings))
+    )
+
+
+def write_vocab(frequency_vector: Mapping[str, int], path: str) -> None:
+    """
+    Writes a frequency vector to a vocab file, atomically
+    """
+    atomic_write(path, encode_vocab(frequency_vector))
+
+
+class Vocab(Sequence):
+    """
+    A vocab file opened through numpy memmaps, so its arrays are paged
+    in from disk as they are read rather than copied into memory. It
+    is a sequence of tokens by frequency rank
+
+    Parameters
+    ----------
+    path : str
+        The vocab file
+    """
+
+    def __init__(self, path: str):
+        if np is None:
+            raise ImportError("reading vocab files needs numpy")
+
+        self.path = path
+
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+
+        if len(header) < HEADER.size:
+            raise IOError(f"{path} is not a vocab file")
+
+        magic, version, size, length, _ = HEADER.unpack(header)
+
+        if magic != MAGIC or version != VERSION:
+            raise IOError(f"{path} is not a version {VERSION} vocab file")
+
+        offset = HEADER.size
+        self.offsets = _memmap(path, "<u8", offset, size + 1)
+
+        offset += (size + 1) * 8
+        self.counts = _memmap(path, "<u8", offset, size)
+
+        offset += size * 8
+
+        if os.path.getsize(path) != offset + length:
+            raise IOError(f"{path} is truncated")
+
+        self.strings = _memmap(path, "u1", offset, length)
+
+        self._index = None
+
+    def __repr__(self):
+        return f"<Vocab(path={self.path}, size={len(self)})>"
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __getitem__(self, rank):
+        if isinstance(rank, slice):
+            return [self[i] for i in range(*rank.indices(len(self)))]
+
+        if rank < 0:
+            rank += len(self)
+
+        if not 0 <= rank < len(self):
+            raise IndexError(rank)
+
+        start, end = self.offsets[rank], self.offsets[rank + 1]
+
+        return self.strings[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        strings = memoryview(self.strings)
+        offsets = self.offsets.tolist()
+
+        for start, end in zip(offsets, offsets[1:]):
+            yield strings[start:end].tobytes().decode("utf-8")
+
+    def frequency(self, rank: int) -> int:
+        return int(self.counts[rank])
+
+    def index(self, token: str) -> int:
+        """
+        The rank of a token, from a token to rank dict built on the
+        first lookup
+        """
+        if self._index is None:
+            self._index = {token: rank for rank, token in enumerate(self)}
+
+        try:
+            return self._index[token]
+        except KeyError:
+            raise ValueError(f"'{token}' is not in the vocab")
+
+    def __contains__(self, token) -> bool:
+        try:
+            self.index(token)
+        except ValueError:
+            return False
+
+        return True
+
+    def to_dict(self) -> Dict[str, int]:
+        """
+        The frequency vector, most frequent token first
+        """
+        return dict(zip(self, self.counts.tolist()))
+
+
+def _memmap(path: str, dtype: str, offset: int, size: int):
+    # numpy refuses to map zero bytes, an empty array stands in
+    if not size:
+        return np.zeros(0, dtype=dtype)
+
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(size,))
+
+
+def json_to_vocab(json_path: str, vocab_path: str) -> None:
+    """
+    Converts a freq.json frequency vector to a vocab file
+    """
+    with open(json_path, "r") as f:
+        write_vocab(json.load(f), vocab_path)
+
+
+def vocab_to_json(vocab_path: str, json_path: str) -> None:
+    """
+    Converts a vocab file back to a freq.json frequency vector
+    """
+    atomic_write(json_path, json.dumps(Vocab(vocab_path).to_dict()).encode())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Converts frequency vectors between JSON and vocab files"
+    )
+    parser.add_argument("source", help="A .json or .vocab file")
+    parser.add_argument("target", help="The file to write, of the other kind")
+    args = parser.parse_args()
+
+    if args.source.endswith(".vocab"):
+        vocab_to_json(args.source, args.target)
+    else:
+        json_to_vocab(args.source, args.target)
+
+    print(f"{args.source} -> {args.target}")
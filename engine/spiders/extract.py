@@ -0,0 +1,632 @@
+"""
+Extract contains page extractors which go straight from raw html
+to the compact data we keep, and a process pool runner for them so
+parsing scales with cores instead of being serialized by the GIL
+"""
+
+import concurrent.futures
+import html.parser
+import itertools
+import logging
+import multiprocessing
+import re
+import urllib.parse
+from typing import Any, Dict, Iterable, List, Pattern, Tuple, Union
+
+from bs4 import BeautifulSoup
+from bs4.builder import HTMLTreeBuilder
+from bs4.dammit import EntitySubstitution, UnicodeDammit
+
+from .base import make_summary
+
+logger = logging.getLogger(__name__)
+TAGS = ["h1", "h2", "h3", "h4", "h5", "h6", "h7", "p"]
+
+# What the soup tree builder does with tags, mirrored so the fast
+# reader view agrees with BeautifulSoup's element.text
+VOID_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS)
+PRESERVE_WHITESPACE_TAGS = frozenset(
+    HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS
+)
+STRING_CONTAINER_TAGS = frozenset(
+    getattr(HTMLTreeBuilder, "DEFAULT_STRING_CONTAINERS", {})
+)
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+NUMERIC_REFERENCE = re.compile(r"^([0-9a-fA-F]+)(.*)$")
+
+
+def extract_reader_view(html: bytes) -> List[str]:
+    doc = BeautifulSoup(html, features="html.parser")
+
+    return [element.text for element in doc.find_all(TAGS)]
+
+
+class ReaderViewParser(html.parser.HTMLParser):
+    """
+    A streaming reader view extractor which collects the text of
+    TAGS elements straight off the tokenizer, without building a
+    tree for the scripts, navigation and attributes we throw away
+
+    Parameters
+    ----------
+    tags : List[str]
+        The elements to collect the text of
+    """
+
+    def __init__(self, tags: List[str] = TAGS):
+        super().__init__(convert_charrefs=False)
+        self.tags = frozenset(tags)
+
+        # Text pieces of each matched element, in document order
+        self.texts = []
+
+        # Every open element as (name, index into texts or None)
+        self._stack = []
+        self._active = []
+        self._closed_void = []
+        self._data = []
+        self._preserve = 0
+        self._containers = 0
+
+    def result(self) -> List[str]:
+        self._flush()
+        return ["".join(pieces) for pieces in self.texts]
+
+    def handle_starttag(self, tag, attrs):
+        self._open(tag)
+
+        # html.parser sends no end event for <br> style void tags
+        if tag in VOID_TAGS:
+            self._close(tag)
+            self._closed_void.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._open(tag)
+        self._close(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self._closed_void:
+            self._closed_void.remove(tag)
+        else:
+            self._close(tag)
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_charref(self, name):
+        base = 16 if name[:1] in ("x", "X") else 10
+        digits = name[1:] if base == 16 else name
+        extra = ""
+
+        try:
+            number = int(digits, base)
+        except ValueError:
+            match = NUMERIC_REFERENCE.match(digits)
+
+            if match is None:
+                return self.handle_data(digits)
+
+            number, extra = int(match.group(1), base), match.group(2)
+
+        self.handle_data(_numeric_reference(number) + extra)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else f"&{name}")
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+
+        # CDATA sections count as text, other declarations do not
+        if data.upper().startswith("CDATA["):
+            self._data.append(data[len("CDATA[") :])
+            self._flush(container=False)
+
+    def _open(self, tag):
+        self._flush()
+
+        index = None
+
+        if tag in self.tags:
+            index = len(self.texts)
+            self.texts.append([])
+            self._active.append(index)
+
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve += 1
+
+        if tag in STRING_CONTAINER_TAGS:
+            self._containers += 1
+
+        self._stack.append((tag, index))
+
+    def _close(self, tag):
+        self._flush()
+
+        # Like the soup builder, an end tag closes the most recent
+        # open element of its name and everything opened after it
+        for position in range(len(self._stack) - 1, -1, -1):
+            if self._stack[position][0] == tag:
+                break
+        else:
+            return
+
+        while len(self._stack) > position:
+            name, index = self._stack.pop()
+
+            if index is not None:
+                self._active.remove(index)
+
+            if name in PRESERVE_WHITESPACE_TAGS:
+                self._preserve -= 1
+
+            if name in STRING_CONTAINER_TAGS:
+                self._containers -= 1
+
+    def _flush(self, container=True):
+        if not self._data:
+            return
+
+        data = "".join(self._data)
+        self._data = []
+
+        if not self._preserve and not data.strip(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+
+        # Strings inside script, style and friends are not text
+        if container and self._containers:
+            return
+
+        for index in self._active:
+            self.texts[index].append(data)
+
+
+def _numeric_reference(number: int) -> str:
+    if hasattr(UnicodeDammit, "numeric_character_reference"):
+        return UnicodeDammit.numeric_character_reference(number)[0]
+
+    try:
+        return chr(number)
+    except (ValueError, OverflowError):
+        return "\ufffd"
+
+
+def fast_extract_reader_view(
+    html: Union[bytes, str], tags: List[str] = TAGS
+) -> List[str]:
+    """
+    Extracts the same reader view as extract_reader_view in a
+    single streaming pass over the markup
+
+    Parameters
+    ----------
+    html : bytes or str
+        The raw page
+    tags : List[str], optional
+        The elements to collect the text of
+
+    Returns
+    -------
+    List[str]
+        The text of every matched element in document order
+    """
+    if isinstance(html, bytes):
+        # Decode exactly like BeautifulSoup would
+        html = UnicodeDammit(html, is_html=True).unicode_markup
+
+    parser = ReaderViewParser(tags)
+    parser.feed(html)
+    parser.close()
+
+    return parser.result()
+
+
+def extract_summary(html: bytes) -> Dict[str, Any]:
+    return make_summary(BeautifulSoup(html, features="html.parser"))
+
+
+class SummaryParser(ReaderViewParser):
+    """
+    A streaming page summary extractor which picks up the title,
+    description, open graph tags and images in one pass over the
+    tokenizer, where make_summary scans the soup tree once for each
+
+    The title text follows the same rules as the reader view, and
+    meta or img attributes are read as the soup builder stores them
+    """
+
+    def __init__(self):
+        super().__init__(["title"])
+        self.description = None
+        self.og = {}
+        self.images = []
+
+    def handle_starttag(self, tag, attrs):
+        self._summarize(tag, attrs)
+        super().handle_starttag(tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        self._summarize(tag, attrs)
+        super().handle_startendtag(tag, attrs)
+
+    def summary(self) -> Dict[str, Any]:
+        titles = self.result()
+
+        return {
+            "meta": {
+                "title": titles[0] if titles else "",
+                "description": self.description or "",
+            },
+            "images": self.images,
+            "og": self.og,
+        }
+
+    def _summarize(self, tag, attrs):
+        if tag not in ("meta", "img"):
+            return
+
+        # Repeated attributes keep their last value, missing values
+        # become empty strings, both like the soup builder
+        attrs = {key: value or "" for key, value in attrs}
+
+        if tag == "img":
+            self.images.append(
+                {
+                    "width": attrs.get("width", None),
+                    "height": attrs.get("height", None),
+                    "url": attrs.get("src", None),
+                }
+            )
+            return
+
+        content = attrs.get("content", "")
+
+        if self.description is None and attrs.get("name") == "description":
+            self.description = content
+
+        # Open graph tags, both as property="og:title" and in the
+        # og-prefixed attribute form make_summary looks for
+        prop = attrs.get("property", "")
+
+        if prop.startswith("og:"):
+            self.og[prop] = content
+
+        for key in attrs:
+            if key.startswith("og"):
+                self.og[key] = content
+                break
+
+
+def fast_extract_summary(html: Union[bytes, str]) -> Dict[str, Any]:
+    """
+    Summarizes a page in a single streaming pass. Pages without a
+    title or description get empty values instead of raising
+
+    Parameters
+    ----------
+    html : bytes or str
+        The raw page
+
+    Returns
+    -------
+    Dict[str, Any]
+        The summary in the shape make_summary returns
+    """
+    if isinstance(html, bytes):
+        html = UnicodeDammit(html, is_html=True).unicode_markup
+
+    parser = SummaryParser()
+    parser.feed(html)
+    parser.close()
+
+    return parser.summary()
+
+
+def batch_extract_summaries(
+    page_data: Dict[str, bytes],
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Summarizes many pages, giving None for the ones which could not
+    be parsed so one bad page does not stall the batch
+
+    Parameters
+    ----------
+    page_data : Dict[str, bytes]
+        The url-indexed raw html
+
+    Returns
+    -------
+    Dict[str, Dict[str, Any]]
+        The url-indexed page summaries
+    """
+    summaries = {}
+
+    for url, html in page_data.items():
+        try:
+            summaries[url] = fast_extract_summary(html)
+        except Exception as e:
+            summaries[url] = None
+            logger.info(f"{url} made an exception: {e}")
+
+    return summaries
+
+
+class LinkParser(html.parser.HTMLParser):
+    """
+    A streaming anchor extractor which keeps the href of every <a>
+    tag as the tokenizer emits it, never building a tree
+
+    Relative links are resolved against the page url, or against the
+    page's <base href> when it has one, and then filtered
+
+    Parameters
+    ----------
+    base_url : str, optional
+        The url the page was read from, links are kept as written
+        when not given
+    prefixes : Iterable[str], optional
+        Keep links starting with any of these
+    patterns : Iterable[Union[str, Pattern]], optional
+        Keep links any of these regular expressions search true on
+    """
+
+    def __init__(
+        self,
+        base_url: str = None,
+        prefixes: Iterable[str] = (),
+        patterns: Iterable[Union[str, Pattern]] = (),
+    ):
+        super().__init__(convert_charrefs=False)
+        self.base_url = base_url
+        self.prefixes = tuple(prefixes)
+        self.patterns = [re.compile(pattern) for pattern in patterns]
+
+        self.links = []
+        self._base_seen = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            self._anchor(attrs)
+        elif tag == "base" and not self._base_seen:
+            self._set_base(attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def _set_base(self, attrs):
+        # Like browsers, only the first <base href> counts
+        href = _last_value(attrs, "href")
+
+        if href and self.base_url is not None:
+            self._base_seen = True
+            self.base_url = urllib.parse.urljoin(self.base_url, href.strip())
+
+    def _anchor(self, attrs):
+        href = _last_value(attrs, "href")
+
+        if not href:
+            return
+
+        if self.base_url is not None:
+            href = urllib.parse.urljoin(self.base_url, href.strip())
+
+        if self.prefixes or self.patterns:
+            if not href.startswith(self.prefixes) and not any(
+                pattern.search(href) for pattern in self.patterns
+            ):
+                return
+
+        self.links.append(href)
+
+
+def _last_value(attrs: List[Tuple[str, str]], name: str) -> str:
+    # Repeated attributes keep their last value, like the soup builder
+    value = None
+
+    for key, attr_value in attrs:
+        if key == name:
+            value = attr_value
+
+    return value
+
+
+def extract_links(
+    html: Union[bytes, str],
+    base_url: str = None,
+    prefixes: Iterable[str] = (),
+    patterns: Iterable[Union[str, Pattern]] = (),
+) -> List[str]:
+    """
+    Pulls the links out of a page in a single streaming pass, in
+    the order find_all("a") would see them
+
+    Parameters
+    ----------
+    html : bytes or str
+        The raw page
+    base_url : str, optional
+        The url the page was read from, to resolve relative links
+        against. Links are kept as written when not given
+    prefixes : Iterable[str], optional
+        Keep links starting with any of these
+    patterns : Iterable[Union[str, Pattern]], optional
+        Keep links any of these regular expressions search true on,
+        every link is kept when neither filter is given
+
+    Returns
+    -------
+    List[str]
+        The matching links
+    """
+    if isinstance(html, bytes):
+        html = UnicodeDammit(html, is_html=True).unicode_markup
+
+    parser = LinkParser(base_url, prefixes, patterns)
+    parser.feed(html)
+    parser.close()
+
+    return parser.links
+
+
+def batch_extract_links(
+    page_data: Union[Dict[str, bytes], Iterable[Tuple[str, bytes]]],
+    prefixes: Iterable[str] = (),
+    patterns: Iterable[Union[str, Pattern]] = (),
+) -> Dict[str, List[str]]:
+    """
+    Pulls the links out of many pages, resolving each page's links
+    against its own url. Pages which could not be read or parsed get
+    None
+
+    Parameters
+    ----------
+    page_data : Dict[str, bytes] or Iterable[Tuple[str, bytes]]
+        The url-indexed raw html, or a stream of (url, html) pairs
+    prefixes : Iterable[str], optional
+        Keep links starting with any of these
+    patterns : Iterable[Union[str, Pattern]], optional
+        Keep links any of these regular expressions search true on
+
+    Returns
+    -------
+    Dict[str, List[str]]
+        The url-indexed links of each page
+    """
+    if hasattr(page_data, "items"):
+        page_data = page_data.items()
+
+    # Compiled once for the whole batch
+    prefixes = tuple(prefixes)
+    patterns = [re.compile(pattern) for pattern in patterns]
+
+    links = {}
+
+    for url, html in page_data:
+        if html is None:
+            links[url] = None
+            continue
+
+        try:
+            links[url] = extract_links(html, url, prefixes, patterns)
+        except Exception as e:
+            links[url] = None
+            logger.info(f"{url} made an exception: {e}")
+
+    return links
+
+
+EXTRACTORS = {
+    "reader_view": extract_reader_view,
+    "fast_reader_view": fast_extract_reader_view,
+    "summary": extract_summary,
+    "fast_summary": fast_extract_summary,
+}
+
+
+def _extract_chunk(
+    extract: str, chunk: List[Tuple[str, bytes]]
+) -> List[Tuple[str, Any, str]]:
+    # Runs in a worker process, so failures come back as strings
+    # rather than exceptions which may not pickle
+    fn = EXTRACTORS[extract]
+    results = []
+
+    for url, html in chunk:
+        try:
+            results.append((url, fn(html), None))
+        except Exception as e:
+            results.append((url, None, repr(e)))
+
+    return results
+
+
+def concurrent_batch_extract_page_data(
+    page_data: Union[Dict[str, bytes], Iterable[Tuple[str, bytes]]],
+    extract: str = "reader_view",
+    chunksize: int = 16,
+    workers: int = None,
+) -> Dict[str, Any]:
+    """
+    Parses pages across a process pool and keeps only what the
+    extractor pulls out of them, never the soup trees
+
+    Parameters
+    ----------
+    page_data : Dict[str, bytes] or Iterable[Tuple[str, bytes]]
+        The url-indexed raw html, or a stream of (url, html) pairs
+    extract : str, optional possible: ('reader_view',
+    'fast_reader_view', 'summary', 'fast_summary'),
+    default: 'reader_view'
+        What to pull out of each page
+    chunksize : int, optional
+        Pages sent to a worker per task, larger chunks spend less
+        time pickling task overhead
+    workers : int, optional
+        The number of processes, cpu_count() by default
+
+    Returns
+    -------
+    Dict[str, Any]
+        The url-indexed extractions in the order the pages came in,
+        None for missing and failed pages
+    """
+    if extract not in EXTRACTORS:
+        raise ValueError(f"unknown extractor '{extract}'")
+
+    worker_count = workers or multiprocessing.cpu_count()
+
+    if hasattr(page_data, "items"):
+        page_data = page_data.items()
+
+    # Workers finish out of order, so remember the order urls came in
+    order = []
+
+    def pages():
+        for url, html in page_data:
+            order.append(url)
+
+            if html is not None:
+                yield url, html
+
+    page_iter = pages()
+    chunks = iter(lambda: list(itertools.islice(page_iter, chunksize)), [])
+
+    extracted = {}
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=worker_count
+    ) as executor:
+        # Keep a couple of chunks per worker queued so a lazy source
+        # like a page store is never read far ahead of the pool
+        pending = set()
+
+        for chunk in chunks:
+            pending.add(executor.submit(_extract_chunk, extract, chunk))
+
+            if len(pending) >= worker_count * 2:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                _collect(done, extracted)
+
+        _collect(pending, extracted)
+
+    return {url: extracted.get(url) for url in order}
+
+
+def _collect(futures, extracted: Dict[str, Any]) -> None:
+    for future in concurrent.futures.as_completed(futures):
+        for url, data, error in future.result():
+            if error is not None:
+                logger.info(f"{url} made an exception: {error}")
+
+            extracted[url] = data
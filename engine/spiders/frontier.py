@@ -0,0 +1,360 @@
+"""
+Frontier contains the crawl frontier, which canonicalizes every
+discovered url, drops the ones seen before and hands the rest out
+by priority, so each page is only fetched once
+"""
+
+import hashlib
+import heapq
+import itertools
+import math
+import urllib.parse
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Query parameters which only track where a click came from
+TRACKING_PARAMS = frozenset(
+    {
+        "fbclid",
+        "gclid",
+        "dclid",
+        "msclkid",
+        "mc_cid",
+        "mc_eid",
+        "igshid",
+        "yclid",
+        "_ga",
+        "_hsenc",
+        "_hsmi",
+        "ref_src",
+    }
+)
+TRACKING_PREFIXES = ("utm_",)
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Rewrites a url into the one form we fetch it under, so links
+    differing only in fragment, host case, default port, query order
+    or tracking parameters are recognized as the same page
+
+    Parameters
+    ----------
+    url : str
+        The url as found on a page
+
+    Returns
+    -------
+    str
+        The canonical url, or the url as written when its port or
+        host cannot be parsed
+    """
+    url = url.strip()
+
+    try:
+        parts = urllib.parse.urlsplit(url)
+        port = parts.port
+    except ValueError:
+        # A port like ':abc' cannot be read, keep such links as they
+        # are rather than let one bad link end the crawl
+        return url
+
+    scheme = parts.scheme.lower()
+
+    netloc = (parts.hostname or "").rstrip(".")
+
+    if ":" in netloc:
+        # IPv6 literals keep their brackets
+        netloc = f"[{netloc}]"
+
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+
+    if parts.username is not None:
+        userinfo = parts.username
+
+        if parts.password is not None:
+            userinfo = f"{userinfo}:{parts.password}"
+
+        netloc = f"{userinfo}@{netloc}"
+
+    path = parts.path or "/"
+
+    # Sort the raw pairs rather than re-encoding them, so values keep
+    # the escaping the site used
+    pairs = [
+        pair
+        for pair in parts.query.split("&")
+        if pair and not _is_tracking(pair.split("=", 1)[0])
+    ]
+    query = "&".join(sorted(pairs))
+
+    return urllib.parse.urlunsplit((scheme, netloc, path, query, ""))
+
+
+def _is_tracking(key: str) -> bool:
+    key = urllib.parse.unquote_plus(key).lower()
+
+    return key in TRACKING_PARAMS or key.startswith(TRACKING_PREFIXES)
+
+
+class BloomFilter:
+    """
+    A fixed size set membership filter, which can answer 'maybe seen'
+    for an item never added but never forgets one that was
+
+    Parameters
+    ----------
+    capacity : int
+        The number of items the filter is sized for
+    error_rate : float
+        The false positive rate once capacity items are added
+    """
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001):
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError(
+                "expected a positive capacity and 0 < error_rate < 1"
+            )
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+
+        self.bit_count = max(
+            8, int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.hash_count = max(
+            1, round(self.bit_count / capacity * math.log(2))
+        )
+        self.count = 0
+
+        self._bits = bytearray((self.bit_count + 7) // 8)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[bit >> 3] & (1 << (bit & 7))
+            for bit in self._positions(item)
+        )
+
+    def __len__(self):
+        return self.count
+
+    def add(self, item: str) -> bool:
+        """
+        Returns
+        -------
+        bool
+            Whether the item was new to the filter
+        """
+        new = False
+
+        for bit in self._positions(item):
+            mask = 1 << (bit & 7)
+
+            if not self._bits[bit >> 3] & mask:
+                self._bits[bit >> 3] |= mask
+                new = True
+
+        if new:
+            self.count += 1
+
+        return new
+
+    def _positions(self, item: str) -> Iterator[int]:
+        # Double hashing, k positions out of two 64 bit halves
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.bit_count
+
+
+class Frontier:
+    """
+    The frontier queues canonical urls which have not been seen
+    before, lowest priority value first and in discovery order among
+    equals. Depth defaults the priority, so the crawl is breadth first
+
+    Seen urls are kept exactly up to exact_limit, after which only
+    the Bloom filter remembers them, which bounds memory at the cost
+    of rarely skipping a new url
+
+    Parameters
+    ----------
+    max_depth : int, optional
+        Links deeper than this are dropped, no limit if not given
+    exact_limit : int
+        The most urls remembered exactly
+    capacity : int
+        The number of urls the Bloom filter is sized for
+    error_rate : float
+        The Bloom filter false positive rate at capacity
+    """
+
+    def __init__(
+        self,
+        max_depth: int = None,
+        exact_limit: int = 100_000,
+        capacity: int = 1_000_000,
+        error_rate: float = 0.001,
+    ):
+        self.max_depth = max_depth
+        self.exact_limit = exact_limit
+
+        self.duplicates = 0
+        self.too_deep = 0
+
+        self._exact = set()
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._queue = []
+        self._order = itertools.count()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def __contains__(self, url: str) -> bool:
+        return self._seen(canonicalize_url(url))
+
+    @property
+    def seen_count(self) -> int:
+        return max(len(self._exact), len(self._bloom))
+
+    def add(
+        self, url: str, depth: int = 0, priority: float = None
+    ) -> Optional[str]:
+        """
+        Queues a url unless it, or a url with the same canonical form,
+        has been seen before or it is past the depth limit
+
+        Parameters
+        ----------
+        url : str
+            The discovered url
+        depth : int
+            How many links away from a seed the url was found
+        priority : float, optional
+            Lower values are handed out first, the depth if not given
+
+        Returns
+        -------
+        Optional[str]
+            The canonical url when it was queued, None otherwise
+        """
+        if self.max_depth is not None and depth > self.max_depth:
+            self.too_deep += 1
+            return None
+
+        canonical = self._remember(url)
+
+        if canonical is None:
+            return None
+
+        heapq.heappush(
+            self._queue,
+            (
+                depth if priority is None else priority,
+                next(self._order),
+                canonical,
+                depth,
+            ),
+        )
+
+        return canonical
+
+    def add_all(
+        self, urls: Iterable[str], depth: int = 0, priority: float = None
+    ) -> List[str]:
+        """
+        Queues many urls found at the same depth
+
+        Returns
+        -------
+        List[str]
+            The canonical urls which were queued, in discovery order
+        """
+        added = (self.add(url, depth, priority) for url in urls)
+
+        return [url for url in added if url is not None]
+
+    def filter(self, urls: Iterable[str]) -> Iterator[str]:
+        """
+        Canonicalizes urls and yields those not seen before, without
+        queueing them, for reading links which are already known like
+        an index category
+
+        Returns
+        -------
+        Iterator[str]
+            The new canonical urls, in order
+        """
+        for url in urls:
+            canonical = self._remember(url)
+
+            if canonical is not None:
+                yield canonical
+
+    def mark_seen(self, urls: Iterable[str]) -> int:
+        """
+        Remembers urls without queueing them, so they are never
+        queued later
+
+        Returns
+        -------
+        int
+            The number of urls which were new
+        """
+        return sum(1 for _ in self.filter(urls))
+
+    def pop(self) -> Tuple[str, int]:
+        """
+        Returns
+        -------
+        Tuple[str, int]
+            The next url to fetch and its depth
+
+        Raises
+        ------
+        IndexError
+            When the frontier is empty
+        """
+        if not self._queue:
+            raise IndexError("pop from an empty frontier")
+
+        _, _, url, depth = heapq.heappop(self._queue)
+
+        return url, depth
+
+    def drain(self) -> Iterator[Tuple[str, int]]:
+        """
+        Pops urls until the frontier is empty, including any queued
+        while draining
+        """
+        while self._queue:
+            yield self.pop()
+
+    def _remember(self, url: str) -> Optional[str]:
+        # The canonical url if it is new, marking it seen
+        canonical = canonicalize_url(url)
+
+        if self._seen(canonical):
+            self.duplicates += 1
+            return None
+
+        if len(self._exact) < self.exact_limit:
+            self._exact.add(canonical)
+
+        self._bloom.add(canonical)
+
+        return canonical
+
+    def _seen(self, canonical: str) -> bool:
+        if canonical in self._exact:
+            return True
+
+        # Once the exact set is full, urls past it only live in the
+        # Bloom filter
+        return (
+            len(self._exact) >= self.exact_limit and canonical in self._bloom
+        )
@@ -0,0 +1,287 @@
+"""
+Geocoding contains a cached, rate limited geocoder which turns
+place names into coordinates, looking each place up with the
+provider once no matter how often or how concurrently it is asked
+"""
+
+import concurrent.futures
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GEOCODE_FILE = (
+    f"{os.path.dirname(os.path.realpath(__file__))}/corpus/geocode.sqlite3"
+)
+
+LatLong = Tuple[float, float]
+
+
+def normalize_place(name: str) -> str:
+    """
+    Normalizes a place name into its cache key, so 'Denver, CO ' and
+    'denver,  co' are looked up once
+
+    Parameters
+    ----------
+    name : str
+        The place name
+
+    Returns
+    -------
+    str
+        The case folded name with collapsed whitespace
+    """
+    name = re.sub(r"\s+", " ", name).strip(" ,.;")
+
+    return re.sub(r"\s*,\s*", ", ", name).casefold()
+
+
+class NominatimBackend:
+    """
+    Geocodes with OpenStreetMap's Nominatim, whose usage policy
+    allows one request per second
+
+    Parameters
+    ----------
+    user_agent : str
+        The user agent identifying us to Nominatim
+    timeout : int
+        Seconds allowed for one lookup
+    """
+
+    min_interval = 1.0
+
+    def __init__(self, user_agent: str = "GoogleBot", timeout: int = 10):
+        from geopy.geocoders import Nominatim
+
+        self.client = Nominatim(user_agent=user_agent, timeout=timeout)
+
+    def geocode(self, name: str) -> Optional[LatLong]:
+        location = self.client.geocode(name)
+
+        if location is None:
+            return None
+
+        return location.latitude, location.longitude
+
+
+class GeocodeCache:
+    """
+    A sqlite backed cache of place coordinates, remembering places
+    the provider could not find as well
+
+    Parameters
+    ----------
+    path : str
+        The sqlite file to keep the cache in
+    """
+
+    def __init__(self, path: str = DEFAULT_GEOCODE_FILE):
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS places ("
+            " name TEXT PRIMARY KEY,"
+            " latitude REAL,"
+            " longitude REAL,"
+            " stored REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._db.execute(
+                "SELECT COUNT(*) FROM places"
+            ).fetchone()
+
+        return count
+
+    def lookup(self, name: str) -> Tuple[bool, Optional[LatLong]]:
+        """
+        Parameters
+        ----------
+        name : str
+            The normalized place name
+
+        Returns
+        -------
+        Tuple[bool, Optional[LatLong]]
+            Whether the place is cached, and its coordinates which
+            are None for places the provider could not find
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT latitude, longitude FROM places WHERE name = ?",
+                (name,),
+            ).fetchone()
+
+        if row is None:
+            return False, None
+
+        return True, None if row[0] is None else (row[0], row[1])
+
+    def store(self, name: str, location: Optional[LatLong]) -> None:
+        latitude, longitude = location if location else (None, None)
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO places"
+                " (name, latitude, longitude, stored) VALUES (?, ?, ?, ?)",
+                (name, latitude, longitude, time.time()),
+            )
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class Geocoder:
+    """
+    The geocoder answers from its cache where it can, shares one
+    provider lookup between threads asking for the same place and
+    spaces provider lookups by the backend's min_interval
+
+    Parameters
+    ----------
+    backend : object, optional
+        Anything with a geocode(name) -> Optional[LatLong] method and
+        a min_interval in seconds, NominatimBackend by default
+    cache : GeocodeCache, optional
+        The persistent cache, the default cache file if not given
+    """
+
+    def __init__(self, backend=None, cache: GeocodeCache = None):
+        self.backend = backend if backend is not None else NominatimBackend()
+        self.cache = cache if cache is not None else GeocodeCache()
+
+        self.hits = 0
+        self.lookups = 0
+
+        self._lock = threading.Lock()
+        self._rate_lock = threading.Lock()
+        self._in_flight = {}
+        self._last_lookup = 0.0
+
+    def geocode(self, name: str) -> Optional[LatLong]:
+        """
+        Parameters
+        ----------
+        name : str
+            The place name
+
+        Returns
+        -------
+        Optional[LatLong]
+            The latitude and longitude, None when the place is unknown
+        """
+        key = normalize_place(name)
+        cached, location = self.cache.lookup(key)
+
+        if cached:
+            with self._lock:
+                self.hits += 1
+
+            return location
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+
+            if owner:
+                future = concurrent.futures.Future()
+                self._in_flight[key] = future
+
+        # Someone else is already asking the provider for this place
+        if not owner:
+            return future.result()
+
+        try:
+            # An owner which finished between our cache miss and taking
+            # ownership has already stored the place
+            cached, location = self.cache.lookup(key)
+
+            if cached:
+                with self._lock:
+                    self.hits += 1
+            else:
+                location = self._lookup(name)
+                self.cache.store(key, location)
+
+            future.set_result(location)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+        return location
+
+    def geocode_batch(
+        self, names: Iterable[str]
+    ) -> Dict[str, Optional[LatLong]]:
+        """
+        Geocodes many places, asking the provider once per distinct
+        place which is not cached yet
+
+        Parameters
+        ----------
+        names : Iterable[str]
+            The place names
+
+        Returns
+        -------
+        Dict[str, Optional[LatLong]]
+            The name-indexed coordinates, None for unknown or failed
+            places
+        """
+        located = {}
+
+        for name in dict.fromkeys(names):
+            try:
+                located[name] = self.geocode(name)
+            except Exception as e:
+                located[name] = None
+                logger.info(f"{name} made an exception: {e}")
+
+        return located
+
+    def _lookup(self, name: str) -> Optional[LatLong]:
+        # Lookups go out one at a time, spaced by the provider policy
+        with self._rate_lock:
+            wait = self._last_lookup + self.backend.min_interval
+            time.sleep(max(0, wait - time.monotonic()))
+
+            try:
+                self.lookups += 1
+                return self.backend.geocode(name)
+            finally:
+                self._last_lookup = time.monotonic()
+
+
+_default_geocoder = None
+_default_lock = threading.Lock()
+
+
+def default_geocoder() -> Geocoder:
+    """
+    The process-wide geocoder, made on first use so importing this
+    module never opens the cache file
+    """
+    global _default_geocoder
+
+    with _default_lock:
+        if _default_geocoder is None:
+            _default_geocoder = Geocoder()
+
+    return _default_geocoder
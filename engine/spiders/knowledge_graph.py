@@ -9,8 +9,8 @@ from typing import List, Dict
 from ..constants import GlobalConstants
 
 from bs4 import BeautifulSoup
-from base import (
-    get_robots,
+from .robots import robots_cache
+from .base import (
     read,
     serial_bulk_query,
     concurrent_batch_process_page_data,
@@ -42,13 +42,13 @@ def knowledge_graph_list(
         The list of businesses to query
     """
     # Get robots.txt to calivate requests
-    robots = get_robots("https://www.google.com/robots.txt")
+    robots = robots_cache.get("https://www.google.com/robots.txt")
 
     if not robots.can_fetch(GlobalConstants.USER_AGENT_NAME_TEST, GENERAL_SEARCH_URL):
         raise LookupError("Url is restricted from scraping")
 
     lat, long = city_name_to_latlong(location)
     place = urllib.parse.quote_plus(phrase)
-    location_string = f"@{','.join((lat, long))}"
+    location_string = f"@{lat},{long}"
 
     compiled_url = f"{GENERAL_SEARCH_URL}{location_string}"
@@ -0,0 +1,397 @@
+"""
+Limits contains an adaptive concurrency limiter which finds the
+most requests each host, and the crawl as a whole, can take at once
+by additive increase and multiplicative decrease (AIMD)
+"""
+
+import asyncio
+import email.utils
+import math
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+# Statuses which mean the server wants us to slow down
+OVERLOAD_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# The longest a Retry-After header may hold a host back
+MAX_RETRY_AFTER = 300.0
+
+
+def parse_retry_after(value: Optional[str], now: float = None) -> float:
+    """
+    Reads a Retry-After header, given either in seconds or as an
+    HTTP date
+
+    Parameters
+    ----------
+    value : str, optional
+        The header value
+    now : float, optional
+        The current unix time, time.time() if not given
+
+    Returns
+    -------
+    float
+        The seconds to wait, 0 for a missing or unreadable header
+    """
+    if not value:
+        return 0.0
+
+    value = value.strip()
+
+    if value.isdigit():
+        return float(value)
+
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+    if when is None:
+        return 0.0
+
+    return max(0.0, when.timestamp() - (now or time.time()))
+
+
+def percentile(samples, q: float) -> float:
+    """
+    The nearest-rank q-th percentile of the samples, 0 without any
+    """
+    if not samples:
+        return 0.0
+
+    ordered = sorted(samples)
+    rank = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+
+    return ordered[rank]
+
+
+class AdaptiveLimit:
+    """
+    The AIMD state of one limit. Each healthy response grows the limit
+    by increase / limit, so about one slot per round trip, and each
+    overload cuts it by decrease, at most once per cooldown so a burst
+    of failures from the same moment only counts once
+
+    Parameters
+    ----------
+    initial : int
+        The starting limit
+    minimum : int
+        The limit never drops below this
+    maximum : int
+        The limit never grows beyond this
+    increase : float
+        Slots gained per limit-worth of healthy responses
+    decrease : float
+        The factor the limit is multiplied by on overload
+    latency_tolerance : float
+        Responses slower than this multiple of the best median
+        latency seen hold the limit instead of growing it
+    window : int
+        The number of recent latencies kept for percentiles
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 64,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+        window: int = 256,
+    ):
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self.backoffs = 0
+        self.blocked_until = 0.0
+
+        self._latencies = deque(maxlen=window)
+        self._baseline = None
+        self._last_backoff = 0.0
+
+    @property
+    def available(self) -> bool:
+        return (
+            self.in_flight < int(self.limit)
+            and time.monotonic() >= self.blocked_until
+        )
+
+    def on_success(self, latency: float) -> None:
+        self.successes += 1
+        self._latencies.append(latency)
+
+        median = percentile(self._latencies, 50)
+
+        if len(self._latencies) >= 8:
+            self._baseline = (
+                median
+                if self._baseline is None
+                else min(self._baseline, median)
+            )
+
+        # Slow answers mean the host is queueing us, so stop growing
+        if (
+            self._baseline is not None
+            and latency > self._baseline * self.latency_tolerance
+        ):
+            return
+
+        self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+
+    def on_overload(self, latency: float, retry_after: float = 0.0) -> None:
+        now = time.monotonic()
+        self.failures += 1
+        self._latencies.append(latency)
+
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+        # Requests which were already in flight when the host started
+        # struggling fail together, back off for them once
+        cooldown = max(percentile(self._latencies, 50), 0.05)
+
+        if now - self._last_backoff < cooldown:
+            return
+
+        self._last_backoff = now
+        self.backoffs += 1
+        self.limit = max(self.minimum, self.limit * self.decrease)
+
+    def on_error(self, latency: float) -> None:
+        # Failures which say nothing about load, like a 404
+        self._latencies.append(latency)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "successes": self.successes,
+            "failures": self.failures,
+            "backoffs": self.backoffs,
+            "blocked_for": round(
+                max(0.0, self.blocked_until - time.monotonic()), 3
+            ),
+            "latency_p50": round(percentile(self._latencies, 50), 4),
+            "latency_p90": round(percentile(self._latencies, 90), 4),
+            "latency_p99": round(percentile(self._latencies, 99), 4),
+        }
+
+
+class Slot:
+    """
+    A request's hold on a host slot and a global slot, released with
+    the outcome the limiter learns from
+    """
+
+    def __init__(self, limiter: "AdaptiveLimiter", host: str):
+        self.limiter = limiter
+        self.host = host
+        self.status = None
+        self.retry_after = 0.0
+
+        self._start = None
+
+    def response(self, status: int, headers: Dict[str, str] = None) -> None:
+        """
+        Records the status of the response, and its Retry-After header
+        when the status asks us to slow down
+        """
+        self.status = status
+
+        if status in OVERLOAD_STATUSES:
+            self.retry_after = min(
+                MAX_RETRY_AFTER,
+                parse_retry_after((headers or {}).get("retry-after")),
+            )
+
+    async def __aenter__(self):
+        await self.limiter.acquire(self.host)
+        self._start = time.monotonic()
+
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        latency = time.monotonic() - self._start
+
+        if exc_type is not None and issubclass(exc_type, asyncio.TimeoutError):
+            outcome = "timeout"
+        elif exc_type is not None:
+            # Dropped connections are the host failing under load,
+            # anything else is on our side
+            overloaded = issubclass(exc_type, ConnectionError)
+            outcome = "overload" if overloaded else "error"
+        elif self.status in OVERLOAD_STATUSES:
+            outcome = "overload"
+        elif self.status is not None and self.status >= 400:
+            outcome = "error"
+        else:
+            outcome = "ok"
+
+        self.limiter.release(self.host, latency, outcome, self.retry_after)
+
+
+class AdaptiveLimiter:
+    """
+    The adaptive limiter hands out request slots under a limit per
+    host and a global limit, both grown and shrunk by AIMD from the
+    outcome of every request. A host answering 429 or 5xx backs off
+    on its own, while timeouts back off the global limit as well
+
+    Parameters
+    ----------
+    initial_per_host : int
+        The starting limit of a newly seen host
+    max_per_host : int
+        The most requests in flight against a single host
+    initial_global : int
+        The starting limit across all hosts
+    max_global : int
+        The most requests in flight across all hosts
+    """
+
+    def __init__(
+        self,
+        initial_per_host: int = 4,
+        max_per_host: int = 64,
+        initial_global: int = 64,
+        max_global: int = 1024,
+    ):
+        self.initial_per_host = initial_per_host
+        self.max_per_host = max_per_host
+
+        self.global_limit = AdaptiveLimit(
+            initial=initial_global,
+            maximum=max_global,
+            latency_tolerance=math.inf,
+        )
+        self.hosts = {}
+
+        # Conditions are bound to the running loop, so they are made
+        # once we are inside of it and again for every later loop
+        self._changed = None
+        self._loop = None
+
+    def host_limit(self, host: str) -> AdaptiveLimit:
+        if host not in self.hosts:
+            self.hosts[host] = AdaptiveLimit(
+                initial=self.initial_per_host, maximum=self.max_per_host
+            )
+
+        return self.hosts[host]
+
+    def slot(self, host: str) -> Slot:
+        """
+        Use as `async with limiter.slot(host) as slot:` around a
+        request, calling slot.response(status, headers) once the
+        response is in
+        """
+        return Slot(self, host)
+
+    async def acquire(self, host: str) -> None:
+        loop = asyncio.get_running_loop()
+
+        if self._loop is not loop:
+            self._changed = asyncio.Condition()
+            self._loop = loop
+
+        limit = self.host_limit(host)
+
+        async with self._changed:
+            # Take the host slot before the global one, so requests
+            # queued behind a busy host never sit on global slots
+            while not (limit.available and self.global_limit.available):
+                blocked = max(
+                    limit.blocked_until, self.global_limit.blocked_until
+                )
+                wait = blocked - time.monotonic()
+
+                try:
+                    await asyncio.wait_for(
+                        self._changed.wait(), wait if wait > 0 else None
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+            limit.in_flight += 1
+            self.global_limit.in_flight += 1
+
+    def release(
+        self,
+        host: str,
+        latency: float,
+        outcome: str = "ok",
+        retry_after: float = 0.0,
+    ) -> None:
+        """
+        Gives a slot back and adapts the limits to how it went
+
+        Parameters
+        ----------
+        host : str
+            The host the request went to
+        latency : float
+            Seconds the request held the slot
+        outcome : str, possible: ('ok', 'overload', 'timeout', 'error')
+            Whether the host answered, was overloaded, did not answer
+            in time or the request failed for reasons unrelated to load
+        retry_after : float
+            Seconds the host asked us to wait before the next request
+        """
+        limit = self.host_limit(host)
+        limit.in_flight -= 1
+        self.global_limit.in_flight -= 1
+
+        if outcome == "ok":
+            limit.on_success(latency)
+            self.global_limit.on_success(latency)
+        elif outcome == "overload":
+            limit.on_overload(latency, retry_after)
+            self.global_limit.on_error(latency)
+        elif outcome == "timeout":
+            # Timeouts may be our own link saturating, so the global
+            # limit backs off along with the host's
+            limit.on_overload(latency)
+            self.global_limit.on_overload(latency)
+        else:
+            limit.on_error(latency)
+            self.global_limit.on_error(latency)
+
+        # Only wake waiters of the loop the condition belongs to, a
+        # release from any other loop has no one to wake
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        if loop is self._loop:
+            loop.create_task(self._notify())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns
+        -------
+        Dict[str, Any]
+            The current global and per host limits, in flight counts,
+            outcome counts and latency percentiles
+        """
+        return {
+            "global": self.global_limit.stats(),
+            "hosts": {
+                host: limit.stats() for host, limit in self.hosts.items()
+            },
+        }
+
+    async def _notify(self) -> None:
+        async with self._changed:
+            self._changed.notify_all()
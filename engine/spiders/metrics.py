@@ -0,0 +1,406 @@
+"""
+Metrics contains the fetch instrumentation, which times each
+request phase by phase and rolls the timings up into per-host
+histograms and throughput counters we can export and tune against
+"""
+
+import bisect
+import json
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+# Upper bounds in seconds, following Prometheus' default buckets
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+PHASES = ("dns", "connect", "ttfb", "total")
+
+
+class RequestTiming:
+    """
+    The timing breakdown of one request attempt. Phases the fetch did
+    not go through, like dns and connect on a reused connection, are
+    None. urllib does not report when dns and connect finish, so
+    they are always None for the threaded fetchers, whose ttfb takes
+    in both
+
+    Parameters
+    ----------
+    url : str
+        The url requested
+    host : str
+        The 'scheme://host[:port]' the request went to
+    """
+
+    def __init__(self, url: str, host: str):
+        self.url = url
+        self.host = host
+        self.started = time.time()
+
+        self.dns = None
+        self.connect = None
+        self.ttfb = None
+        self.total = None
+        self.bytes = 0
+        self.status = None
+        self.retries = 0
+        self.reused = False
+        self.error = None
+
+        self._start = time.perf_counter()
+
+    def __repr__(self):
+        return (
+            f"<RequestTiming(url={self.url}, status={self.status}, "
+            f"total={self.total})>"
+        )
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def responded(self, status: int) -> None:
+        # The status line and headers are in, which is the first byte
+        self.status = status
+
+        if self.ttfb is None:
+            self.ttfb = self.elapsed()
+
+    def finish(self, error: BaseException = None) -> "RequestTiming":
+        self.total = self.elapsed()
+
+        if error is not None:
+            self.error = type(error).__name__
+
+        return self
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "host": self.host,
+            "started": self.started,
+            "dns": self.dns,
+            "connect": self.connect,
+            "ttfb": self.ttfb,
+            "total": self.total,
+            "bytes": self.bytes,
+            "status": self.status,
+            "retries": self.retries,
+            "reused": self.reused,
+            "error": self.error,
+        }
+
+
+class Histogram:
+    """
+    A cumulative bucket histogram of durations
+
+    Parameters
+    ----------
+    buckets : Tuple[float, ...]
+        The bucket upper bounds in seconds, ascending
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        # Per bucket counts of observations at or below its bound,
+        # the last one being +Inf
+        totals, running = [], 0
+
+        for count in self.counts:
+            running += count
+            totals.append(running)
+
+        return totals
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        The upper bound of the bucket holding the q-th quantile, None
+        without observations and inf past the last bucket
+        """
+        if not self.count:
+            return None
+
+        rank = q * self.count
+
+        for bound, total in zip(self.buckets, self.cumulative()):
+            if total >= rank:
+                return bound
+
+        return float("inf")
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": dict(
+                zip([*map(str, self.buckets), "+Inf"], self.cumulative())
+            ),
+        }
+
+
+class HostMetrics:
+    """
+    The rolled up timings of every request to one host
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.reused = 0
+        self.bytes = 0
+        self.statuses = Counter()
+        self.phases = {phase: Histogram(buckets) for phase in PHASES}
+
+        self.first_started = None
+        self.last_finished = None
+
+    def record(self, timing: RequestTiming) -> None:
+        self.requests += 1
+        self.bytes += timing.bytes
+        self.retries += 1 if timing.retries else 0
+        self.reused += 1 if timing.reused else 0
+
+        if timing.error is not None:
+            self.errors += 1
+
+        if timing.status is not None:
+            self.statuses[timing.status] += 1
+
+        for phase in PHASES:
+            value = getattr(timing, phase)
+
+            if value is not None:
+                self.phases[phase].observe(value)
+
+        finished = timing.started + (timing.total or 0)
+        self.first_started = min(
+            self.first_started or timing.started, timing.started
+        )
+        self.last_finished = max(self.last_finished or finished, finished)
+
+    @property
+    def wall(self) -> float:
+        if self.first_started is None:
+            return 0.0
+
+        return self.last_finished - self.first_started
+
+    def as_dict(self) -> Dict[str, Any]:
+        wall = self.wall
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "reused_connections": self.reused,
+            "bytes": self.bytes,
+            "statuses": {
+                str(status): n for status, n in self.statuses.items()
+            },
+            "wall_seconds": round(wall, 3),
+            "requests_per_second": (
+                round(self.requests / wall, 2) if wall else None
+            ),
+            "bytes_per_second": round(self.bytes / wall, 2) if wall else None,
+            "phases": {
+                phase: histogram.as_dict()
+                for phase, histogram in self.phases.items()
+            },
+        }
+
+
+class FetchMetrics:
+    """
+    Fetch metrics collects request timings from the fetchers, keeps
+    per-host aggregates of them and exports those as JSON or as
+    Prometheus text
+
+    Parameters
+    ----------
+    hook : Callable[[RequestTiming], None], optional
+        Called with every timing as it is recorded, from the thread
+        or event loop that made the request
+    buckets : Tuple[float, ...]
+        The histogram bucket upper bounds in seconds
+    """
+
+    def __init__(
+        self,
+        hook: Callable[[RequestTiming], None] = None,
+        buckets=DEFAULT_BUCKETS,
+    ):
+        self.hook = hook
+        self.buckets = tuple(buckets)
+        self.hosts = {}
+
+        self._lock = threading.Lock()
+
+    def start(self, url: str, host: str, retries: int = 0) -> RequestTiming:
+        """
+        Starts timing a request attempt, retries being the number of
+        attempts at the url before this one
+        """
+        timing = RequestTiming(url, host)
+        timing.retries = retries
+
+        return timing
+
+    def record(self, timing: RequestTiming) -> None:
+        with self._lock:
+            if timing.host not in self.hosts:
+                self.hosts[timing.host] = HostMetrics(self.buckets)
+
+            self.hosts[timing.host].record(timing)
+
+        if self.hook is not None:
+            self.hook(timing)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns
+        -------
+        Dict[str, Any]
+            The totals across hosts and the per-host aggregates
+        """
+        with self._lock:
+            hosts = {host: m.as_dict() for host, m in self.hosts.items()}
+
+        totals = {
+            key: sum(host[key] for host in hosts.values())
+            for key in ("requests", "errors", "retries", "bytes")
+        }
+
+        return {"totals": totals, "hosts": hosts}
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(self, prefix: str = "hearth_fetch") -> str:
+        """
+        Renders the aggregates in the Prometheus text exposition
+        format, labelled by host
+
+        Parameters
+        ----------
+        prefix : str
+            The metric name prefix
+
+        Returns
+        -------
+        str
+            The exposition text
+        """
+        with self._lock:
+            hosts = list(self.hosts.items())
+
+        lines = []
+
+        def _counter(name, help_text, values):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+
+            for labels, value in values:
+                lines.append(f"{prefix}_{name}{{{labels}}} {value}")
+
+        _counter(
+            "requests_total",
+            "Requests made",
+            [(_labels(host=h), m.requests) for h, m in hosts],
+        )
+        _counter(
+            "errors_total",
+            "Requests which raised",
+            [(_labels(host=h), m.errors) for h, m in hosts],
+        )
+        _counter(
+            "retried_requests_total",
+            "Requests which were retries",
+            [(_labels(host=h), m.retries) for h, m in hosts],
+        )
+        _counter(
+            "bytes_total",
+            "Response body bytes read",
+            [(_labels(host=h), m.bytes) for h, m in hosts],
+        )
+        _counter(
+            "responses_total",
+            "Responses by status",
+            [
+                (_labels(host=h, status=status), n)
+                for h, m in hosts
+                for status, n in sorted(m.statuses.items())
+            ],
+        )
+
+        for phase in PHASES:
+            name = f"{prefix}_{phase}_seconds"
+            lines.append(f"# HELP {name} Time spent in the {phase} phase")
+            lines.append(f"# TYPE {name} histogram")
+
+            for host, m in hosts:
+                histogram = m.phases[phase]
+                bounds = [*map(str, histogram.buckets), "+Inf"]
+
+                for bound, total in zip(bounds, histogram.cumulative()):
+                    labels = _labels(host=host, le=bound)
+                    lines.append(f"{name}_bucket{{{labels}}} {total}")
+
+                lines.append(
+                    f"{name}_sum{{{_labels(host=host)}}} {histogram.sum}"
+                )
+                lines.append(
+                    f"{name}_count{{{_labels(host=host)}}} {histogram.count}"
+                )
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """
+        Writes the aggregates to path, as Prometheus text for .prom
+        and .txt files and as JSON otherwise
+        """
+        if path.endswith((".prom", ".txt")):
+            text = self.to_prometheus()
+        else:
+            text = self.to_json(indent=2)
+
+        with open(path, "w") as f:
+            f.write(text)
+
+
+def _labels(**labels) -> str:
+    return ",".join(
+        f'{key}="{_escape(str(value))}"' for key, value in labels.items()
+    )
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
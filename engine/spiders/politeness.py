@@ -0,0 +1,508 @@
+"""
+Politeness contains a per-host request scheduler which spaces
+requests to each host by its robots.txt crawl delay while
+interleaving requests across hosts
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+import urllib.parse
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from .aio import AsyncFetcher
+from .base import policy_read
+from .metrics import FetchMetrics
+from .cache import ResponseCache
+from .retry import FetchPolicy
+from .robots import robots_cache
+from .utils import host_key
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "HearthBot"
+
+
+def robots_delay(robots, agent: str):
+    """
+    Reads the delay between requests a robots.txt asks for,
+    preferring Crawl-delay over Request-rate
+
+    Parameters
+    ----------
+    robots : RobotFileParser
+        The parsed robots file
+    agent : str
+        The user agent we crawl as
+
+    Returns
+    -------
+    float or None
+        Seconds between requests, None when robots.txt is silent
+    """
+    crawl_delay = robots.crawl_delay(agent)
+
+    if crawl_delay is not None:
+        return float(crawl_delay)
+
+    request_rate = robots.request_rate(agent)
+
+    if request_rate is not None and request_rate.requests:
+        return request_rate.seconds / request_rate.requests
+
+    return None
+
+
+class PolitenessScheduler:
+    """
+    The politeness scheduler keeps a queue of urls and a next
+    ready time per host, always handing out the url of the host
+    that becomes ready first
+
+    Parameters
+    ----------
+    default_delay : float
+        Seconds between requests to a host whose robots.txt
+        does not set a delay
+    agent : str
+        The user agent to look up in robots.txt
+    robots_loader : Callable[[str], RobotFileParser], optional
+        Loads the robots.txt at a url, the shared robots cache
+        by default
+    """
+
+    def __init__(
+        self,
+        default_delay: float = 1,
+        agent: str = USER_AGENT,
+        robots_loader: Callable = None,
+    ):
+        self.default_delay = default_delay
+        self.agent = agent
+        self.robots_loader = robots_loader or robots_cache.get
+
+        self.delays = {}
+        self._robots = {}
+        self._queues = {}
+        self._ready = []
+        self._pending = 0
+
+        # host -> the earliest its next request may go out, kept after
+        # its queue runs dry so urls added later still wait their turn
+        self._booked = {}
+
+    def __len__(self):
+        return self._pending
+
+    @property
+    def hosts(self) -> List[str]:
+        return list(self._queues)
+
+    def add(self, url: str) -> None:
+        host = host_key(url)
+
+        if host not in self._queues:
+            self._queues[host] = deque()
+
+        queue = self._queues[host]
+
+        # An empty queue means the host is not in the ready heap
+        if not queue:
+            ready_at = max(time.monotonic(), self._booked.get(host, 0))
+            heapq.heappush(self._ready, (ready_at, host))
+
+        queue.append(url)
+        self._pending += 1
+
+    def add_all(self, url_list: Iterable[str]) -> None:
+        for url in url_list:
+            self.add(url)
+
+    def robots_for(self, host: str):
+        # The host's parsed robots.txt through robots_loader, None
+        # when it could not be read
+        if host not in self._robots:
+            try:
+                self._robots[host] = self.robots_loader(f"{host}/robots.txt")
+            except Exception as e:
+                logger.info(f"{host} robots.txt made an exception: {e}")
+                self._robots[host] = None
+
+        return self._robots[host]
+
+    def delay_for(self, host: str) -> float:
+        if host not in self.delays:
+            robots = self.robots_for(host)
+            delay = None
+
+            if robots is not None:
+                delay = robots_delay(robots, self.agent)
+
+            self.delays[host] = (
+                delay if delay is not None else self.default_delay
+            )
+
+        return self.delays[host]
+
+    def filter_allowed(self, urls: List[str]) -> List[str]:
+        """
+        Drops the urls robots.txt disallows for the agent, reading it
+        through robots_loader so the allow rules and the delays come
+        from the same file. Urls of a host whose robots.txt could not
+        be read are kept
+        """
+        allowed = []
+
+        for url in urls:
+            robots = self.robots_for(host_key(url))
+
+            if robots is None or robots.can_fetch(self.agent, url):
+                allowed.append(url)
+
+        if len(allowed) < len(urls):
+            logger.info(
+                f"robots.txt disallowed {len(urls) - len(allowed)} urls"
+            )
+
+        return allowed
+
+    def pop(self) -> Tuple[str, float]:
+        """
+        Takes the next url off of the host which is ready soonest
+        and books that host's following slot
+
+        Returns
+        -------
+        Tuple[str, float]
+            The url and the time.monotonic() it may be fetched at
+        """
+        if not self._pending:
+            raise IndexError("pop from an empty scheduler")
+
+        ready_at, host = heapq.heappop(self._ready)
+
+        # A retry booked since the host was queued pushes it back
+        while self._booked.get(host, 0) > ready_at:
+            ready_at, host = heapq.heappushpop(
+                self._ready, (self._booked[host], host)
+            )
+
+        queue = self._queues[host]
+        url = queue.popleft()
+        self._pending -= 1
+
+        next_ready = max(ready_at, time.monotonic()) + self.delay_for(host)
+        self._booked[host] = next_ready
+
+        if queue:
+            heapq.heappush(self._ready, (next_ready, host))
+
+        return url, ready_at
+
+    def retry_delay(self, url: str, wait: float) -> float:
+        """
+        Books a retry of url into its host's slots, no sooner than
+        wait seconds from now, for FetchPolicy.call's backoff
+
+        Returns
+        -------
+        float
+            The seconds to wait before retrying
+        """
+        host = host_key(url)
+        now = time.monotonic()
+        retry_at = max(now + wait, self._booked.get(host, 0))
+        self._booked[host] = retry_at + self.delay_for(host)
+
+        return retry_at - now
+
+    def drain(self, host: str) -> List[str]:
+        """
+        Takes every url still queued for host off of the scheduler
+        """
+        queue = self._queues.get(host)
+
+        if not queue:
+            return []
+
+        self._ready = [entry for entry in self._ready if entry[1] != host]
+        heapq.heapify(self._ready)
+
+        urls = list(queue)
+        queue.clear()
+        self._pending -= len(urls)
+
+        return urls
+
+
+def polite_iter_query(
+    url_list: Iterable[str],
+    delay: float = 1,
+    agent: str = USER_AGENT,
+    robots_loader: Callable = None,
+    respect_robots: bool = True,
+    cache: ResponseCache = None,
+    policy: FetchPolicy = None,
+    metrics: FetchMetrics = None,
+    window: int = None,
+) -> Iterator[Tuple[str, bytes]]:
+    """
+    Reads urls politely one at a time, yielding each page as soon
+    as it arrives so callers can stream pages out of memory
+
+    Parameters
+    ----------
+    url_list : Iterable[str]
+        The urls to read
+    delay : float
+        Seconds between requests to hosts without a robots.txt delay
+    agent : str
+        The user agent to look up in robots.txt
+    robots_loader : Callable[[str], RobotFileParser], optional
+        Loads the robots.txt at a url, which gives both the crawl
+        delays and the urls allowed
+    respect_robots : bool, optional
+        Skip urls robots.txt disallows, default: True
+    cache : ResponseCache, optional
+        Revalidate and store bodies through this response cache
+    policy : FetchPolicy, optional
+        The retry and circuit breaker policy, a default one if not
+        given
+    metrics : FetchMetrics, optional
+        Time every request into these metrics
+    window : int, optional
+        Schedule urls this many at a time, taking the next ones off
+        url_list as the scheduler runs low, so a long stream of urls
+        is never held in memory. Duplicates are only dropped within a
+        window. None schedules every url up front
+
+    Returns
+    -------
+    Iterator[Tuple[str, bytes]]
+        The (url, body) pairs in fetch order, None for failed urls and
+        without disallowed urls
+    """
+    policy = policy if policy is not None else FetchPolicy()
+
+    urls = iter(url_list)
+    scheduler = PolitenessScheduler(delay, agent, robots_loader)
+
+    def _refill():
+        # Keep going past windows robots.txt disallows entirely, so
+        # the scheduler only runs dry once url_list does
+        while True:
+            batch = list(dict.fromkeys(itertools.islice(urls, window)))
+
+            if not batch:
+                return
+
+            if respect_robots:
+                batch = scheduler.filter_allowed(batch)
+
+            scheduler.add_all(batch)
+
+            if batch:
+                return
+
+    _refill()
+
+    while scheduler:
+        url, ready_at = scheduler.pop()
+        host = host_key(url)
+
+        # A host whose circuit is open fails its urls straight away,
+        # none of them waits out the crawl delay
+        if policy.breaker.is_blocked(host):
+            for url in [url, *scheduler.drain(host)]:
+                yield url, policy_read(
+                    url, policy, cache=cache, metrics=metrics
+                )
+        else:
+            time.sleep(max(0, ready_at - time.monotonic()))
+            yield url, policy_read(
+                url,
+                policy,
+                cache=cache,
+                metrics=metrics,
+                backoff=scheduler.retry_delay,
+            )
+
+        # Top up once half the window is spent, so hosts from the next
+        # window can interleave with the tail of this one
+        if window is not None and len(scheduler) <= window // 2:
+            _refill()
+
+
+def polite_bulk_query(
+    url_list: List[str],
+    delay: float = 1,
+    agent: str = USER_AGENT,
+    robots_loader: Callable = None,
+    respect_robots: bool = True,
+    cache: ResponseCache = None,
+    policy: FetchPolicy = None,
+    metrics: FetchMetrics = None,
+) -> Dict[str, bytes]:
+    """
+    Drop-in for serial_bulk_query which waits per host rather than
+    before every url, so a crawl over many hosts takes about as long
+    as its slowest host
+
+    Parameters
+    ----------
+    url_list : List[str]
+        The urls to read
+    delay : float
+        Seconds between requests to hosts without a robots.txt delay
+    agent : str
+        The user agent to look up in robots.txt
+    robots_loader : Callable[[str], RobotFileParser], optional
+        Loads the robots.txt at a url, which gives both the crawl
+        delays and the urls allowed
+    respect_robots : bool, optional
+        Skip urls robots.txt disallows, default: True
+    cache : ResponseCache, optional
+        Revalidate and store bodies through this response cache
+    policy : FetchPolicy, optional
+        The retry and circuit breaker policy, a default one if not
+        given
+    metrics : FetchMetrics, optional
+        Time every request into these metrics
+
+    Returns
+    -------
+    Dict[str, bytes]
+        The url-indexed page bodies, None for failed urls and without
+        disallowed urls
+    """
+    return dict(
+        polite_iter_query(
+            url_list,
+            delay,
+            agent,
+            robots_loader,
+            respect_robots,
+            cache,
+            policy,
+            metrics,
+        )
+    )
+
+
+async def polite_fetch_all(
+    fetcher: AsyncFetcher, scheduler: PolitenessScheduler
+) -> Dict[str, bytes]:
+    """
+    Dispatches the scheduler's urls onto an async fetcher as each
+    host becomes ready, so slow responses from one host never hold
+    up the others
+
+    Parameters
+    ----------
+    fetcher : AsyncFetcher
+        The fetcher to read with
+    scheduler : PolitenessScheduler
+        The loaded scheduler
+
+    Returns
+    -------
+    Dict[str, bytes]
+        The url-indexed page bodies, None for failed urls
+    """
+    loaded = {}
+    tasks = []
+
+    async def _read_into(url: str):
+        loaded[url] = await fetcher.fetch_or_none(url, scheduler.retry_delay)
+
+    while scheduler:
+        url, ready_at = scheduler.pop()
+        host = host_key(url)
+
+        # As in polite_iter_query, an open circuit fails a host's urls
+        # without waiting on its crawl delay
+        if fetcher.policy is not None and fetcher.policy.breaker.is_blocked(
+            host
+        ):
+            urls = [url, *scheduler.drain(host)]
+        else:
+            await asyncio.sleep(max(0, ready_at - time.monotonic()))
+            urls = [url]
+
+        tasks.extend(asyncio.ensure_future(_read_into(url)) for url in urls)
+
+    await asyncio.gather(*tasks)
+
+    return loaded
+
+
+def async_polite_bulk_query(
+    url_list: List[str],
+    delay: float = 1,
+    agent: str = USER_AGENT,
+    robots_loader: Callable = None,
+    respect_robots: bool = True,
+    timeout: int = 30,
+    cache: ResponseCache = None,
+    policy: FetchPolicy = None,
+    metrics: FetchMetrics = None,
+) -> Dict[str, bytes]:
+    """
+    Polite bulk query over the async fetcher
+
+    Parameters
+    ----------
+    url_list : List[str]
+        The urls to read
+    delay : float
+        Seconds between requests to hosts without a robots.txt delay
+    agent : str
+        The user agent to look up in robots.txt
+    robots_loader : Callable[[str], RobotFileParser], optional
+        Loads the robots.txt at a url, which gives both the crawl
+        delays and the urls allowed
+    respect_robots : bool, optional
+        Skip urls robots.txt disallows, default: True
+    timeout : int
+        Seconds allowed for a single request
+    cache : ResponseCache, optional
+        Revalidate and store bodies through this response cache
+    policy : FetchPolicy, optional
+        Retry transient failures and fail fast on dead hosts
+    metrics : FetchMetrics, optional
+        Time every request into these metrics
+
+    Returns
+    -------
+    Dict[str, bytes]
+        The url-indexed page bodies, None for failed urls and
+        without disallowed urls
+    """
+    url_list = list(dict.fromkeys(url_list))
+
+    scheduler = PolitenessScheduler(delay, agent, robots_loader)
+
+    if respect_robots:
+        url_list = scheduler.filter_allowed(url_list)
+
+    scheduler.add_all(url_list)
+
+    # robots.txt is read with blocking urllib, so warm the delays
+    # up front instead of stalling the loop on each new host
+    for host in scheduler.hosts:
+        scheduler.delay_for(host)
+
+    async def _run():
+        async with AsyncFetcher(
+            timeout=timeout,
+            user_agent=agent,
+            cache=cache,
+            policy=policy,
+            metrics=metrics,
+        ) as fetcher:
+            return await polite_fetch_all(fetcher, scheduler)
+
+    return asyncio.run(_run())
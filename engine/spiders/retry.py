@@ -0,0 +1,374 @@
+"""
+Retry contains the fetch policy, which retries transient failures
+with jittered backoff and trips a per-host circuit breaker so the
+rest of a dead host's urls fail fast instead of each timing out
+"""
+
+import asyncio
+import http.client
+import logging
+import random
+import socket
+import threading
+import time
+import urllib.error
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from .limits import MAX_RETRY_AFTER, parse_retry_after
+from .utils import host_key
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth asking again for
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+# How a failure is handled, see classify_failure
+RETRY = "retry"
+HOST_DOWN = "host_down"
+FATAL = "fatal"
+
+
+class CircuitOpenError(urllib.error.URLError):
+    """
+    Raised instead of fetching from a host whose circuit is open
+    """
+
+    def __init__(self, host: str, remaining: float):
+        super().__init__(
+            f"circuit open for {host}, retrying in {remaining:.0f}s"
+        )
+        self.host = host
+        self.remaining = remaining
+
+
+def classify_failure(e: BaseException) -> Tuple[str, float]:
+    """
+    Sorts a fetch failure into one worth retrying, one which says the
+    host is unreachable, or a fatal one like a 404 which says nothing
+    about the host's health
+
+    Parameters
+    ----------
+    e : BaseException
+        The exception the fetch raised
+
+    Returns
+    -------
+    Tuple[str, float]
+        RETRY, HOST_DOWN or FATAL, and the seconds the server asked us
+        to wait before retrying
+    """
+    if isinstance(e, CircuitOpenError):
+        return FATAL, 0.0
+
+    if isinstance(e, urllib.error.HTTPError):
+        if e.code not in RETRY_STATUSES:
+            return FATAL, 0.0
+
+        headers = e.headers if e.headers is not None else {}
+
+        return RETRY, min(
+            MAX_RETRY_AFTER, parse_retry_after(headers.get("retry-after"))
+        )
+
+    # urllib wraps socket errors, the async fetcher raises them bare
+    if isinstance(e, urllib.error.URLError) and isinstance(
+        e.reason, BaseException
+    ):
+        e = e.reason
+
+    if isinstance(e, socket.gaierror):
+        return HOST_DOWN, 0.0
+
+    if isinstance(
+        e,
+        (
+            TimeoutError,
+            # Not a TimeoutError before python 3.10
+            socket.timeout,
+            asyncio.TimeoutError,
+            ConnectionError,
+            asyncio.IncompleteReadError,
+            http.client.IncompleteRead,
+            http.client.BadStatusLine,
+        ),
+    ):
+        return RETRY, 0.0
+
+    return FATAL, 0.0
+
+
+class CircuitBreaker:
+    """
+    The circuit breaker opens for a host after threshold consecutive
+    failed attempts, failing its requests fast for reset_after
+    seconds. It then lets one probe through, closing again if the
+    probe succeeds and reopening if it does not
+
+    Parameters
+    ----------
+    threshold : int
+        Consecutive failures which open a host's circuit
+    reset_after : float
+        Seconds a circuit stays open before probing the host
+    """
+
+    def __init__(self, threshold: int = 5, reset_after: float = 60.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.trips = 0
+
+        self._failures = Counter()
+        self._opened = {}
+        self._probing = set()
+        self._lock = threading.Lock()
+
+    def check(self, host: str) -> None:
+        """
+        Raises
+        ------
+        CircuitOpenError
+            When the host's circuit is open, or half open with a
+            probe already out
+        """
+        with self._lock:
+            opened = self._opened.get(host)
+
+            if opened is None:
+                return
+
+            remaining = opened + self.reset_after - time.monotonic()
+
+            if remaining > 0 or host in self._probing:
+                raise CircuitOpenError(host, max(remaining, 0))
+
+            self._probing.add(host)
+
+    def success(self, host: str) -> None:
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened.pop(host, None)
+            self._probing.discard(host)
+
+    def failure(self, host: str) -> None:
+        with self._lock:
+            self._failures[host] += 1
+            probe = host in self._probing
+            self._probing.discard(host)
+
+            if probe or (
+                host not in self._opened
+                and self._failures[host] >= self.threshold
+            ):
+                if host not in self._opened:
+                    self.trips += 1
+                    logger.info(f"Circuit opened for {host}")
+
+                self._opened[host] = time.monotonic()
+
+    def is_open(self, host: str) -> bool:
+        with self._lock:
+            return host in self._opened
+
+    def is_blocked(self, host: str) -> bool:
+        """
+        Whether check would fail fast for host right now, rather than
+        let a request or probe through
+        """
+        with self._lock:
+            opened = self._opened.get(host)
+
+            if opened is None:
+                return False
+
+            return (
+                opened + self.reset_after > time.monotonic()
+                or host in self._probing
+            )
+
+    def open_hosts(self):
+        with self._lock:
+            return sorted(self._opened)
+
+
+class FetchPolicy:
+    """
+    The fetch policy runs fetches with retries and a circuit breaker,
+    and remembers why each url that failed did so
+
+    Transient failures, timeouts, dropped connections, 429 and 5xx
+    statuses, are retried after a full jitter backoff, or after the
+    server's Retry-After if that is longer. Other failures are raised
+    straight away
+
+    Parameters
+    ----------
+    retries : int
+        Retries after the first attempt
+    backoff : float
+        The backoff ceiling of the first retry in seconds, doubling
+        with each retry after it
+    max_backoff : float
+        The highest the backoff ceiling grows
+    breaker : CircuitBreaker, optional
+        The per host breaker, a default one if not given
+    """
+
+    def __init__(
+        self,
+        retries: int = 2,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        breaker: CircuitBreaker = None,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+
+        # url -> the reason it failed, and url -> retries it took
+        self.failures = {}
+        self.retry_counts = Counter()
+
+        self._lock = threading.Lock()
+
+    def delay(self, attempt: int, retry_after: float = 0.0) -> float:
+        """
+        The full jitter backoff before retry number attempt, spreading
+        retries out so failed requests do not come back in a wave
+        """
+        ceiling = min(self.max_backoff, self.backoff * 2**attempt)
+
+        return max(retry_after, random.uniform(0, ceiling))
+
+    def call(
+        self,
+        url: str,
+        fn: Callable[[str], Any],
+        backoff: Callable[[str, float], float] = None,
+    ) -> Any:
+        """
+        Fetches a url with fn under the policy
+
+        Parameters
+        ----------
+        url : str
+            The url to fetch
+        fn : Callable[[str], Any]
+            The fetch, like read
+        backoff : Callable[[str, float], float], optional
+            Turns the policy's wait before retrying url into the
+            seconds actually waited, so a scheduler can book retries
+            into the host's crawl delay
+
+        Returns
+        -------
+        Any
+            What fn returned
+
+        Raises
+        ------
+        Exception
+            The last failure once retries are used up, or
+            CircuitOpenError when the host's circuit is open
+        """
+        attempt = 0
+
+        while True:
+            try:
+                self.breaker.check(host_key(url))
+                result = fn(url)
+            except Exception as e:
+                wait = self._failed(url, e, attempt)
+
+                if wait is None:
+                    raise
+            else:
+                return self._succeeded(url, result)
+
+            if backoff is not None:
+                wait = backoff(url, wait)
+
+            time.sleep(wait)
+            attempt += 1
+
+    async def acall(
+        self,
+        url: str,
+        fn: Callable[[str], Awaitable[Any]],
+        backoff: Callable[[str, float], float] = None,
+    ) -> Any:
+        """
+        Fetches a url with the coroutine function fn under the policy,
+        see call
+        """
+        attempt = 0
+
+        while True:
+            try:
+                self.breaker.check(host_key(url))
+                result = await fn(url)
+            except Exception as e:
+                wait = self._failed(url, e, attempt)
+
+                if wait is None:
+                    raise
+            else:
+                return self._succeeded(url, result)
+
+            if backoff is not None:
+                wait = backoff(url, wait)
+
+            await asyncio.sleep(wait)
+            attempt += 1
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Returns
+        -------
+        Dict[str, Any]
+            The failed urls with their reasons, the retry count and
+            the hosts whose circuit is open
+        """
+        with self._lock:
+            return {
+                "failed": dict(self.failures),
+                "retries": sum(self.retry_counts.values()),
+                "open_hosts": self.breaker.open_hosts(),
+            }
+
+    def _succeeded(self, url: str, result: Any) -> Any:
+        self.breaker.success(host_key(url))
+
+        with self._lock:
+            self.failures.pop(url, None)
+
+        return result
+
+    def _failed(self, url: str, e: Exception, attempt: int):
+        # Records the failure and gives the seconds to wait before
+        # retrying, or None to give up
+        kind, retry_after = classify_failure(e)
+        host = host_key(url)
+
+        if isinstance(e, urllib.error.HTTPError) and kind == FATAL:
+            # The host answered, it just had nothing for us
+            self.breaker.success(host)
+        elif not isinstance(e, CircuitOpenError):
+            self.breaker.failure(host)
+
+        give_up = (
+            kind != RETRY
+            or attempt >= self.retries
+            or self.breaker.is_open(host)
+        )
+
+        with self._lock:
+            if give_up:
+                self.failures[url] = f"{type(e).__name__}: {e}"
+                return None
+
+            self.retry_counts[url] += 1
+
+        return self.delay(attempt, retry_after)
@@ -0,0 +1,165 @@
+"""
+Robots contains a process-wide robots.txt cache so each host's
+robots file is downloaded and parsed once per ttl, no matter how
+many queries or bulk fetches consult it
+"""
+
+import logging
+import threading
+import time
+import urllib.error
+import urllib.robotparser
+from typing import Iterable, List, Tuple
+
+from .base import read
+from .utils import host_key
+
+logger = logging.getLogger(__name__)
+
+
+class RobotsCache:
+    """
+    The robots cache keeps one parsed robots.txt per scheme and
+    host. Missing robots files (4xx) are cached as allow-all and
+    unreachable ones (5xx, network errors) as disallow-all for the
+    shorter error ttl, so failing hosts are not asked again on
+    every call
+
+    Parameters
+    ----------
+    ttl : float
+        Seconds a downloaded robots.txt stays fresh
+    error_ttl : float
+        Seconds an unreachable robots.txt is remembered
+    timeout : int
+        Seconds allowed for downloading a robots.txt
+    """
+
+    def __init__(
+        self, ttl: float = 86400, error_ttl: float = 600, timeout: int = 30
+    ):
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.timeout = timeout
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._host_locks = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, url: str) -> urllib.robotparser.RobotFileParser:
+        """
+        Gets the parsed robots.txt covering a url, downloading it
+        when it is not cached or has expired
+
+        Parameters
+        ----------
+        url : str
+            Any url on the host, including the robots.txt url itself
+
+        Returns
+        -------
+        RobotFileParser
+            The robot file parser instance
+        """
+        host = host_key(url)
+
+        with self._lock:
+            host_lock = self._host_locks.setdefault(host, threading.Lock())
+
+        # Threads asking for the same host wait on one download
+        with host_lock:
+            entry = self._entries.get(host)
+
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            robots, ttl = self._load(f"{host}/robots.txt")
+
+            with self._lock:
+                self._entries[host] = (time.monotonic() + ttl, robots)
+
+        return robots
+
+    def can_fetch(self, url: str, agent: str) -> bool:
+        return self.get(url).can_fetch(agent, url)
+
+    def filter_allowed(self, urls: Iterable[str], agent: str) -> List[str]:
+        """
+        Drops the urls robots.txt disallows for an agent, keeping
+        the order of the rest
+
+        Parameters
+        ----------
+        urls : Iterable[str]
+            The urls to check
+        agent : str
+            The user agent we crawl as
+
+        Returns
+        -------
+        List[str]
+            The allowed urls
+        """
+        allowed = []
+        disallowed = 0
+
+        for url in urls:
+            if self.can_fetch(url, agent):
+                allowed.append(url)
+            else:
+                disallowed += 1
+
+        if disallowed:
+            logger.info(f"robots.txt disallowed {disallowed} urls")
+
+        return allowed
+
+    def _load(
+        self, robots_url: str
+    ) -> Tuple[urllib.robotparser.RobotFileParser, float]:
+        logger.info(f"Loading {robots_url}")
+        robots = urllib.robotparser.RobotFileParser()
+        robots.set_url(robots_url)
+        ttl = self.ttl
+
+        try:
+            # robots.txt is served as text/plain
+            raw = read(robots_url, self.timeout, content_types=None)
+        except urllib.error.HTTPError as e:
+            if e.code in (401, 403):
+                robots.disallow_all = True
+            elif e.code < 500:
+                robots.allow_all = True
+            else:
+                robots.disallow_all = True
+                ttl = self.error_ttl
+        except Exception as e:
+            logger.info(f"{robots_url} made an exception: {e}")
+            robots.disallow_all = True
+            ttl = self.error_ttl
+        else:
+            robots.parse(raw.decode("utf-8", errors="ignore").splitlines())
+
+        robots.modified()
+
+        return robots, ttl
+
+
+# Shared by every query and bulk fetch in the process
+robots_cache = RobotsCache()
+
+
+def filter_allowed(urls: Iterable[str], agent: str) -> List[str]:
+    return robots_cache.filter_allowed(urls, agent)
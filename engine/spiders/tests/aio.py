@@ -0,0 +1,62 @@
+import asyncio
+import unittest
+
+from ..aio import async_bulk_query, AsyncFetcher
+from .server import StandInServer, page_body
+
+
+class TestAio(unittest.TestCase):
+    def test_async_bulk_query(self):
+        with StandInServer() as server:
+            urls = [server.url(f"/page/{i}") for i in range(50)]
+            missing = server.url("/status/404")
+
+            loaded = async_bulk_query(urls + [missing], max_per_host=4)
+
+            self.assertEqual(len(loaded), 51)
+            self.assertIsNone(loaded[missing])
+            for i, url in enumerate(urls):
+                self.assertEqual(loaded[url], page_body(f"/page/{i}"))
+
+            # Four host slots means at most four sockets were opened
+            self.assertLessEqual(server.connections, 4)
+
+    def test_redirect_and_chunked(self):
+        with StandInServer() as server:
+            redirect = server.url("/redirect?to=/page/7")
+            chunked = server.url("/chunked")
+
+            loaded = async_bulk_query([redirect, chunked])
+
+            self.assertEqual(loaded[redirect], page_body("/page/7"))
+            self.assertEqual(loaded[chunked], b"<p>chunked body</p>")
+
+    def test_timeout(self):
+        with StandInServer() as server:
+            slow = server.url("/page/0?delay=1")
+
+            loaded = async_bulk_query([slow], timeout=0.2)
+
+            self.assertIsNone(loaded[slow])
+
+    def test_fetcher_reuses_connections(self):
+        async def _run(urls, missing):
+            async with AsyncFetcher(max_per_host=1) as fetcher:
+                bodies = [await fetcher.fetch(url) for url in urls]
+                failed = await fetcher.fetch_or_none(missing)
+
+            return bodies, failed
+
+        with StandInServer() as server:
+            urls = [server.url(f"/page/{i}") for i in range(5)]
+            missing = server.url("/status/404")
+
+            bodies, failed = asyncio.run(_run(urls, missing))
+
+            self.assertEqual(
+                bodies, [page_body(f"/page/{i}") for i in range(5)]
+            )
+            self.assertIsNone(failed)
+
+            # Sequential requests to one host share a single socket
+            self.assertEqual(server.connections, 1)
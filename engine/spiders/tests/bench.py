@@ -0,0 +1,421 @@
+"""
+Bench contains benchmarks for the crawl hot paths, run from the
+engine folder with `python -m spiders.tests.bench <name>`
+"""
+
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+from ..aio import async_bulk_query
+from ..base import concurrent_bulk_query, concurrent_batch_process_page_data
+from ..extract import (
+    TAGS,
+    concurrent_batch_extract_page_data,
+    extract_links,
+    extract_reader_view,
+    extract_summary,
+    fast_extract_reader_view,
+    fast_extract_summary,
+)
+from ..limits import AdaptiveLimiter
+from .server import StandInServer
+
+
+def timed(label: str, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {elapsed:.3f}s")
+
+    return result, elapsed
+
+
+def bench_fetch(n: int = 2000, latency: float = 0.05):
+    """
+    Fetches n pages with simulated server latency through the
+    thread-per-cpu fetcher and the asyncio fetcher
+    """
+    with StandInServer() as server:
+        urls = [server.url(f"/page/{i}?delay={latency}") for i in range(n)]
+
+        timed("concurrent_bulk_query", concurrent_bulk_query, urls)
+        timed(
+            "async_bulk_query",
+            async_bulk_query,
+            urls,
+            max_in_flight=1024,
+            max_per_host=256,
+        )
+
+
+def bench_adaptive(n: int = 1000, latency: float = 0.02, capacity: int = 8):
+    """
+    Fetches n pages from a host which sheds load past capacity, with
+    a fixed per host limit above it and with the adaptive limiter
+    """
+    with StandInServer() as server:
+        server.capacity = capacity
+        urls = [server.url(f"/page/{i}?delay={latency}") for i in range(n)]
+
+        loaded, _ = timed(
+            "fixed 64 per host", async_bulk_query, urls, max_per_host=64
+        )
+        print(f"  failed: {sum(body is None for body in loaded.values())}")
+
+        limiter = AdaptiveLimiter(max_per_host=64)
+        loaded, _ = timed(
+            "adaptive",
+            async_bulk_query,
+            urls,
+            max_per_host=64,
+            limiter=limiter,
+        )
+        print(f"  failed: {sum(body is None for body in loaded.values())}")
+        print(f"  limits: {limiter.stats()['hosts'][server.base_url]}")
+
+
+def sample_page(i: int, paragraphs: int = 200) -> bytes:
+    body = "".join(
+        f"<div class='row'><p>Paragraph {j} of page {i} with "
+        f"<a href='/link/{j}'>a link</a> and <b>bold</b> text.</p>"
+        f"<img src='/img/{j}.png' width='10'>"
+        f"<script>var x{j} = {j};</script></div>"
+        for j in range(paragraphs)
+    )
+
+    return (
+        f"<html><head><title>Page {i}</title>"
+        f"<meta name='description' content='Page {i}'></head><body>"
+        f"<nav><a href='/'>home</a></nav><h1>Page {i}</h1>{body}"
+        f"<footer>footer</footer></body></html>"
+    ).encode()
+
+
+def bench_parse(n: int = 200):
+    """
+    Turns n pages into reader view text through the thread pool
+    of soups and through the process pool of extractors
+    """
+    pages = {f"https://a.com/{i}": sample_page(i) for i in range(n)}
+
+    def _threaded():
+        parsed = concurrent_batch_process_page_data(pages)
+        return {
+            url: [element.text for element in html.find_all(TAGS)]
+            for url, html in parsed.items()
+        }
+
+    threaded, _ = timed("thread pool + soups", _threaded)
+    processed, _ = timed(
+        "process pool extract", concurrent_batch_extract_page_data, pages
+    )
+    assert threaded == processed
+
+
+def bench_reader_view(n: int = 100):
+    """
+    Extracts the reader view of n pages with a full soup tree and
+    with the streaming parser, checking they agree
+    """
+    pages = [sample_page(i) for i in range(n)]
+
+    soup, soup_time = timed(
+        "soup reader view", lambda: [extract_reader_view(p) for p in pages]
+    )
+    fast, fast_time = timed(
+        "fast reader view",
+        lambda: [fast_extract_reader_view(p) for p in pages],
+    )
+    assert soup == fast
+
+    print(
+        f"per page: {soup_time / n * 1000:.2f}ms -> "
+        f"{fast_time / n * 1000:.2f}ms ({soup_time / fast_time:.1f}x)"
+    )
+
+
+def bench_summary(n: int = 100):
+    """
+    Summarizes n pages with make_summary over a soup tree and with
+    the single pass summary parser
+    """
+    pages = [sample_page(i) for i in range(n)]
+
+    timed("make_summary", lambda: [extract_summary(p) for p in pages])
+    timed("fast summary", lambda: [fast_extract_summary(p) for p in pages])
+
+
+def bench_links(n: int = 100):
+    """
+    Pulls the /link hrefs out of n pages with soup find_all and with
+    the streaming anchor extractor
+    """
+    pages = [sample_page(i) for i in range(n)]
+
+    def _soup(html):
+        doc = BeautifulSoup(html, features="html.parser")
+        return [
+            link.get("href")
+            for link in doc.find_all("a")
+            if link.get("href") and link.get("href").startswith("/link")
+        ]
+
+    soup, soup_time = timed("soup find_all", lambda: [_soup(p) for p in pages])
+    fast, fast_time = timed(
+        "streaming links",
+        lambda: [extract_links(p, prefixes=["/link"]) for p in pages],
+    )
+    assert soup == fast
+
+    print(f"{soup_time / fast_time:.1f}x")
+
+
+def bench_discover(n: int = 200, latency: float = 0.05):
+    """
+    Discovers the articles of n paginated listing pages with one
+    worker, like the old serial loop, and with a pool of workers
+    """
+    # Run from the engine folder, where the dataloader lives
+    from dataloader import discover_links
+
+    def listing(links):
+        return "".join(f"<a href='{link}'>link</a>" for link in links).encode()
+
+    with StandInServer() as server:
+        pages = [server.url(f"/list/{i}?delay={latency}") for i in range(n)]
+        server.routes["/list"] = listing(pages)
+
+        for i in range(n):
+            server.routes[f"/list/{i}"] = listing(
+                [server.url(f"/news/{i}"), server.url(f"/news/{i + 1}")]
+            )
+
+        serial, _ = timed(
+            "serial discovery",
+            discover_links,
+            server.url("/list"),
+            server.url("/"),
+            "news",
+            workers=1,
+        )
+        pooled, _ = timed(
+            "concurrent discovery",
+            discover_links,
+            server.url("/list"),
+            server.url("/"),
+            "news",
+            workers=32,
+        )
+        assert sorted(serial) == sorted(pooled) and len(pooled) == n + 1
+
+
+def bench_transfer(n: int = 500, blobs: int = 20, blob_size: int = 4_000_000):
+    """
+    Fetches n pages mixed with large pdfs, reading every body in full
+    as the fetcher used to and with compressed transfer and the
+    content type and size checks
+    """
+    with StandInServer() as server:
+        for i in range(n):
+            server.routes[f"/page/{i}"] = sample_page(i)
+
+        urls = [server.url(f"/page/{i}") for i in range(n)] + [
+            server.url(f"/blob/{blob_size}?type=application/pdf&n={i}")
+            for i in range(blobs)
+        ]
+
+        server.compress = False
+        timed(
+            "uncompressed, any type",
+            async_bulk_query,
+            urls,
+            max_body=None,
+            content_types=None,
+        )
+        print(f"  body bytes sent: {server.sent / 1e6:.1f}MB")
+
+        server.compress = True
+        sent = server.sent
+        loaded, _ = timed("gzip, html only", async_bulk_query, urls)
+        print(f"  body bytes sent: {(server.sent - sent) / 1e6:.1f}MB")
+        read = sum(body is not None for body in loaded.values())
+        print(f"  pages read: {read}")
+
+
+def bench_index(categories: int = 200, links: int = 5000):
+    """
+    Opens one category of an index of categories * links links by
+    parsing the whole index, and through the index log's directory
+    """
+    import json
+    import os
+    import tempfile
+
+    from ..corpus.indexer import Indexer
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "indexed.jsonl")
+        index = {
+            f"c{c}": [f"https://site{c}.com/article/{i}" for i in range(links)]
+            for c in range(categories)
+        }
+
+        with open(os.path.join(tmp, "indexed.json"), "w") as f:
+            json.dump(index, f)
+
+        writer = Indexer(index, path)
+        writer.serialize_index_file()
+        writer.log.close()
+        os.unlink(f"{path}.idx")
+
+        def _whole():
+            indexer = Indexer({}, os.path.join(tmp, "indexed.json"))
+            indexer.deserialize_index_file()
+            return len(indexer.local_index["c7"])
+
+        def _lazy():
+            indexer = Indexer(index_file=path)
+            indexer.deserialize_index_file()
+            return sum(len(batch) for batch in indexer.iter_links("c7"))
+
+        timed("json.load whole index", _whole)
+        timed("lazy, building the directory", _lazy)
+        timed("lazy", _lazy)
+
+
+def bench_tokenize(n: int = 400):
+    """
+    Tokenizes the reader view of n pages into words in this process
+    and across the process pool, checking the order matches
+    """
+    from ..corpus.fetcher import unwrap_context_and_extract
+
+    reader = {
+        f"https://a.com/{i}": fast_extract_reader_view(sample_page(i))
+        for i in range(n)
+    }
+
+    serial, serial_time = timed(
+        "serial", unwrap_context_and_extract, reader, "words"
+    )
+    parallel, parallel_time = timed(
+        "process pool", unwrap_context_and_extract, reader, "words", None
+    )
+    assert serial == parallel
+
+    print(f"{len(serial)} tokens, {serial_time / parallel_time:.1f}x")
+
+
+def bench_stem(n: int = 500000, vocabulary: int = 20000):
+    """
+    Counts n Zipf distributed tokens, stemming every occurrence as
+    the counter used to and stemming each distinct type once
+    """
+    import random
+    import string
+    from collections import Counter
+
+    from nltk.stem import SnowballStemmer
+
+    from ..corpus.fetcher import raw_corpus_to_frequency_vector
+
+    rng = random.Random(0)
+    words = [
+        "".join(
+            rng.choice(string.ascii_lowercase)
+            for _ in range(rng.randint(3, 10))
+        )
+        for _ in range(vocabulary)
+    ]
+    weights = [1 / rank for rank in range(1, vocabulary + 1)]
+    tokens = rng.choices(words, weights, k=n)
+
+    def _every():
+        stemmer = SnowballStemmer("english")
+        return dict(
+            Counter(
+                stemmer.stem(token)
+                for token in tokens
+                if token not in string.punctuation
+            )
+        )
+
+    every, every_time = timed("stem every token", _every)
+    once, once_time = timed(
+        "stem each type once", raw_corpus_to_frequency_vector, tokens
+    )
+    assert every == once
+
+    print(f"{len(set(tokens))} types, {every_time / once_time:.1f}x")
+
+
+def bench_vocab(n: int = 2000000):
+    """
+    Opens a vocabulary of n words from freq.json and from a vocab
+    file, with the Python heap each leaves behind
+    """
+    import json
+    import os
+    import tempfile
+    import tracemalloc
+
+    from ..corpus.vocab import Vocab, json_to_vocab
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "freq.json")
+        vocab_path = os.path.join(tmp, "freq.vocab")
+
+        with open(json_path, "w") as f:
+            json.dump({f"word{i}": n - i for i in range(n)}, f)
+
+        json_to_vocab(json_path, vocab_path)
+
+        def _json():
+            with open(json_path) as f:
+                return json.load(f)
+
+        def _vocab():
+            return Vocab(vocab_path)
+
+        for label, path, load in (
+            ("freq.json", json_path, _json),
+            ("freq.vocab", vocab_path, _vocab),
+        ):
+            loaded, _ = timed(label, load)
+
+            # Measured apart, tracing slows the load itself down
+            tracemalloc.start()
+            loaded = load()
+            heap = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            print(
+                f"  {os.path.getsize(path) / 1e6:.1f}MB on disk, "
+                f"{heap / 1e6:.1f}MB heap, {len(loaded)} words"
+            )
+
+
+BENCHMARKS = {
+    "fetch": bench_fetch,
+    "adaptive": bench_adaptive,
+    "parse": bench_parse,
+    "reader_view": bench_reader_view,
+    "summary": bench_summary,
+    "links": bench_links,
+    "discover": bench_discover,
+    "transfer": bench_transfer,
+    "index": bench_index,
+    "tokenize": bench_tokenize,
+    "stem": bench_stem,
+    "vocab": bench_vocab,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+
+    for name in names:
+        print(f"== {name}")
+        BENCHMARKS[name]()
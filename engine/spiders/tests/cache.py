@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+from ..aio import async_bulk_query
+from ..base import read
+from ..cache import ResponseCache
+from .server import StandInServer, page_body
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "responses.sqlite3")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_conditional_get(self):
+        with StandInServer() as server:
+            url = server.url("/page/1")
+            cache = ResponseCache(self.path)
+
+            self.assertEqual(read(url, cache=cache), page_body("/page/1"))
+            self.assertEqual(read(url, cache=cache), page_body("/page/1"))
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+            # The async fetcher revalidates against the same file
+            reopened = ResponseCache(self.path)
+            loaded = async_bulk_query([url], cache=reopened)
+
+            self.assertEqual(loaded[url], page_body("/page/1"))
+            self.assertEqual((reopened.hits, reopened.misses), (1, 0))
+
+    def test_lru_eviction(self):
+        with StandInServer() as server:
+            urls = [server.url(f"/page/{i}") for i in range(10)]
+            cache = ResponseCache(self.path, max_bytes=400)
+
+            for url in urls:
+                read(url, cache=cache)
+
+            self.assertLessEqual(cache.size, 400)
+            self.assertGreater(cache.evictions, 0)
+            self.assertIn(urls[-1], cache)
+            self.assertNotIn(urls[0], cache)
@@ -0,0 +1,124 @@
+import os
+import random
+import tempfile
+import unittest
+from collections import Counter
+
+from ..corpus.counts import (
+    CountStore,
+    count_pages,
+    counts_path,
+    reduce_counts,
+)
+from ..corpus.fetcher import page_frequency_vector
+from ..corpus.store import PageStore
+from .fetcher import has_punkt
+
+
+class TestCountStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "counts.sqlite3")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_add_and_remove(self):
+        with CountStore(self.path) as counts:
+            counts.put("d1", {"cat": 2, "dog": 1})
+            counts.put("d2", {"cat": 1, "fish": 4})
+            counts.put("d3", {"bird": 1})
+
+            self.assertTrue(counts.add("pets", "a", "d1"))
+            self.assertTrue(counts.add("pets", "b", "d2"))
+            self.assertFalse(counts.add("pets", "b", "d2"))
+            self.assertEqual(
+                counts.totals("pets"), {"cat": 3, "dog": 1, "fish": 4}
+            )
+
+            # A changed page swaps its counts, a removed one takes them out
+            counts.add("pets", "a", "d3")
+            self.assertEqual(
+                counts.totals("pets"), {"bird": 1, "cat": 1, "fish": 4}
+            )
+
+            self.assertTrue(counts.remove("pets", "b"))
+            self.assertFalse(counts.remove("pets", "b"))
+            self.assertEqual(counts.totals("pets"), {"bird": 1})
+
+            with self.assertRaises(KeyError):
+                counts.add("pets", "c", "d4")
+
+        with CountStore(self.path) as counts:
+            self.assertEqual(counts.members("pets"), {"a": "d3"})
+            self.assertEqual(counts.get("d2"), {"cat": 1, "fish": 4})
+
+    def test_update_and_recount(self):
+        with CountStore(self.path) as counts:
+            for i in range(6):
+                counts.put(f"d{i}", {"page": 1, f"t{i % 3}": i + 1})
+
+            self.assertEqual(
+                counts.update("c", {f"u{i}": f"d{i}" for i in range(4)}),
+                (4, 0),
+            )
+            self.assertEqual(
+                counts.update("c", {"u0": "d0", "u1": "d5", "u9": "d4"}),
+                (2, 2),
+            )
+
+            expected = {"page": 3, "t0": 1, "t1": 5, "t2": 6}
+            self.assertEqual(counts.totals("c"), expected)
+            self.assertEqual(counts.recount("c", workers=1), expected)
+            self.assertEqual(counts.totals("c"), expected)
+
+
+class TestReduceCounts(unittest.TestCase):
+    def test_parallel_matches_serial(self):
+        rng = random.Random(3)
+        vectors = [
+            {f"t{rng.randrange(50)}": rng.randint(1, 9) for _ in range(20)}
+            for _ in range(300)
+        ]
+        expected = Counter()
+
+        for vector in vectors:
+            expected.update(vector)
+
+        serial = reduce_counts(vectors, workers=1)
+        parallel = reduce_counts(iter(vectors), workers=3, chunksize=16)
+
+        self.assertEqual(serial, dict(expected))
+        self.assertEqual(list(parallel.items()), list(serial.items()))
+        self.assertEqual(list(serial), sorted(serial))
+
+
+@unittest.skipUnless(has_punkt(), "the nltk punkt model is not installed")
+class TestCountPages(unittest.TestCase):
+    def test_counts_each_body_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = PageStore(tmp)
+            bodies = [
+                f"<html><body><p>Page {i} talks about cats.</p></body>"
+                f"</html>".encode()
+                for i in range(3)
+            ]
+
+            for i, body in enumerate(bodies):
+                store.put(f"http://a.test/{i}", body)
+
+            store.put("http://b.test/copy", bodies[0])
+
+            with CountStore(counts_path(store)) as counts:
+                self.assertEqual(count_pages(store, counts, workers=2), 3)
+                self.assertEqual(count_pages(store, counts, workers=2), 0)
+                self.assertEqual(
+                    counts.get(store.digest("http://a.test/1")),
+                    page_frequency_vector(bodies[1]),
+                )
+
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
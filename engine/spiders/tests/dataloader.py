@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+
+# Run from the engine folder, where the dataloader lives
+from dataloader import discover_links, load_data
+
+from ..corpus.indexer import Indexer
+from .server import StandInServer
+
+
+def listing(links):
+    return "".join(f"<a href='{link}'>link</a>" for link in links).encode()
+
+
+class TestDiscoverLinks(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.server = StandInServer().__enter__()
+
+        url = self.server.url
+        self.server.routes["/list"] = listing(
+            [url("/list/1"), url("/news/a"), url("/news/a#disqus_thread")]
+        )
+        self.server.routes["/list/1"] = listing(
+            [url("/list/2"), url("/news/b"), url("/news/a")]
+        )
+        self.server.routes["/list/2"] = listing([url("/news/c")])
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        self.tmp.cleanup()
+
+    def discover(self, depth, **kwargs):
+        url = self.server.url
+
+        return discover_links(
+            url("/list"), url("/"), "news", depth=depth, workers=4, **kwargs
+        )
+
+    def test_depth_and_dedup(self):
+        url = self.server.url
+        batches = []
+
+        found = self.discover(1, on_links=batches.append)
+
+        # /list/2 is two pages away, /news/a is linked three ways
+        self.assertEqual(found, [url("/news/a"), url("/news/b")])
+        self.assertEqual(batches, [[url("/news/a")], [url("/news/b")]])
+
+        self.assertEqual(
+            self.discover(2), [url("/news/a"), url("/news/b"), url("/news/c")]
+        )
+        self.assertEqual(self.discover(0), [url("/news/a")])
+
+    def test_load_data_appends_new_links(self):
+        url = self.server.url
+        path = os.path.join(self.tmp.name, "indexed.jsonl")
+
+        def run(depth):
+            load_data(
+                url("/"), "news", url("/list"), "news", True, depth, 4, path
+            )
+
+            with Indexer(index_file=path) as indexer:
+                indexer.deserialize_index_file()
+
+                return indexer.local_index["news"]
+
+        self.assertEqual(run(1), [url("/news/a"), url("/news/b")])
+
+        # A second run only adds the links found since
+        self.assertEqual(run(1), [url("/news/a"), url("/news/b")])
+        self.assertEqual(
+            run(2), [url("/news/a"), url("/news/b"), url("/news/c")]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
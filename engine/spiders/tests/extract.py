@@ -0,0 +1,154 @@
+import unittest
+
+from bs4 import BeautifulSoup
+
+from ..extract import (
+    batch_extract_links,
+    batch_extract_summaries,
+    concurrent_batch_extract_page_data,
+    extract_links,
+    extract_reader_view,
+    extract_summary,
+    fast_extract_reader_view,
+    fast_extract_summary,
+)
+
+
+class TestFastReaderView(unittest.TestCase):
+    def assertSameView(self, html):
+        self.assertEqual(
+            fast_extract_reader_view(html), extract_reader_view(html)
+        )
+
+    def test_matches_soup(self):
+        pages = [
+            b"<html><head><title>t</title></head><body><h1>Title</h1>"
+            b"<p>One <b>bold</b> &amp; <a href='/x'>link</a></p></body>",
+            b"<p>outer <p>inner</p> tail</p><h2>\n  \n</h2>",
+            b"<p>a<br>b<br/>c</br>d</p><p/><h7>seven</h7>",
+            b"<div><p>unclosed <span>span</div> after</p>",
+            b"<p>&nbsp;&bogus; &#150; &#x41; &lt</p><pre><p> kept </p></pre>",
+            b"<p><!-- note --><![CDATA[data]]><script>var p;</script></p>",
+            "<p>caf\xe9 ☃</p>".encode("utf-8"),
+            "<p>caf\xe9</p>".encode("latin-1"),
+        ]
+
+        for html in pages:
+            self.assertSameView(html)
+
+
+class TestFastSummary(unittest.TestCase):
+    def test_matches_make_summary(self):
+        html = (
+            b"<html><head><title>Hearth &amp; Home</title>"
+            b"<meta name='description' content='A page'>"
+            b"<meta og:title content='legacy'>"
+            b"<meta property='og:image' content='/i.png'></head>"
+            b"<body><img src='/a.png' width='10' height='20'>"
+            b"<p><img src='/b.png'/></p></body></html>"
+        )
+
+        summary = fast_extract_summary(html)
+        expected = extract_summary(html)
+        expected["og"]["og:image"] = "/i.png"
+
+        self.assertEqual(summary, expected)
+
+    def test_missing_fields(self):
+        summaries = batch_extract_summaries({"a": b"<p>no head</p>"})
+
+        self.assertEqual(
+            summaries["a"],
+            {"meta": {"title": "", "description": ""}, "images": [], "og": {}},
+        )
+
+
+class TestExtractLinks(unittest.TestCase):
+    PAGE = (
+        b"<html><body><a href='/biz/one'>1</a><a>no href</a><a href=''>e</a>"
+        b"<!-- <a href='/biz/comment'> --><script>'<a href=\"/biz/js\">'</script>"
+        b"<A HREF='/biz/two?a=1&amp;b=2'>2</A><a href='page/3' href='/biz/3'/>"
+        b"<a href='https://other.com/x'>x</a></body></html>"
+    )
+
+    def test_matches_find_all(self):
+        soup = BeautifulSoup(self.PAGE, features="html.parser")
+        expected = [
+            link.get("href") for link in soup.find_all("a") if link.get("href")
+        ]
+
+        self.assertEqual(extract_links(self.PAGE), expected)
+        self.assertEqual(
+            extract_links(self.PAGE, prefixes=["/biz"]),
+            ["/biz/one", "/biz/two?a=1&b=2", "/biz/3"],
+        )
+
+    def test_resolves_and_filters(self):
+        self.assertEqual(
+            extract_links(
+                self.PAGE,
+                "https://yelp.com/search",
+                prefixes=["https://yelp.com/biz/"],
+                patterns=[r"other\.com"],
+            ),
+            [
+                "https://yelp.com/biz/one",
+                "https://yelp.com/biz/two?a=1&b=2",
+                "https://yelp.com/biz/3",
+                "https://other.com/x",
+            ],
+        )
+
+        based = b"<base href='https://cdn.com/root/'><a href='x'>x</a>"
+        self.assertEqual(
+            batch_extract_links(
+                {"https://a.com/": based, "https://b.com/": None}
+            ),
+            {
+                "https://a.com/": ["https://cdn.com/root/x"],
+                "https://b.com/": None,
+            },
+        )
+
+
+class TestConcurrentExtract(unittest.TestCase):
+    def test_matches_serial(self):
+        pages = {
+            f"http://a.test/{i}": (
+                f"<h1>Page {i}</h1><p>text <b>{i}</b></p>"
+            ).encode()
+            for i in range(37)
+        }
+        pages["http://a.test/missing"] = None
+        pages["http://a.test/broken"] = 404
+
+        for extract, fn in (
+            ("fast_reader_view", fast_extract_reader_view),
+            ("reader_view", extract_reader_view),
+        ):
+            # 37 good pages make two full chunks of 16 and a short one
+            extracted = concurrent_batch_extract_page_data(
+                pages, extract, chunksize=16, workers=2
+            )
+
+            expected = {
+                url: fn(html) if isinstance(html, bytes) else None
+                for url, html in pages.items()
+            }
+
+            self.assertEqual(extracted, expected)
+
+            # However the workers finish, pages keep their input order
+            self.assertEqual(list(extracted), list(expected))
+
+        # A stream of pairs reads the same as a dict
+        self.assertEqual(
+            concurrent_batch_extract_page_data(
+                iter(pages.items()), "fast_reader_view", chunksize=16
+            ),
+            concurrent_batch_extract_page_data(pages, "fast_reader_view"),
+        )
+
+    def test_unknown_extractor(self):
+        with self.assertRaises(ValueError):
+            concurrent_batch_extract_page_data({}, "everything")
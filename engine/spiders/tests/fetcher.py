@@ -0,0 +1,120 @@
+import string
+import unittest
+from collections import Counter
+
+import nltk
+from nltk.stem import SnowballStemmer
+
+from ..corpus.fetcher import (
+    iter_unwrap_context_and_extract,
+    raw_corpus_to_frequency_vector,
+    unwrap_context_and_extract,
+)
+from ..corpus.stems import StemCache
+
+
+def has_punkt() -> bool:
+    try:
+        nltk.data.find("tokenizers/punkt")
+    except LookupError:
+        return False
+
+    return True
+
+
+READER_VIEW = {
+    f"https://a.com/{i}": [
+        f"Page {i} opens here. It has two sentences!",
+        f"A second block, number {i}? Yes.",
+    ]
+    for i in range(50)
+}
+
+
+@unittest.skipUnless(has_punkt(), "the nltk punkt model is not installed")
+class TestTokenize(unittest.TestCase):
+    def test_serial_matches_original(self):
+        sentences = unwrap_context_and_extract(READER_VIEW)
+
+        self.assertEqual(len(sentences), 50 * 4)
+        self.assertEqual(
+            sentences[:2], ["Page 0 opens here.", "It has two sentences!"]
+        )
+
+        words = unwrap_context_and_extract(READER_VIEW, "words")
+        self.assertEqual(words[:4], ["Page", "0", "opens", "here"])
+
+    def test_parallel_order(self):
+        for unwrap_returns in ("sentences", "words"):
+            serial = unwrap_context_and_extract(READER_VIEW, unwrap_returns)
+
+            self.assertEqual(
+                list(
+                    iter_unwrap_context_and_extract(
+                        READER_VIEW, unwrap_returns, workers=3, chunksize=4
+                    )
+                ),
+                serial,
+            )
+
+    def test_streams(self):
+        tokens = iter_unwrap_context_and_extract(
+            READER_VIEW, "words", workers=1
+        )
+
+        self.assertEqual(next(tokens), "Page")
+
+
+TOKENS = (
+    "The cats were running , and the Cat runs ; the dogs ran . "
+    "Running dogs chase running cats ! The end ."
+).split() * 20
+
+
+class TestFrequencyVector(unittest.TestCase):
+    def test_matches_stemming_every_token(self):
+        stemmer = SnowballStemmer("english")
+        expected = dict(
+            Counter(
+                stemmer.stem(token)
+                for token in TOKENS
+                if token not in string.punctuation
+            )
+        )
+        counted = raw_corpus_to_frequency_vector(TOKENS)
+
+        self.assertEqual(counted, expected)
+        self.assertEqual(list(counted), list(expected))
+        self.assertEqual(counted["run"], 80)
+
+    def test_drops_punctuation_runs(self):
+        # Whatever is part of string.punctuation is dropped, "..." is not
+        counted = raw_corpus_to_frequency_vector(
+            ["()", "", "-", ".", "...", "cats", "()"]
+        )
+
+        self.assertEqual(counted, {"...": 1, "cat": 1})
+
+    def test_stems_types_once(self):
+        # Every distinct token but the four punctuation marks
+        stems = StemCache(None)
+        raw_corpus_to_frequency_vector(iter(TOKENS), stems=stems)
+
+        self.assertEqual(stems.stemmed, len(set(TOKENS)) - 4)
+
+        raw_corpus_to_frequency_vector(TOKENS, stems=stems)
+        self.assertEqual(stems.stemmed, len(set(TOKENS)) - 4)
+
+    def test_lowercase(self):
+        stems = StemCache(None)
+        counted = raw_corpus_to_frequency_vector(TOKENS, True, stems)
+
+        # "The" and "the" are one type once lower cased
+        self.assertEqual(counted, raw_corpus_to_frequency_vector(TOKENS))
+        self.assertEqual(
+            stems.stemmed, len({token.lower() for token in TOKENS}) - 4
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
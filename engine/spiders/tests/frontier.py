@@ -0,0 +1,108 @@
+import unittest
+
+from ..corpus.shards import shard_key
+from ..frontier import BloomFilter, Frontier, canonicalize_url
+
+
+class TestCanonicalizeUrl(unittest.TestCase):
+    def test_same_page_forms(self):
+        canonical = "https://www.example.com/news/article/foo"
+
+        for url in [
+            "https://www.example.com/news/article/foo",
+            "https://www.example.com/news/article/foo#disqus_thread",
+            "HTTPS://WWW.Example.COM:443/news/article/foo",
+            "https://www.example.com./news/article/foo?utm_source=x&fbclid=y",
+        ]:
+            self.assertEqual(canonicalize_url(url), canonical)
+
+    def test_query_and_port(self):
+        self.assertEqual(
+            canonicalize_url("http://a.com:8080?b=2&a=1&UTM_medium=z&a=%20"),
+            "http://a.com:8080/?a=%20&a=1&b=2",
+        )
+        self.assertEqual(
+            canonicalize_url("http://user:pw@A.com:80/Path/"),
+            "http://user:pw@a.com/Path/",
+        )
+
+    def test_malformed_port(self):
+        malformed = [
+            "http://a.com:abc/x",
+            "http://a.com:99999/",
+            "http://[::1",
+        ]
+
+        for url in malformed:
+            self.assertEqual(canonicalize_url(f" {url} "), url)
+            self.assertIn(shard_key(url), ("a.com", ""))
+
+        # One bad link is kept as written, the rest still go through
+        frontier = Frontier()
+        urls = ["http://a.com:abc/x", "http://A.com/y", "http://a.com:abc/x"]
+
+        self.assertEqual(
+            list(frontier.filter(urls)),
+            ["http://a.com:abc/x", "http://a.com/y"],
+        )
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        items = [f"https://a.com/{i}" for i in range(1000)]
+
+        for item in items:
+            bloom.add(item)
+
+        self.assertTrue(all(item in bloom for item in items))
+
+        false_positives = sum(
+            f"https://b.com/{i}" in bloom for i in range(10000)
+        )
+        self.assertLess(false_positives, 300)
+
+
+class TestFrontier(unittest.TestCase):
+    def test_dedup_and_order(self):
+        frontier = Frontier(max_depth=1)
+
+        self.assertEqual(
+            frontier.add_all(
+                ["https://a.com/x", "https://a.com/x#top", "https://A.com/y"]
+            ),
+            ["https://a.com/x", "https://a.com/y"],
+        )
+        self.assertIsNone(frontier.add("https://a.com/deep", depth=2))
+        frontier.add("https://a.com/urgent", depth=1, priority=-1)
+        frontier.add("https://a.com/z", depth=1)
+
+        self.assertEqual(
+            list(frontier.drain()),
+            [
+                ("https://a.com/urgent", 1),
+                ("https://a.com/x", 0),
+                ("https://a.com/y", 0),
+                ("https://a.com/z", 1),
+            ],
+        )
+        self.assertEqual((frontier.duplicates, frontier.too_deep), (1, 1))
+        self.assertIn("https://a.com/x#again", frontier)
+
+    def test_filter(self):
+        frontier = Frontier()
+        frontier.add("https://a.com/x")
+
+        urls = ["https://a.com/x#c", "https://A.com/y", "https://a.com/y"]
+
+        self.assertEqual(list(frontier.filter(urls)), ["https://a.com/y"])
+        self.assertEqual(len(frontier), 1)
+        self.assertEqual(frontier.duplicates, 2)
+
+    def test_bloom_beyond_exact_limit(self):
+        frontier = Frontier(exact_limit=10, capacity=1000)
+        urls = [f"https://a.com/{i}" for i in range(100)]
+
+        self.assertEqual(len(frontier.add_all(urls)), 100)
+        self.assertEqual(frontier.add_all(urls), [])
+        self.assertEqual(frontier.seen_count, 100)
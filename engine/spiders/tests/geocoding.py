@@ -0,0 +1,119 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from ..geocoding import GeocodeCache, Geocoder, normalize_place
+
+
+class StandInBackend:
+    min_interval = 0.05
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = []
+        self.places = {
+            "denver, co": (39.74, -104.99),
+            "boston": (42.36, -71.06),
+        }
+
+    def geocode(self, name):
+        self.calls.append((name, time.monotonic()))
+        time.sleep(self.delay)
+
+        if name == "explode":
+            raise ValueError("provider down")
+
+        return self.places.get(normalize_place(name))
+
+
+class TestGeocoder(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "geocode.sqlite3")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_normalize_place(self):
+        self.assertEqual(normalize_place(" Denver ,CO. "), "denver, co")
+        self.assertEqual(normalize_place("New\tYork,  NY"), "new york, ny")
+
+    def test_persistent_cache(self):
+        backend = StandInBackend()
+        geocoder = Geocoder(backend, GeocodeCache(self.path))
+
+        self.assertEqual(geocoder.geocode("Denver, CO"), (39.74, -104.99))
+        self.assertEqual(geocoder.geocode("denver,co"), (39.74, -104.99))
+        self.assertIsNone(geocoder.geocode("Atlantis"))
+        self.assertIsNone(geocoder.geocode("atlantis"))
+        self.assertEqual(len(backend.calls), 2)
+
+        # Found and missing places both survive a restart
+        reopened = StandInBackend()
+        geocoder = Geocoder(reopened, GeocodeCache(self.path))
+
+        self.assertEqual(geocoder.geocode("DENVER, CO"), (39.74, -104.99))
+        self.assertIsNone(geocoder.geocode("Atlantis"))
+        self.assertEqual(reopened.calls, [])
+
+    def test_concurrent_lookups_are_shared(self):
+        backend = StandInBackend(delay=0.2)
+        geocoder = Geocoder(backend, GeocodeCache(self.path))
+        results = []
+
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(geocoder.geocode("Boston"))
+            )
+            for _ in range(8)
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [(42.36, -71.06)] * 8)
+        self.assertEqual(len(backend.calls), 1)
+
+    def test_owner_rechecks_cache(self):
+        backend = StandInBackend()
+        cache = GeocodeCache(self.path)
+        cache.store("boston", (42.36, -71.06))
+
+        # The first lookup misses as if the place were stored just after
+        lookup = cache.lookup
+        misses = [(False, None)]
+        cache.lookup = lambda key: misses.pop() if misses else lookup(key)
+
+        geocoder = Geocoder(backend, cache)
+
+        self.assertEqual(geocoder.geocode("Boston"), (42.36, -71.06))
+        self.assertEqual(backend.calls, [])
+        self.assertEqual(geocoder.hits, 1)
+
+    def test_batch_is_rate_limited(self):
+        backend = StandInBackend()
+        geocoder = Geocoder(backend, GeocodeCache(self.path))
+
+        located = geocoder.geocode_batch(
+            ["Boston", "Denver, CO", "boston", "explode", "Boston"]
+        )
+
+        self.assertEqual(
+            located,
+            {
+                "Boston": (42.36, -71.06),
+                "Denver, CO": (39.74, -104.99),
+                "boston": (42.36, -71.06),
+                "explode": None,
+            },
+        )
+        self.assertEqual(len(backend.calls), 3)
+
+        times = [at for _, at in backend.calls]
+        gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+        self.assertTrue(all(gap >= backend.min_interval * 0.9 for gap in gaps))
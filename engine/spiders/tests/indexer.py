@@ -0,0 +1,222 @@
+import json
+import os
+import tempfile
+import unittest
+
+from ..corpus.fetcher import iter_indexer_query_by_category
+from ..corpus.indexer import Indexer
+from ..corpus.indexlog import IndexLog, LazyIndex
+from .server import StandInServer, page_body
+
+
+class TestIndexLog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "indexed.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append_and_compact(self):
+        with IndexLog(self.path, compact_after=None) as log:
+            log.append("news", ["a", "b"])
+            log.append("sports", ["x"])
+            log.append("news", ["c"])
+
+            self.assertEqual(
+                log.load(), {"news": ["a", "b", "c"], "sports": ["x"]}
+            )
+            self.assertEqual(log.categories(), ["news", "sports"])
+
+            log.compact()
+            log.append("sports", ["y"])
+
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+        with IndexLog(self.path) as log:
+            self.assertEqual(log.links("sports"), ["x", "y"])
+
+    def test_torn_line(self):
+        with IndexLog(self.path) as log:
+            log.append("news", ["a"])
+
+        # A crash half way through writing the next record
+        with open(self.path, "ab") as f:
+            f.write(b'{"category": "news", "links": ["b", "c')
+
+        with IndexLog(self.path) as log:
+            self.assertEqual(log.load(), {"news": ["a"]})
+            log.append("news", ["d"])
+
+        with IndexLog(self.path) as log:
+            self.assertEqual(log.load(), {"news": ["a", "d"]})
+
+    def test_automatic_compaction(self):
+        with IndexLog(self.path, compact_after=4) as log:
+            for i in range(10):
+                log.append(f"c{i % 2}", [str(i)])
+
+        with open(self.path) as f:
+            self.assertLessEqual(len(f.readlines()), 4)
+
+        with IndexLog(self.path) as log:
+            self.assertEqual(
+                log.load(),
+                {
+                    "c0": ["0", "2", "4", "6", "8"],
+                    "c1": ["1", "3", "5", "7", "9"],
+                },
+            )
+
+    def test_directory(self):
+        with IndexLog(self.path, record_size=3) as log:
+            log.append("news", [f"n{i}" for i in range(7)])
+            log.append("sports", ["s0"])
+            log.append("news", ["n7"])
+
+            self.assertEqual(log.categories(), ["news", "sports"])
+            self.assertEqual(log.count("news"), 8)
+            self.assertEqual(
+                [len(batch) for batch in log.iter_links("news", 5)], [5, 3]
+            )
+
+            # Appends and compactions by another writer are picked up
+            with IndexLog(self.path) as other:
+                other.append("weather", ["w0"])
+                self.assertEqual(log.links("weather"), ["w0"])
+
+                other.compact()
+                self.assertEqual(
+                    log.links("news"), [f"n{i}" for i in range(8)]
+                )
+                self.assertEqual(log.links("missing"), [])
+
+        # The directory is derived data, and rebuilt when lost
+        os.unlink(f"{self.path}.idx")
+        with IndexLog(self.path) as log:
+            self.assertEqual(log.links("sports"), ["s0"])
+
+    def test_compaction_writes_the_directory(self):
+        def rows(log):
+            return log._catch_up().execute(
+                "SELECT * FROM records ORDER BY offset"
+            ).fetchall()
+
+        with IndexLog(self.path, compact_after=None, record_size=2) as log:
+            for i in range(5):
+                log.append(f"c{i % 2}", [f"{i}a", f"{i}b"])
+
+            scans = []
+            scan = log._scan
+            log._scan = lambda *args: scans.append(args) or scan(*args)
+
+            log.compact()
+            compacted = rows(log)
+
+            # The new log was never read back to find its records
+            self.assertEqual(scans, [])
+
+        os.unlink(f"{self.path}.idx")
+
+        with IndexLog(self.path) as log:
+            self.assertEqual(rows(log), compacted)
+            self.assertEqual(log.count("c0"), 6)
+
+    def test_reads_only_the_category(self):
+        with IndexLog(self.path) as log:
+            log.append("news", ["a"])
+            log.append("sports", ["x"])
+
+        # Wreck the sports record without touching its length or newline
+        with open(self.path, "r+b") as f:
+            data = f.read()
+            f.seek(data.index(b'"x"'))
+            f.write(b"{{{")
+
+        with IndexLog(self.path) as log:
+            self.assertEqual(log.links("news"), ["a"])
+
+
+class TestIndexer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_saves_only_new_links(self):
+        path = os.path.join(self.tmp.name, "indexed.jsonl")
+
+        with Indexer(index_file=path) as indexer:
+            indexer.index(["a", "b"], "news")
+            indexer.serialize_index_file(preserve_local_copy=True)
+            size = os.path.getsize(path)
+
+            indexer.index(["c"], "news")
+            indexer.serialize_index_file()
+
+        # The second save appended one short line
+        self.assertLess(os.path.getsize(path) - size, size)
+
+        with Indexer(index_file=path) as reloaded:
+            reloaded.deserialize_index_file()
+            self.assertEqual(reloaded.local_index, {"news": ["a", "b", "c"]})
+
+    def test_lazy_categories(self):
+        path = os.path.join(self.tmp.name, "indexed.jsonl")
+
+        with Indexer(index_file=path) as indexer:
+            indexer.index(["a", "b", "c"], "news")
+            indexer.index(["x"], "sports")
+            indexer.serialize_index_file()
+
+        with Indexer(index_file=path) as reloaded:
+            reloaded.deserialize_index_file()
+            self.assertIsInstance(reloaded.local_index, LazyIndex)
+            self.assertEqual(reloaded.categories(), ["news", "sports"])
+
+            self.assertEqual(
+                list(reloaded.iter_links("news", 2)), [["a", "b"], ["c"]]
+            )
+            self.assertFalse(reloaded.local_index.is_loaded("news"))
+
+            reloaded.index(["y"], "sports")
+            self.assertEqual(reloaded.local_index["sports"], ["x", "y"])
+            self.assertFalse(reloaded.local_index.is_loaded("news"))
+
+    def test_streams_category_to_fetcher(self):
+        path = os.path.join(self.tmp.name, "indexed.jsonl")
+
+        with StandInServer() as server:
+            links = [server.url(f"/page/{i}") for i in range(7)]
+
+            indexer = Indexer(index_file=path)
+            # Repeats and other forms of a link are fetched once
+            repeats = links[:2] + [
+                f"{url}#disqus_thread" for url in links[2:4]
+            ]
+            indexer.index(links + repeats, "news")
+            indexer.serialize_index_file()
+            indexer.deserialize_index_file()
+
+            pages = dict(
+                iter_indexer_query_by_category(
+                    indexer, "news", 0, batch_size=3
+                )
+            )
+            indexer.close()
+
+        self.assertEqual(list(pages), links)
+        self.assertEqual(pages[links[6]], page_body("/page/6"))
+
+    def test_json_saves_replace(self):
+        path = os.path.join(self.tmp.name, "freq.json")
+
+        Indexer({"the": 2}, path).serialize_index_file()
+        Indexer({"the": 3, "hearth": 1}, path).serialize_index_file()
+
+        with open(path) as f:
+            self.assertEqual(json.load(f), {"the": 3, "hearth": 1})
+
+        self.assertEqual(os.listdir(self.tmp.name), ["freq.json"])
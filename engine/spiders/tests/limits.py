@@ -0,0 +1,107 @@
+import email.utils
+import time
+import unittest
+
+from ..aio import async_bulk_query
+from ..limits import AdaptiveLimit, AdaptiveLimiter, parse_retry_after
+from .server import StandInServer
+
+
+class TestAdaptiveLimit(unittest.TestCase):
+    def test_aimd(self):
+        limit = AdaptiveLimit(initial=4, maximum=6)
+
+        for _ in range(4):
+            limit.on_success(0.01)
+
+        self.assertAlmostEqual(limit.limit, 5, delta=0.1)
+
+        for _ in range(100):
+            limit.on_success(0.01)
+
+        self.assertEqual(limit.limit, 6)
+
+        # A burst of failures at once halves the limit a single time
+        limit.on_overload(0.01)
+        limit.on_overload(0.01)
+        self.assertEqual((limit.limit, limit.backoffs), (3, 1))
+
+    def test_slow_responses_hold_the_limit(self):
+        limit = AdaptiveLimit(initial=4)
+
+        for _ in range(16):
+            limit.on_success(0.01)
+
+        grown = limit.limit
+        limit.on_success(0.5)
+
+        self.assertEqual(limit.limit, grown)
+
+    def test_retry_after(self):
+        now = time.time()
+        date = email.utils.formatdate(now + 30, usegmt=True)
+
+        self.assertEqual(parse_retry_after("120"), 120)
+        self.assertAlmostEqual(parse_retry_after(date, now), 30, delta=1)
+        self.assertEqual(parse_retry_after("soon"), 0)
+        self.assertEqual(parse_retry_after(None), 0)
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    def test_grows_on_healthy_host(self):
+        with StandInServer() as server:
+            urls = [server.url(f"/page/{i}") for i in range(200)]
+            limiter = AdaptiveLimiter(initial_per_host=2, max_per_host=16)
+
+            loaded = async_bulk_query(urls, limiter=limiter)
+
+            self.assertTrue(all(loaded.values()))
+
+            stats = limiter.stats()["hosts"][server.base_url]
+            self.assertGreater(stats["limit"], 2)
+            self.assertEqual(
+                (stats["successes"], stats["in_flight"]), (200, 0)
+            )
+            self.assertGreater(stats["latency_p99"], 0)
+
+    def test_backs_off_past_capacity(self):
+        with StandInServer() as server:
+            server.capacity = 4
+            urls = [server.url(f"/page/{i}?delay=0.02") for i in range(150)]
+            limiter = AdaptiveLimiter(initial_per_host=16, max_per_host=64)
+
+            async_bulk_query(urls, max_per_host=64, limiter=limiter)
+
+            stats = limiter.stats()["hosts"][server.base_url]
+            self.assertGreater(stats["backoffs"], 0)
+            self.assertLessEqual(stats["limit"], 8)
+
+    def test_reused_across_runs(self):
+        with StandInServer() as server:
+            limiter = AdaptiveLimiter(initial_per_host=2, max_per_host=2)
+
+            for run in range(2):
+                urls = [
+                    server.url(f"/page/{i}?delay=0.01&run={run}")
+                    for i in range(50)
+                ]
+                loaded = async_bulk_query(urls, limiter=limiter)
+
+                # Every run queues behind the host limit, waiting on
+                # the limiter's condition inside its own event loop
+                self.assertEqual(sum(map(bool, loaded.values())), 50)
+
+    def test_honors_retry_after(self):
+        with StandInServer() as server:
+            limiter = AdaptiveLimiter()
+            throttled = server.url("/status/429?retry_after=1")
+            page = server.url("/page/1")
+
+            self.assertIsNone(
+                async_bulk_query([throttled], limiter=limiter)[throttled]
+            )
+
+            start = time.monotonic()
+            async_bulk_query([page], limiter=limiter)
+
+            self.assertGreater(time.monotonic() - start, 0.9)
@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+import unittest
+
+from ..aio import async_bulk_query
+from ..base import serial_bulk_query
+from ..cache import ResponseCache
+from ..metrics import FetchMetrics, Histogram
+from ..retry import FetchPolicy
+from .server import StandInServer
+
+
+class TestHistogram(unittest.TestCase):
+    def test_buckets(self):
+        histogram = Histogram((0.1, 1.0))
+
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.cumulative(), [2, 3, 4])
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(0.99), float("inf"))
+
+
+class TestFetchMetrics(unittest.TestCase):
+    def test_async_timings(self):
+        seen = []
+        metrics = FetchMetrics(hook=seen.append)
+
+        with StandInServer() as server:
+            urls = [server.url(f"/page/{i}") for i in range(10)]
+            missing = server.url("/status/404")
+
+            async_bulk_query(urls + [missing], max_per_host=2, metrics=metrics)
+
+        self.assertEqual(len(seen), 11)
+
+        # Two connections were opened, the other requests reused them
+        fresh = [timing for timing in seen if not timing.reused]
+        self.assertEqual(len(fresh), 2)
+        self.assertTrue(all(t.dns is not None and t.connect for t in fresh))
+        self.assertTrue(all(t.ttfb <= t.total for t in seen))
+
+        host = metrics.snapshot()["hosts"][server.base_url]
+        self.assertEqual(host["requests"], 11)
+        self.assertEqual(host["statuses"], {"200": 10, "404": 1})
+        self.assertEqual(host["phases"]["connect"]["count"], 2)
+        self.assertGreater(host["bytes"], 0)
+        self.assertGreater(host["requests_per_second"], 0)
+
+    def test_bytes_off_the_wire(self):
+        body = b"<p>" + b"the same words again " * 2000 + b"</p>"
+
+        for query in (serial_bulk_query, async_bulk_query):
+            tmp = tempfile.TemporaryDirectory()
+            cache = ResponseCache(
+                os.path.join(tmp.name, "cache.sqlite3"), max_age=3600
+            )
+            metrics = FetchMetrics()
+
+            with StandInServer() as server:
+                server.routes["/long"] = body
+                urls = [server.url("/long")]
+
+                # The second read is a cache hit, which downloads nothing
+                for _ in range(2):
+                    loaded = query(urls, cache=cache, metrics=metrics)
+                    self.assertEqual(loaded[urls[0]], body)
+
+            cache.close()
+            tmp.cleanup()
+
+            host = metrics.snapshot()["hosts"][server.base_url]
+            self.assertEqual(host["bytes"], server.sent)
+            self.assertLess(host["bytes"], len(body) // 10)
+
+    def test_revalidation_timings(self):
+        seen = []
+        metrics = FetchMetrics(hook=seen.append)
+
+        with tempfile.TemporaryDirectory() as tmp, StandInServer() as server:
+            cache = ResponseCache(os.path.join(tmp, "cache.sqlite3"))
+            urls = [server.url("/page/1")]
+
+            # Without a max_age the second read revalidates to a 304
+            for _ in range(2):
+                serial_bulk_query(urls, cache=cache, metrics=metrics)
+
+            cache.close()
+
+        self.assertEqual([timing.status for timing in seen], [200, 304])
+        self.assertTrue(all(0 < t.ttfb <= t.total for t in seen))
+        self.assertTrue(all(t.dns is None for t in seen))
+
+    def test_sync_retries_and_export(self):
+        metrics = FetchMetrics()
+        policy = FetchPolicy(retries=1, backoff=0.01)
+
+        with StandInServer() as server:
+            flaky = server.url("/flaky/m?fail=1")
+            serial_bulk_query([flaky], policy=policy, metrics=metrics)
+
+        host = metrics.snapshot()["hosts"][server.base_url]
+        self.assertEqual(host["statuses"], {"503": 1, "200": 1})
+        self.assertEqual((host["errors"], host["retries"]), (1, 1))
+        self.assertEqual(json.loads(metrics.to_json()), metrics.snapshot())
+
+        text = metrics.to_prometheus()
+        label = f'host="{server.base_url}"'
+        self.assertIn(f"hearth_fetch_requests_total{{{label}}} 2", text)
+        self.assertIn(
+            f'hearth_fetch_responses_total{{{label},status="503"}} 1', text
+        )
+        self.assertIn(
+            f'hearth_fetch_total_seconds_bucket{{{label},le="+Inf"}} 2', text
+        )
+        self.assertIn(f"hearth_fetch_ttfb_seconds_count{{{label}}} 2", text)
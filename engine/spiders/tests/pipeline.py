@@ -0,0 +1,47 @@
+import time
+import unittest
+
+from ..corpus.pipeline import Pipeline, Stage
+
+
+class TestPipeline(unittest.TestCase):
+    def test_run(self):
+        seen = []
+
+        def _square(n):
+            return n * n
+
+        pipeline = Pipeline(
+            [
+                Stage("square", _square, workers=4),
+                Stage("even", lambda n: n if n % 2 == 0 else None),
+                Stage("sink", seen.append),
+            ],
+            maxsize=2,
+        )
+        report = pipeline.run(range(100))
+
+        self.assertEqual(sorted(seen), [n * n for n in range(0, 100, 2)])
+        self.assertEqual(
+            [row["processed"] for row in report], [100, 100, 100, 50]
+        )
+
+    def test_backpressure(self):
+        def _slow(n):
+            time.sleep(0.01)
+
+        pipeline = Pipeline([Stage("slow", _slow)], maxsize=1)
+        pipeline.run(range(20))
+
+        # The source spends most of its time waiting on the slow stage
+        self.assertGreater(pipeline.source.blocked, 0.1)
+
+    def test_source_error(self):
+        def _source():
+            yield 1
+            raise ValueError("fetch failed")
+
+        pipeline = Pipeline([Stage("sink", lambda n: None)])
+
+        with self.assertRaises(ValueError):
+            pipeline.run(_source())
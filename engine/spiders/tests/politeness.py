@@ -0,0 +1,172 @@
+import socket
+import time
+import unittest
+import urllib.robotparser
+
+from ..politeness import (
+    PolitenessScheduler,
+    async_polite_bulk_query,
+    polite_bulk_query,
+)
+from ..retry import FetchPolicy
+from .server import StandInServer, page_body
+
+# robotparser only reads whole seconds of Crawl-delay
+ROBOTS = b"User-agent: *\nCrawl-delay: 1\nDisallow: /private/\n"
+
+
+def allow_all(url):
+    robots = urllib.robotparser.RobotFileParser()
+    robots.allow_all = True
+    return robots
+
+
+class TestPolitenessScheduler(unittest.TestCase):
+    def test_interleaves_hosts(self):
+        scheduler = PolitenessScheduler(10, robots_loader=allow_all)
+        scheduler.add_all(["http://a/1", "http://a/2", "http://b/1"])
+
+        urls = [scheduler.pop()[0] for _ in range(3)]
+
+        self.assertEqual(urls, ["http://a/1", "http://b/1", "http://a/2"])
+
+    def test_refill_keeps_booking(self):
+        scheduler = PolitenessScheduler(10, robots_loader=allow_all)
+        scheduler.add("http://a/1")
+        scheduler.pop()
+
+        # A url streamed in after the host's queue ran dry still waits
+        scheduler.add("http://a/2")
+        _, ready_at = scheduler.pop()
+
+        self.assertGreater(ready_at - time.monotonic(), 9)
+
+    def test_retry_books_a_slot(self):
+        scheduler = PolitenessScheduler(10, robots_loader=allow_all)
+        scheduler.add_all(["http://a/1", "http://a/2", "http://b/1"])
+        scheduler.pop()
+
+        # The retry waits out the delay, and the next url one more
+        wait = scheduler.retry_delay("http://a/1", 0.5)
+        self.assertGreater(wait, 9)
+
+        self.assertEqual(scheduler.pop()[0], "http://b/1")
+        url, ready_at = scheduler.pop()
+        self.assertEqual(url, "http://a/2")
+        self.assertGreater(ready_at - time.monotonic(), 19)
+
+    def test_drain(self):
+        scheduler = PolitenessScheduler(10, robots_loader=allow_all)
+        scheduler.add_all(["http://a/1", "http://a/2", "http://b/1"])
+
+        self.assertEqual(
+            scheduler.drain("http://a"), ["http://a/1", "http://a/2"]
+        )
+        self.assertEqual(len(scheduler), 1)
+        self.assertEqual(scheduler.pop()[0], "http://b/1")
+        self.assertFalse(scheduler)
+
+
+class TestPoliteBulkQuery(unittest.TestCase):
+    def crawl(self, query):
+        with StandInServer() as a, StandInServer() as b:
+            for server in (a, b):
+                server.routes["/robots.txt"] = ROBOTS
+
+            urls = [a.url(f"/page/{i}") for i in range(3)]
+            urls += [b.url(f"/page/{i}") for i in range(3)]
+            private = a.url("/private/1")
+
+            start = time.monotonic()
+            loaded = query(urls + [private], delay=0)
+            elapsed = time.monotonic() - start
+
+        # robots.txt is read once per host, the private page never
+        self.assertEqual(a.requests, 4)
+        self.assertNotIn(private, loaded)
+        self.assertEqual(loaded[urls[4]], page_body("/page/1"))
+
+        # Three requests per host spaced by its crawl delay, with the
+        # two hosts waiting out their delays side by side
+        self.assertGreaterEqual(elapsed, 2)
+        self.assertLess(elapsed, 3.5)
+
+        return urls, list(loaded)
+
+    def test_polite_bulk_query(self):
+        urls, order = self.crawl(polite_bulk_query)
+
+        # Fetched in turns across hosts rather than host by host
+        self.assertEqual(order, [urls[i] for i in (0, 3, 1, 4, 2, 5)])
+
+    def test_async_polite_bulk_query(self):
+        urls, order = self.crawl(async_polite_bulk_query)
+
+        self.assertEqual(sorted(order), sorted(urls))
+
+    def test_filters_through_robots_loader(self):
+        loaded_robots = []
+
+        def loader(url):
+            loaded_robots.append(url)
+            robots = urllib.robotparser.RobotFileParser()
+            robots.parse(["User-agent: *", "Disallow: /private/"])
+            return robots
+
+        for query in (polite_bulk_query, async_polite_bulk_query):
+            with StandInServer() as server:
+                public = server.url("/page/1")
+                private = server.url("/private/1")
+
+                # The server has no robots.txt, only the loader's rules
+                # keep the private page out
+                loaded = query(
+                    [public, private], delay=0, robots_loader=loader
+                )
+
+                self.assertEqual(list(loaded), [public])
+                self.assertEqual(server.requests, 1)
+
+        self.assertEqual(len(loaded_robots), 2)
+
+    def test_open_circuit_fails_fast(self):
+        # Nothing listens on a port freed straight after binding it
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+        urls = [f"http://127.0.0.1:{port}/page/{i}" for i in range(30)]
+
+        for query in (polite_bulk_query, async_polite_bulk_query):
+            policy = FetchPolicy(retries=0)
+
+            start = time.monotonic()
+            loaded = query(
+                urls,
+                delay=0.2,
+                robots_loader=allow_all,
+                respect_robots=False,
+                policy=policy,
+            )
+            elapsed = time.monotonic() - start
+
+            # The breaker opens after five refused connections and
+            # the other urls are failed without waiting their turn
+            self.assertEqual(loaded, dict.fromkeys(urls))
+            self.assertEqual(len(policy.failures), 30)
+            self.assertLess(elapsed, 2)
+
+    def test_retries_wait_out_crawl_delay(self):
+        for query in (polite_bulk_query, async_polite_bulk_query):
+            with StandInServer() as server:
+                server.routes["/robots.txt"] = ROBOTS
+                url = server.url("/flaky/page")
+                policy = FetchPolicy(retries=1, backoff=0.01)
+
+                start = time.monotonic()
+                loaded = query([url], delay=0, policy=policy)
+                elapsed = time.monotonic() - start
+
+            self.assertEqual(loaded[url], page_body("/flaky/page"))
+            self.assertEqual(policy.retry_counts[url], 1)
+            self.assertGreaterEqual(elapsed, 1)
@@ -0,0 +1,135 @@
+import socket
+import time
+import unittest
+import urllib.error
+
+from ..aio import async_bulk_query
+from ..base import serial_bulk_query
+from ..retry import (
+    FATAL,
+    HOST_DOWN,
+    RETRY,
+    CircuitBreaker,
+    CircuitOpenError,
+    FetchPolicy,
+    classify_failure,
+)
+from .server import StandInServer, page_body
+
+
+def closed_port_url(path: str = "/") -> str:
+    # A port nothing listens on, so connecting is refused
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    return f"http://127.0.0.1:{port}{path}"
+
+
+class TestClassifyFailure(unittest.TestCase):
+    def test_kinds(self):
+        def http_error(code, headers=None):
+            return urllib.error.HTTPError("u", code, "", headers or {}, None)
+
+        self.assertEqual(classify_failure(http_error(404)), (FATAL, 0))
+        self.assertEqual(
+            classify_failure(http_error(429, {"retry-after": "3"})), (RETRY, 3)
+        )
+        self.assertEqual(classify_failure(TimeoutError()), (RETRY, 0))
+        self.assertEqual(classify_failure(socket.timeout()), (RETRY, 0))
+        self.assertEqual(
+            classify_failure(urllib.error.URLError(socket.timeout())),
+            (RETRY, 0),
+        )
+        self.assertEqual(
+            classify_failure(urllib.error.URLError(ConnectionRefusedError())),
+            (RETRY, 0),
+        )
+        self.assertEqual(
+            classify_failure(urllib.error.URLError(socket.gaierror())),
+            (HOST_DOWN, 0),
+        )
+        self.assertEqual(classify_failure(ValueError()), (FATAL, 0))
+
+
+class TestFetchPolicy(unittest.TestCase):
+    def test_retries_transient_failures(self):
+        with StandInServer() as server:
+            flaky = server.url("/flaky/a?fail=2")
+            gone = server.url("/status/404")
+            policy = FetchPolicy(retries=2, backoff=0.01)
+
+            loaded = serial_bulk_query([flaky, gone], policy=policy)
+
+            self.assertEqual(loaded[flaky], page_body("/flaky/a"))
+            self.assertIsNone(loaded[gone])
+            self.assertEqual(policy.retry_counts[flaky], 2)
+            self.assertEqual(list(policy.failures), [gone])
+            self.assertIn("404", policy.failures[gone])
+
+    def test_async_retries(self):
+        with StandInServer() as server:
+            flaky = server.url("/flaky/b?fail=1")
+            policy = FetchPolicy(retries=1, backoff=0.01)
+
+            loaded = async_bulk_query([flaky], policy=policy)
+
+            self.assertEqual(loaded[flaky], page_body("/flaky/b"))
+            self.assertEqual(policy.report()["retries"], 1)
+
+    def test_only_answers_reset_the_breaker(self):
+        def raises(e):
+            def fetch(url):
+                raise e
+
+            return fetch
+
+        gone = urllib.error.HTTPError("u", 404, "", {}, None)
+        policy = FetchPolicy(retries=0, breaker=CircuitBreaker(threshold=2))
+
+        # A 404 is an answer, so the failure before it is forgotten
+        policy.breaker.failure("http://h")
+        self.assertRaises(
+            urllib.error.HTTPError, policy.call, "http://h/a", raises(gone)
+        )
+        policy.breaker.failure("http://h")
+        self.assertFalse(policy.breaker.is_open("http://h"))
+
+        # Anything else is no proof the host is fine
+        self.assertRaises(
+            ValueError, policy.call, "http://h/b", raises(ValueError())
+        )
+        self.assertTrue(policy.breaker.is_open("http://h"))
+
+    def test_dead_host_fails_fast(self):
+        base = closed_port_url("")
+        urls = [f"{base}/{i}" for i in range(20)]
+        policy = FetchPolicy(
+            retries=1, backoff=0.01, breaker=CircuitBreaker(threshold=3)
+        )
+
+        start = time.monotonic()
+        loaded = serial_bulk_query(urls, policy=policy)
+
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(all(body is None for body in loaded.values()))
+        self.assertEqual(len(policy.failures), 20)
+        self.assertEqual(policy.report()["open_hosts"], [base])
+        self.assertIn("CircuitOpenError", policy.failures[urls[-1]])
+
+    def test_breaker_probes_after_reset(self):
+        breaker = CircuitBreaker(threshold=2, reset_after=0.05)
+
+        breaker.failure("h")
+        breaker.failure("h")
+        self.assertRaises(CircuitOpenError, breaker.check, "h")
+
+        time.sleep(0.06)
+        breaker.check("h")
+
+        # Only one probe goes out while half open
+        self.assertRaises(CircuitOpenError, breaker.check, "h")
+
+        breaker.success("h")
+        breaker.check("h")
+        self.assertFalse(breaker.is_open("h"))
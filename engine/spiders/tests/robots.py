@@ -0,0 +1,35 @@
+import unittest
+
+from ..robots import RobotsCache
+from .server import StandInServer
+
+
+class TestRobotsCache(unittest.TestCase):
+    def test_filter_allowed(self):
+        with StandInServer() as server:
+            server.routes["/robots.txt"] = (
+                b"User-agent: *\nDisallow: /private\nCrawl-delay: 2\n"
+            )
+            cache = RobotsCache()
+            urls = [server.url("/public/1"), server.url("/private/1")]
+
+            allowed = cache.filter_allowed(urls * 10, "HearthBot")
+
+            self.assertEqual(allowed, [urls[0]] * 10)
+            self.assertEqual(server.requests, 1)
+            self.assertEqual(cache.get(urls[0]).crawl_delay("HearthBot"), 2)
+
+    def test_negative_caching(self):
+        with StandInServer() as server:
+            server.routes["/robots.txt"] = 404
+            cache = RobotsCache()
+
+            self.assertTrue(cache.can_fetch(server.url("/a"), "HearthBot"))
+
+            server.routes["/robots.txt"] = 503
+            cache = RobotsCache()
+
+            self.assertFalse(cache.can_fetch(server.url("/a"), "HearthBot"))
+            self.assertFalse(cache.can_fetch(server.url("/b"), "HearthBot"))
+            self.assertEqual(cache.misses, 1)
+            self.assertEqual(server.requests, 2)
@@ -0,0 +1,257 @@
+"""
+Server contains a local HTTP stand-in for the sites we crawl so the
+fetch layer can be tested and benchmarked without the network
+"""
+
+import collections
+import gzip
+import http.server
+import random
+import threading
+import time
+import urllib.parse
+import zlib
+
+
+# Blob bodies repeat a block larger than gzip's window, so they do not
+# compress, like the pdfs and images they stand in for
+NOISE_SIZE = 64 * 1024
+NOISE = (
+    random.Random(0).getrandbits(8 * NOISE_SIZE).to_bytes(NOISE_SIZE, "little")
+)
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.in_flight += 1
+            overloaded = (
+                self.server.capacity is not None
+                and self.server.in_flight > self.server.capacity
+            )
+
+            if overloaded:
+                self.server.rejected += 1
+
+        try:
+            # Past capacity the stand-in sheds load like a real site
+            if overloaded:
+                return self._send(503, b"")
+
+            return self._route()
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def _route(self):
+        parts = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(parts.query))
+
+        if "delay" in query:
+            time.sleep(float(query["delay"]))
+
+        if parts.path.startswith("/status/"):
+            code = int(parts.path.rsplit("/", 1)[1])
+            headers = {}
+
+            if "retry_after" in query:
+                headers["Retry-After"] = query["retry_after"]
+
+            return self._send(code, b"", headers=headers)
+
+        if parts.path.startswith("/flaky/"):
+            # Answers 503 to the first fail requests for each path
+            with self.server.lock:
+                self.server.hits[parts.path] += 1
+                hits = self.server.hits[parts.path]
+
+            if hits <= int(query.get("fail", 1)):
+                return self._send(503, b"")
+
+            return self._send(200, page_body(parts.path))
+
+        if parts.path.startswith("/blob/"):
+            # A body of the given size and type, like a pdf or image
+            size = int(parts.path.rsplit("/", 1)[1])
+            content_type = query.get("type", "application/octet-stream")
+
+            body = (NOISE * (size // len(NOISE) + 1))[:size]
+
+            return self._send(200, body, content_type=content_type)
+
+        if parts.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", query.get("to", "/page/0"))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if parts.path == "/chunked":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in (b"<p>chunked", b" body</p>"):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        route = self.server.routes.get(parts.path)
+
+        # Routes map a path to a body, or to a bare status code
+        if isinstance(route, int):
+            return self._send(route, b"")
+
+        if route is not None:
+            return self._send(200, route)
+
+        body = page_body(parts.path)
+        etag = f'"{zlib.crc32(body):x}"'
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        return self._send(200, body, headers={"ETag": etag})
+
+    def _send(self, code, body, content_type="text/html", headers=None):
+        headers = dict(headers or {})
+        accepted = self.headers.get("Accept-Encoding", "")
+
+        # Compress text like a real site would for clients which ask
+        if (
+            body
+            and self.server.compress
+            and content_type.startswith("text/")
+            and "gzip" in accepted
+        ):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        try:
+            self.wfile.write(body)
+        except ConnectionError:
+            # The client dropped a body it did not want
+            return
+
+        with self.server.lock:
+            self.server.sent += len(body)
+
+
+class StandInHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Benchmarks open hundreds of sockets at once, the default
+    # backlog of 5 would have the kernel drop their SYNs
+    request_queue_size = 1024
+
+
+def page_body(path: str) -> bytes:
+    return (
+        f"<html><head><title>{path}</title></head>"
+        f"<body><h1>{path}</h1><p>Body of {path}</p></body></html>"
+    ).encode()
+
+
+class StandInServer:
+    """
+    Runs the stand-in handler on a random local port in a
+    background thread
+
+    Parameters
+    ----------
+    handler : type, optional
+        The request handler class to serve with
+    """
+
+    def __init__(self, handler=StandInHandler):
+        self.httpd = StandInHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.lock = threading.Lock()
+        self.httpd.connections = 0
+        self.httpd.requests = 0
+        self.httpd.routes = {}
+        self.httpd.hits = collections.Counter()
+
+        # Gzip bodies for clients which accept it, and count the body
+        # bytes put on the wire
+        self.httpd.compress = True
+        self.httpd.sent = 0
+
+        # The most requests served at once before answering 503
+        self.httpd.capacity = None
+        self.httpd.in_flight = 0
+        self.httpd.rejected = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def routes(self):
+        return self.httpd.routes
+
+    @property
+    def connections(self) -> int:
+        return self.httpd.connections
+
+    @property
+    def requests(self) -> int:
+        return self.httpd.requests
+
+    @property
+    def capacity(self) -> int:
+        return self.httpd.capacity
+
+    @capacity.setter
+    def capacity(self, value: int):
+        self.httpd.capacity = value
+
+    @property
+    def rejected(self) -> int:
+        return self.httpd.rejected
+
+    @property
+    def compress(self) -> bool:
+        return self.httpd.compress
+
+    @compress.setter
+    def compress(self, value: bool):
+        self.httpd.compress = value
+
+    @property
+    def sent(self) -> int:
+        return self.httpd.sent
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,186 @@
+import json
+import os
+import tempfile
+import unittest
+
+from ..corpus.fetcher import iter_indexer_query_by_category
+from ..corpus.indexer import Indexer
+from ..corpus.shards import (
+    jump_hash,
+    merge_frequency_files,
+    merge_frequency_vectors,
+    merge_page_stores,
+    parse_shard,
+    shard_of,
+    split_category,
+)
+from ..corpus.store import PageStore
+from .server import StandInServer
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def sample_links():
+    return [
+        f"{scheme}://site{i % 40}.example.com/page/{i}"
+        for i in range(400)
+        for scheme in ("http", "https")
+    ]
+
+
+class TestSharding(unittest.TestCase):
+    def test_hosts_stay_together(self):
+        for shards in (1, 3, 8):
+            by_host = {}
+
+            for url in sample_links():
+                shard = shard_of(url, shards)
+                self.assertIn(shard, range(shards))
+                by_host.setdefault(url.split("/")[2], set()).add(shard)
+
+            self.assertTrue(all(len(found) == 1 for found in by_host.values()))
+
+        # Canonically equal hosts are the same host
+        self.assertEqual(
+            shard_of("http://Example.COM.:80/a", 16),
+            shard_of("https://example.com:8443/b#c", 16),
+        )
+
+    def test_growing_moves_few_keys(self):
+        keys = range(0, 2**64, 2**64 // 5000)
+        moved = sum(jump_hash(key, 10) != jump_hash(key, 11) for key in keys)
+
+        # About a eleventh of the keys move, all into the new bucket
+        self.assertLess(moved, len(keys) // 8)
+        self.assertTrue(
+            all(
+                jump_hash(key, 11) == 10
+                for key in keys
+                if jump_hash(key, 10) != jump_hash(key, 11)
+            )
+        )
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/4"), (2, 4))
+
+        for value in ("4/4", "-1/4", "2", "a/b"):
+            with self.assertRaises(ValueError):
+                parse_shard(value)
+
+
+class TestSplitAndMerge(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_split_category(self):
+        links = sample_links()
+        indexer = Indexer(
+            {"sites": links}, os.path.join(self.tmp.name, "i.json")
+        )
+        directory = os.path.join(self.tmp.name, "shards")
+
+        paths = split_category(indexer, "sites", 3, directory, batch_size=64)
+
+        # Splitting twice gives the same files
+        first = [read(path) for path in paths]
+        split_category(indexer, "sites", 3, directory, batch_size=100)
+        self.assertEqual([read(path) for path in paths], first)
+
+        found = []
+
+        for shard, path in enumerate(paths):
+            with Indexer(index_file=path) as worker:
+                worker.deserialize_index_file()
+                shard_links = worker.local_index["sites"]
+
+            self.assertTrue(
+                all(shard_of(url, 3) == shard for url in shard_links)
+            )
+            found.extend(shard_links)
+
+        self.assertEqual(sorted(found), sorted(links))
+
+    def test_merge_frequency_vectors(self):
+        shards = [{"b": 1, "a": 2}, {"c": 5, "a": 1}, {}]
+        merged = merge_frequency_vectors(shards)
+
+        self.assertEqual(merged, {"a": 3, "b": 1, "c": 5})
+        self.assertEqual(list(merged), ["a", "b", "c"])
+        self.assertEqual(
+            json.dumps(merge_frequency_vectors(reversed(shards))),
+            json.dumps(merged),
+        )
+
+        paths = []
+
+        for i, vector in enumerate(shards):
+            paths.append(os.path.join(self.tmp.name, f"freq.{i}.json"))
+
+            with open(paths[-1], "w") as f:
+                json.dump(vector, f)
+
+        output = os.path.join(self.tmp.name, "freq.json")
+        merge_frequency_files(paths, output)
+
+        with open(output) as f:
+            self.assertEqual(json.load(f), merged)
+
+    def test_merge_page_stores(self):
+        sources = [
+            PageStore(os.path.join(self.tmp.name, f"shard-{i}"))
+            for i in range(3)
+        ]
+
+        def merged_files(name):
+            with PageStore(os.path.join(self.tmp.name, name)) as target:
+                self.assertEqual(merge_page_stores(sources, target), 4)
+                self.assertEqual(target["http://site1.test/"], b"page 1")
+                self.assertEqual(target.blob_count, 4)
+
+            directory = os.path.join(self.tmp.name, name)
+
+            return [
+                read(os.path.join(directory, file))
+                for file in sorted(os.listdir(directory))
+            ]
+
+        try:
+            for i, store in enumerate(sources):
+                store.put(f"http://site{i}.test/", f"page {i}".encode())
+                store.put("http://shared.test/", b"same")
+
+            self.assertEqual(merged_files("a"), merged_files("b"))
+        finally:
+            for store in sources:
+                store.close()
+
+    def test_sharded_crawl(self):
+        with StandInServer() as server:
+            links = [server.url(f"/page/{i}") for i in range(6)]
+            indexer = Indexer(
+                {"pages": links}, os.path.join(self.tmp.name, "i.json")
+            )
+
+            # The stand-in server is a single host, so one shard has it all
+            fetched = [
+                [
+                    url
+                    for url, html in iter_indexer_query_by_category(
+                        indexer, "pages", delay=0, shard=(shard, 2)
+                    )
+                ]
+                for shard in range(2)
+            ]
+
+        self.assertEqual(sorted(fetched[0] + fetched[1]), sorted(links))
+        self.assertIn([], fetched)
+
+
+if __name__ == "__main__":
+    unittest.main()
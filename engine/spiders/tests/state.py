@@ -0,0 +1,146 @@
+import os
+import tempfile
+import unittest
+
+from ..corpus.counts import CountStore
+from ..corpus.fetcher import iter_changed_by_category
+from ..corpus.indexer import Indexer
+from ..corpus.state import CrawlState
+from ..corpus.store import PageStore
+from ..politeness import polite_bulk_query
+from .server import StandInServer, page_body
+
+
+class TestCrawlState(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "state.sqlite3")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def crawl(self, state, urls, category="news", revisit=3600):
+        # What an incremental run does, counting a page's length
+        due = state.due(urls, category, revisit)
+        loaded = polite_bulk_query(
+            due, delay=0, respect_robots=False, cache=state
+        )
+        changed = [
+            url
+            for url, body in loaded.items()
+            if body is not None and state.changed(url, category)
+        ]
+
+        for url in changed:
+            state.count(url, category, {"pages": 1, url: len(loaded[url])})
+
+        return due, changed
+
+    def test_incremental(self):
+        with StandInServer() as server:
+            urls = [server.url(f"/page/{i}") for i in range(5)]
+            state = CrawlState(self.path)
+
+            due, changed = self.crawl(state, urls[:3])
+            self.assertEqual((due, changed), (urls[:3], urls[:3]))
+            self.assertEqual(state.get(urls[0]).status, 200)
+            self.assertEqual(state.totals("news")["pages"], 3)
+
+            # Only the new urls are fetched on the next run
+            requests = server.requests
+            due, changed = self.crawl(state, urls)
+            self.assertEqual((due, changed), (urls[3:], urls[3:]))
+            self.assertEqual(server.requests, requests + 2)
+
+            # Past the revisit interval everything is fetched again,
+            # but only the page whose content moved is recounted
+            server.routes["/page/1"] = b"<p>rewritten</p>"
+            due, changed = self.crawl(state, urls, revisit=0)
+            self.assertEqual((len(due), changed), (5, [urls[1]]))
+
+            totals = state.totals("news")
+            self.assertEqual(totals["pages"], 5)
+            self.assertEqual(totals[urls[1]], len(b"<p>rewritten</p>"))
+            self.assertEqual(totals[urls[2]], len(page_body("/page/2")))
+
+            # Pages counted in one category still need counting in another
+            self.assertEqual(state.due(urls, "other"), urls)
+
+    def test_revalidates_and_keeps_failures_due(self):
+        with StandInServer() as server:
+            url = server.url("/page/0")
+            missing = server.url("/status/404")
+
+            with PageStore(os.path.join(self.tmp.name, "pages")) as store:
+                state = CrawlState(self.path, pages=store)
+
+                for body in polite_bulk_query(
+                    [url, missing], delay=0, respect_robots=False, cache=state
+                ).items():
+                    if body[1] is not None:
+                        store.put(*body)
+
+                self.assertEqual(state.get(missing).status, 404)
+                self.assertIsNone(state.get(missing).fetched)
+
+                # The stored ETag turns the refetch into a 304
+                loaded = polite_bulk_query(
+                    [url], delay=0, respect_robots=False, cache=state
+                )
+                self.assertEqual(loaded[url], page_body("/page/0"))
+                self.assertEqual((state.fetched, state.not_modified), (1, 1))
+                self.assertEqual(state.get(url).status, 304)
+
+                state.count(url, "news", {"a": 1})
+                self.assertEqual(state.due([missing, url], "news"), [missing])
+
+    def test_uncounts_removed_and_gone_pages(self):
+        with StandInServer() as server:
+            urls = [server.url(f"/page/{i}") for i in range(3)]
+            path = os.path.join(self.tmp.name, "index.json")
+            state = CrawlState(self.path)
+
+            def recrawl(links):
+                indexer = Indexer({"news": links}, path)
+                pages = iter_changed_by_category(
+                    indexer, "news", state, revisit=0, delay=0
+                )
+
+                for url, html in pages:
+                    state.count(url, "news", {"pages": 1, url: 1})
+
+                return state.totals("news")
+
+            self.assertEqual(recrawl(urls)["pages"], 3)
+
+            # The first page leaves the category and the last is gone
+            server.routes["/page/2"] = 404
+            self.assertEqual(recrawl(urls[1:]), {"pages": 1, urls[1]: 1})
+            self.assertEqual(state.removed, 2)
+
+            # A page which is only busy keeps its counts
+            server.routes["/page/1"] = 429
+            self.assertEqual(recrawl(urls[1:]), {"pages": 1, urls[1]: 1})
+            self.assertEqual(state.due(urls, "news"), [urls[0], urls[2]])
+
+    def test_counts_live_in_a_count_store(self):
+        with StandInServer() as server:
+            urls = [server.url(f"/page/{i}") for i in range(3)]
+            counts = CountStore(os.path.join(self.tmp.name, "counts.sqlite3"))
+            state = CrawlState(self.path, counts=counts)
+
+            self.crawl(state, urls)
+
+            # The state's counts are the count store's, keyed by body
+            self.assertEqual(state.totals("news"), counts.totals("news"))
+            self.assertEqual(list(counts.members("news")), urls)
+            self.assertEqual(
+                counts.members("news")[urls[0]], state.get(urls[0]).sha256
+            )
+            self.assertEqual(
+                state.counted(urls[0]),
+                {"pages": 1, urls[0]: len(page_body("/page/0"))},
+            )
+
+            state.uncount(urls[0], "news")
+            self.assertEqual(counts.totals("news")["pages"], 2)
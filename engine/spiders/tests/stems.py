@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+from nltk.stem import SnowballStemmer
+
+from ..corpus.stems import StemCache
+
+
+class TestStemCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "stems.sqlite3")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_stems_each_type_once(self):
+        stemmer = SnowballStemmer("english")
+        words = ["running", "runs", "The", "generously", "running"]
+
+        with StemCache(self.path) as stems:
+            self.assertEqual(
+                stems.stem_all(words), {w: stemmer.stem(w) for w in words}
+            )
+            self.assertEqual(stems.stemmed, 4)
+
+            stems.stem_all(words)
+            self.assertEqual(stems.stemmed, 4)
+
+        # A later run reads them back instead of stemming again
+        with StemCache(self.path) as stems:
+            self.assertEqual(stems.stem("generously"), "generous")
+            self.assertEqual(
+                stems.stem_all(["runs", "jumped"])["jumped"], "jump"
+            )
+            self.assertEqual(stems.stemmed, 1)
+
+    def test_languages_kept_apart(self):
+        with StemCache(self.path) as stems:
+            stems.stem("nationalement")
+
+        with StemCache(self.path, "french") as stems:
+            self.assertEqual(
+                stems.stem("nationalement"),
+                SnowballStemmer("french").stem("nationalement"),
+            )
+            self.assertEqual(stems.stemmed, 1)
+
+    def test_memory_only(self):
+        stems = StemCache(None)
+
+        self.assertEqual(
+            stems.stem_all(iter(["cats", "cats"])), {"cats": "cat"}
+        )
+        self.assertEqual(len(stems), 1)
+        stems.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
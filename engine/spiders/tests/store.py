@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+from ..corpus.store import PageStore
+
+
+class TestPageStore(unittest.TestCase):
+    def test_put_and_read_back(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with PageStore(directory, segment_size=256) as store:
+                for i in range(20):
+                    store.put(f"https://a.com/{i}", b"<p>page %d</p>" % i)
+
+                # Identical bodies share one blob
+                store.put("https://a.com/copy", b"<p>page 3</p>")
+
+                self.assertEqual(len(store), 21)
+                self.assertEqual(store.blob_count, 20)
+
+            reopened = PageStore(directory)
+
+            self.assertEqual(reopened["https://a.com/copy"], b"<p>page 3</p>")
+            self.assertEqual(
+                dict(reopened.items()),
+                {
+                    **{
+                        f"https://a.com/{i}": b"<p>page %d</p>" % i
+                        for i in range(20)
+                    },
+                    "https://a.com/copy": b"<p>page 3</p>",
+                },
+            )
+            reopened.close()
+
+    def test_torn_index_line(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with PageStore(directory) as store:
+                store.put("https://a.com/1", b"one")
+
+            # A crash half way through writing the next entry
+            with open(os.path.join(directory, "index.jsonl"), "a") as f:
+                f.write('{"url": "https://a.com/2", "sha')
+
+            with PageStore(directory) as store:
+                self.assertEqual(list(store), ["https://a.com/1"])
+                store.put("https://a.com/3", b"three")
+
+            # The entry after the torn one was not glued onto it
+            with PageStore(directory) as store:
+                self.assertEqual(
+                    list(store), ["https://a.com/1", "https://a.com/3"]
+                )
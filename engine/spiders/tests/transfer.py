@@ -0,0 +1,97 @@
+import asyncio
+import gzip
+import unittest
+import zlib
+
+from ..aio import AsyncFetcher, async_bulk_query
+from ..base import read
+from ..transfer import (
+    BodyReader,
+    BodyTooLarge,
+    UnsupportedContentType,
+    check_content_type,
+)
+from .server import StandInServer
+
+PAGE = b"<html><body>" + b"<p>hearth</p>" * 5000 + b"</body></html>"
+
+
+class TestBodyReader(unittest.TestCase):
+    def decode(self, data, encoding, max_body=None):
+        body = BodyReader("u", {"content-encoding": encoding}, max_body)
+
+        for i in range(0, len(data), 1000):
+            body.feed(data[i : i + 1000])
+
+        return body.finish()
+
+    def test_encodings(self):
+        raw = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        raw_deflate = raw.compress(PAGE) + raw.flush()
+
+        self.assertEqual(self.decode(PAGE, None), PAGE)
+        self.assertEqual(self.decode(gzip.compress(PAGE), "gzip"), PAGE)
+        self.assertEqual(self.decode(zlib.compress(PAGE), "deflate"), PAGE)
+        self.assertEqual(self.decode(raw_deflate, "deflate"), PAGE)
+
+    def test_size_caps(self):
+        # A megabyte of zeros compresses to about a kilobyte
+        bomb = gzip.compress(bytes(1024 * 1024))
+
+        with self.assertRaises(BodyTooLarge):
+            self.decode(bomb, "gzip", max_body=64 * 1024)
+
+        with self.assertRaises(BodyTooLarge):
+            BodyReader("u", {"content-length": "2048"}, max_body=1024)
+
+    def test_content_types(self):
+        check_content_type("u", {"content-type": "text/html; charset=utf-8"})
+        check_content_type("u", {})
+        check_content_type("u", {"content-type": "image/png"}, None)
+
+        with self.assertRaises(UnsupportedContentType):
+            check_content_type("u", {"content-type": "application/pdf"})
+
+
+class TestTransfer(unittest.TestCase):
+    def test_sync_read(self):
+        with StandInServer() as server:
+            server.routes["/big"] = PAGE
+
+            self.assertEqual(read(server.url("/big")), PAGE)
+            self.assertLess(server.sent, len(PAGE) / 10)
+
+            pdf = server.url("/blob/100000?type=application/pdf")
+
+            with self.assertRaises(UnsupportedContentType):
+                read(pdf)
+
+            self.assertEqual(len(read(pdf, content_types=None)), 100000)
+
+            with self.assertRaises(BodyTooLarge):
+                read(server.url("/big"), max_body=1024)
+
+    def test_async_fetch(self):
+        with StandInServer() as server:
+            server.routes["/big"] = PAGE
+            big = server.url("/big")
+            image = server.url("/blob/100000?type=image/png")
+            large = server.url("/blob/100000?type=text/html")
+
+            loaded = async_bulk_query([big, image, large], max_body=80000)
+
+            self.assertEqual(loaded, {big: PAGE, image: None, large: None})
+
+    def test_async_rejections(self):
+        async def _fetch(url, **kwargs):
+            async with AsyncFetcher(**kwargs) as fetcher:
+                return await fetcher.fetch(url)
+
+        with StandInServer() as server:
+            image = server.url("/blob/1000?type=image/png")
+
+            with self.assertRaises(UnsupportedContentType):
+                asyncio.run(_fetch(image))
+
+            body = asyncio.run(_fetch(image, content_types=None))
+            self.assertEqual(len(body), 1000)
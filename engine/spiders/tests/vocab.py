@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+import unittest
+
+from ..corpus import vocab
+from ..corpus.vocab import (
+    Vocab,
+    encode_vocab,
+    json_to_vocab,
+    vocab_to_json,
+    write_vocab,
+)
+
+FREQUENCY_VECTOR = {"the": 40, "cat": 7, "naïve": 7, "東京": 3, "a": 40, "": 1}
+
+
+@unittest.skipIf(vocab.np is None, "numpy is not installed")
+class TestVocab(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "freq.vocab")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_ranked_by_frequency(self):
+        write_vocab(FREQUENCY_VECTOR, self.path)
+        words = Vocab(self.path)
+
+        self.assertEqual(list(words), ["a", "the", "cat", "naïve", "東京", ""])
+        self.assertEqual(words.counts.tolist(), [40, 40, 7, 7, 3, 1])
+        self.assertEqual(words[4], "東京")
+        self.assertEqual(words[-2], "東京")
+        self.assertEqual(words.frequency(3), 7)
+        self.assertEqual(words.index("naïve"), 3)
+        self.assertNotIn("dog", words)
+        self.assertEqual(words.to_dict(), FREQUENCY_VECTOR)
+
+        with self.assertRaises(IndexError):
+            words[6]
+
+    def test_arrays_are_mapped(self):
+        write_vocab(FREQUENCY_VECTOR, self.path)
+        words = Vocab(self.path)
+
+        for array in (words.offsets, words.counts, words.strings):
+            self.assertIsInstance(array, vocab.np.memmap)
+            self.assertFalse(array.flags.writeable)
+
+    def test_json_round_trip(self):
+        json_path = os.path.join(self.tmp.name, "freq.json")
+        back_path = os.path.join(self.tmp.name, "back.json")
+
+        with open(json_path, "w") as f:
+            json.dump(FREQUENCY_VECTOR, f)
+
+        json_to_vocab(json_path, self.path)
+        vocab_to_json(self.path, back_path)
+
+        with open(back_path) as f:
+            self.assertEqual(json.load(f), FREQUENCY_VECTOR)
+
+        # The same counts always give the same file
+        reordered = dict(reversed(list(FREQUENCY_VECTOR.items())))
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), encode_vocab(reordered))
+
+    def test_empty_and_bad_files(self):
+        write_vocab({}, self.path)
+        self.assertEqual(len(Vocab(self.path)), 0)
+        self.assertEqual(Vocab(self.path).to_dict(), {})
+
+        data = encode_vocab(FREQUENCY_VECTOR)
+
+        with open(self.path, "wb") as f:
+            f.write(data[:-3])
+
+        with self.assertRaises(IOError):
+            Vocab(self.path)
+
+        with open(self.path, "wb") as f:
+            f.write(b'{"the": 40}')
+
+        with self.assertRaises(IOError):
+            Vocab(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
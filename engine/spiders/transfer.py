@@ -0,0 +1,297 @@
+"""
+Transfer contains the body reading shared by the fetchers, which
+asks for compressed transfer, decompresses bodies as they stream in
+and gives up early on bodies we would only throw away
+"""
+
+import urllib.error
+import urllib.request
+import zlib
+from typing import Dict, FrozenSet, Mapping, Optional
+
+from .metrics import RequestTiming
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional, we only offer it when it is installed
+    brotli = None
+
+ENCODINGS = (
+    ("gzip", "deflate", "br") if brotli is not None else ("gzip", "deflate")
+)
+ACCEPT_ENCODING = ", ".join(ENCODINGS)
+
+# The content types worth downloading, None anywhere one is asked
+# for accepts any
+HTML_CONTENT_TYPES = frozenset({"text/html", "application/xhtml+xml"})
+
+# The largest decompressed body read before giving up on a page
+DEFAULT_MAX_BODY = 10 * 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+
+class BodyRejected(urllib.error.URLError):
+    """
+    Raised instead of reading a body we have no use for
+    """
+
+    def __init__(self, url: str, reason: str):
+        super().__init__(reason)
+        self.url = url
+
+
+class UnsupportedContentType(BodyRejected):
+    """
+    Raised for a response whose content type was not asked for
+    """
+
+
+class BodyTooLarge(BodyRejected):
+    """
+    Raised once a body grows past the size cap
+    """
+
+
+class _Identity:
+    def decompress(self, data: bytes, limit: int) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class _Inflate:
+    # Reads gzip and zlib wrapped deflate alike. Some servers send
+    # 'deflate' without the zlib wrapper, so for deflate we fall back
+    # to raw deflate when the first piece does not read as wrapped
+    def __init__(self, raw_fallback: bool = False):
+        self._inflater = zlib.decompressobj(32 + zlib.MAX_WBITS)
+        self._raw_fallback = raw_fallback
+
+    def decompress(self, data: bytes, limit: int) -> bytes:
+        if self._raw_fallback and data:
+            self._raw_fallback = False
+
+            try:
+                return self._inflater.decompress(data, limit)
+            except zlib.error:
+                self._inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+
+        return self._inflater.decompress(data, limit)
+
+    def flush(self) -> bytes:
+        return self._inflater.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self._decompressor = brotli.Decompressor()
+
+    def decompress(self, data: bytes, limit: int) -> bytes:
+        # The brotli bindings take no output limit, so a hostile body
+        # can only be cut off one piece late
+        return self._decompressor.process(data)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def _decoder(encoding: Optional[str]):
+    encoding = (encoding or "identity").strip().lower()
+
+    if encoding == "identity":
+        return _Identity()
+
+    if encoding in ("gzip", "x-gzip"):
+        return _Inflate()
+
+    if encoding == "deflate":
+        return _Inflate(raw_fallback=True)
+
+    if encoding == "br" and brotli is not None:
+        return _Brotli()
+
+    return None
+
+
+def accept_encoding(headers: Dict[str, str] = None) -> Dict[str, str]:
+    """
+    The request headers with the encodings we can decompress offered,
+    unless the caller already picked some
+    """
+    headers = dict(headers or {})
+    headers.setdefault("Accept-Encoding", ACCEPT_ENCODING)
+
+    return headers
+
+
+def content_type(headers: Mapping[str, str]) -> Optional[str]:
+    """
+    The lower case media type of a response, without parameters
+    """
+    value = headers.get("content-type")
+
+    if not value:
+        return None
+
+    return value.split(";", 1)[0].strip().lower()
+
+
+def check_content_type(
+    url: str,
+    headers: Mapping[str, str],
+    content_types: Optional[FrozenSet[str]] = HTML_CONTENT_TYPES,
+) -> None:
+    """
+    Raises
+    ------
+    UnsupportedContentType
+        When the response declares a content type outside of
+        content_types. Responses without one are let through
+    """
+    media_type = content_type(headers)
+
+    if content_types is None or media_type is None:
+        return
+
+    if media_type not in content_types:
+        raise UnsupportedContentType(
+            url, f"unwanted content type {media_type}"
+        )
+
+
+class BodyReader:
+    """
+    The body reader takes a response body piece by piece as it comes
+    off the socket, decompressing it by its Content-Encoding and
+    giving up as soon as it grows past max_body
+
+    Parameters
+    ----------
+    url : str
+        The url the body is read from
+    headers : Mapping[str, str]
+        The response headers, looked up by lower case name
+    max_body : int, optional
+        The most decompressed bytes read, None to read any size
+    """
+
+    def __init__(
+        self,
+        url: str,
+        headers: Mapping[str, str],
+        max_body: Optional[int] = DEFAULT_MAX_BODY,
+    ):
+        self.url = url
+        self.max_body = max_body
+        self.wire_bytes = 0
+        self.size = 0
+
+        self._parts = []
+        self._decoder = _decoder(headers.get("content-encoding"))
+
+        if self._decoder is None:
+            raise BodyRejected(
+                url, f"unsupported encoding {headers.get('content-encoding')}"
+            )
+
+        # Decompressing never shrinks a body, so a declared length past
+        # the cap rules it out before the first byte
+        length = headers.get("content-length")
+
+        if max_body is not None and length and length.isdigit():
+            if int(length) > max_body:
+                raise BodyTooLarge(url, f"body of {length} bytes is too large")
+
+    def feed(self, data: bytes) -> None:
+        self.wire_bytes += len(data)
+
+        if self.max_body is None:
+            self._keep(self._decoder.decompress(data, 0))
+            return
+
+        # Asking for one byte past what is left shows an overflow
+        # without inflating the rest of a compression bomb
+        self._keep(
+            self._decoder.decompress(data, self.max_body - self.size + 1)
+        )
+
+    def finish(self) -> bytes:
+        self._keep(self._decoder.flush())
+
+        return b"".join(self._parts)
+
+    def _keep(self, data: bytes) -> None:
+        self.size += len(data)
+
+        if self.max_body is not None and self.size > self.max_body:
+            raise BodyTooLarge(
+                self.url, f"body is larger than {self.max_body} bytes"
+            )
+
+        if data:
+            self._parts.append(data)
+
+
+def open_url(url: str, timeout: int = 30, headers: Dict[str, str] = None):
+    """
+    Opens a url with urllib, offering compressed transfer
+    """
+    request = urllib.request.Request(url, headers=accept_encoding(headers))
+
+    return urllib.request.urlopen(request, timeout=timeout)
+
+
+def read_response(
+    response,
+    max_body: Optional[int] = DEFAULT_MAX_BODY,
+    content_types: Optional[FrozenSet[str]] = HTML_CONTENT_TYPES,
+    timing: RequestTiming = None,
+) -> bytes:
+    """
+    Streams the body of an open urllib response, closing it early
+    when the body turns out to be unwanted or too large
+
+    Parameters
+    ----------
+    response : http.client.HTTPResponse
+        The response returned by open_url
+    max_body : int, optional
+        The most decompressed bytes read, None to read any size
+    content_types : FrozenSet[str], optional
+        The media types accepted, None to accept any
+    timing : RequestTiming, optional
+        Given the bytes read off the wire, before decompressing
+
+    Returns
+    -------
+    bytes
+        The decompressed body
+
+    Raises
+    ------
+    BodyRejected
+        When the content type, encoding or size rule the body out
+    """
+    url = response.geturl()
+    body = None
+
+    try:
+        check_content_type(url, response.headers, content_types)
+        body = BodyReader(url, response.headers, max_body)
+
+        while True:
+            data = response.read(CHUNK_SIZE)
+
+            if not data:
+                return body.finish()
+
+            body.feed(data)
+    finally:
+        response.close()
+
+        # A body dropped part way still cost what was read of it
+        if timing is not None and body is not None:
+            timing.bytes = body.wire_bytes
@@ -1,3 +1,6 @@
+import os
+import tempfile
+import urllib.parse
 from typing import Iterable
 
 
@@ -21,3 +24,110 @@ def any_ignore_case(iterable: Iterable[str], s: str) -> bool:
             return True
 
     return False
+
+
+def host_key(url: str) -> str:
+    """
+    The scheme and host a url belongs to, which is also the
+    scope of a robots.txt file
+
+    Parameters
+    ----------
+    url : str
+        The url to key
+
+    Returns
+    -------
+    str
+        The lower case 'scheme://host[:port]' of the url
+    """
+    parts = urllib.parse.urlsplit(url)
+
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """
+    Replaces the file at path with data, so readers and crashes only
+    ever see the old file or the whole new one
+
+    Parameters
+    ----------
+    path : str
+        The file to write
+    data : bytes
+        Its new contents
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(
+        prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory
+    )
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+    fsync_directory(directory)
+
+
+def fsync_directory(directory: str) -> None:
+    # Makes a rename in directory durable, where the platform allows
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def truncate_torn_line(path: str, block: int = 64 * 1024) -> None:
+    """
+    Cuts a line based file back to its last complete line, so the
+    next append starts on a line of its own instead of gluing onto
+    one a crash tore
+
+    Parameters
+    ----------
+    path : str
+        The file to cut
+    block : int
+        Bytes read at a time while looking back for a newline
+    """
+    with open(path, "r+b") as f:
+        end = f.seek(0, os.SEEK_END)
+
+        if end == 0:
+            return
+
+        f.seek(end - 1)
+
+        if f.read(1) == b"\n":
+            return
+
+        position = end
+
+        while position > 0:
+            start = max(0, position - block)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+
+            if newline != -1:
+                f.truncate(start + newline + 1)
+                return
+
+            position = start
+
+        f.truncate(0)
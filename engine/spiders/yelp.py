@@ -8,8 +8,10 @@ import urllib.request
 from typing import List, Dict
 
 from bs4 import BeautifulSoup
-from base import (
-    get_robots,
+from .extract import extract_links
+from .frontier import Frontier
+from .robots import robots_cache
+from .base import (
     read,
     serial_bulk_query,
     concurrent_batch_process_page_data,
@@ -20,7 +22,11 @@ GENERAL_SEARCH_URL = f"{BASE_URL}/search?"
 
 
 def biz_query(
-    phrase: str, location: str, category: str = None, with_root: bool = True
+    phrase: str,
+    location: str,
+    category: str = None,
+    with_root: bool = True,
+    frontier: Frontier = None,
 ) -> List[str]:
     """
     Biz Query queries yelp's biz search engine and scrapes the
@@ -35,6 +41,10 @@ def biz_query(
         The location that the query phrase should be localized to
     category : str, optional
         Apply a category to the query
+    with_root : bool
+        Make the links absolute
+    frontier : Frontier, optional
+        Drops links already found by earlier queries sharing it
 
     Returns
     -------
@@ -42,7 +52,7 @@ def biz_query(
         The list of sub-businesses of a given query and area
     """
     # Get robots.txt to validate requests
-    robots = get_robots("https://www.yelp.com/robots.txt")
+    robots = robots_cache.get("https://www.yelp.com/robots.txt")
 
     if not robots.can_fetch("Googlebot", GENERAL_SEARCH_URL):
         raise LookupError("Url is restricted from scraping")
@@ -64,21 +74,16 @@ def biz_query(
     # Return results
     html = read(compiled_url)
 
-    # Parse the results
-    parsed = BeautifulSoup(html, features="html.parser")
-
     # Find all <a /> tags where href.startswith('/biz')
-    biz_links = [
-        link.attrs.get("href")
-        for link in parsed.find_all("a")
-        if link.attrs.get("href", None)
-        and link.attrs.get("href").startswith("/biz")
-    ]
+    biz_links = extract_links(html, prefixes=["/biz"])
 
     if with_root:
         biz_links = [BASE_URL + link for link in biz_links]
 
-    return biz_links
+    # Canonical links only, a business shows up on many searches
+    frontier = frontier if frontier is not None else Frontier()
+
+    return frontier.add_all(biz_links)
 
 
 def read_reviews(parsed: BeautifulSoup) -> Dict[str, str]:
@@ -3,7 +3,7 @@ Word2Vec is an embedding model for pre trained embeddings
 for text processing purposes
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, Sequence
 
 import numpy as np
 import tensorflow as tf
@@ -127,6 +127,23 @@ class Word2Vec:
         self.sorted_index = sorted_index
         self.token_to_index = token_to_index
 
+    def make_datasets_from_vocab(self, vocab: Sequence):
+        """
+        Takes the vocabulary from a vocab file instead of a dict. Its
+        tokens are already ranked by frequency, so a word's index is
+        its rank and the reverse lookup reads straight from the file
+
+        Parameters
+        ----------
+        vocab : engine.spiders.corpus.vocab.Vocab
+            The opened vocab file
+        """
+        self.vocab_size = len(vocab)
+
+        # Vocab is a sequence of tokens, so it maps index to word as is
+        self.reversed_word_index = vocab
+        self.vocab = vocab
+
     def word2vec(self):
         """
         word2vec is our model which implements the word2vec architecture
@@ -147,7 +164,7 @@ class Word2Vec:
         # Legend:
         # 1 - True context
         # 0 - Negative sample
-        word_indexes = list(self.token_to_index.values())
+        word_indexes = list(range(self.vocab_size))
         self.couples, self.labels = sequence.skipgrams(
             word_indexes,
             self.vocab_size,